@@ -8,428 +8,3260 @@
 import argparse
 import os
 import configparser
+import csv
 import tempfile
 import multiprocessing
+import queue
 import collections
+import contextlib
 import datetime
+import fnmatch
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import math
+import re
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
 
 # ----------region multiprocessing----------
 # code provided by chen-gang (@chen-gangh@hpe.com) modified by Arvin (@zhen-peng.yang@hpe.com)
-Result = collections.namedtuple("Result", "schema_name table_name success failure time_in_minutes")
-Summary = collections.namedtuple("Summary", "todo success failure total_time_in_minutes cancelled")
+Result = collections.namedtuple("Result", "job_id schema_name table_name check_type success failure time_in_minutes "
+                                           "queue_wait_seconds build_seconds execute_seconds parse_seconds watermark "
+                                           "violations queries report trace")
+Summary = collections.namedtuple("Summary", "todo success failure total_time_in_minutes cancelled results")
+Constraint = collections.namedtuple("Constraint",
+                                    "constraint_type constraint_name reference_table_name reference_keys "
+                                    "reference_column_name")
+# mode: 'single' checks constraints[0] alone, 'fused' checks all PK/UK/NULL constraints of the table in one scan,
+# 'fk_batch' checks all FK constraints pointing at the same reference table in one anti join, 'watermark' checks
+# nothing and reads the new watermark of the table once for all its jobs in the incremental mode.
+# watermark: check only rows loaded after it, None for a full check
+# new_watermark: the watermark the check goes up to, read by the 'watermark' job of the table
+Job = collections.namedtuple("Job", "schema_name table_name param_src_sys_cd mode constraints watermark "
+                                    "new_watermark")
+# watermark_column: column the incremental mode tracks, None to always check in full
+# sample_size: the max number of issue rows shown per constraint
+# prescreen: 'hll' or 'stats' to skip the exact PK/UK check when the distinct key estimate shows no duplicate,
+# None to always run it. prescreen_tolerance: how far below the row count an approximate estimate may be and still
+# pass, an exact distinct count must reach the row count
+# job_timeout: seconds a job may run before its query is killed, None for no limit
+# retries, retry_backoff: how often a failed job is run again, waiting retry_backoff seconds doubled every time
+# trace: record span events of every job and query, sent back in Result.trace
+CheckOptions = collections.namedtuple("CheckOptions", "fuse batch_fk mapjoin_rows watermark_column sample_size "
+                                                      "prescreen prescreen_tolerance job_timeout retries "
+                                                      "retry_backoff trace")
+DEFAULT_CHECK_OPTIONS = CheckOptions(False, False, 0, None, 10, None, 0.0, None, 0, 30, False)
+# seconds scale() waits for a result before it looks for dead or hung workers
+WORKER_POLL_SECONDS = 10
+# seconds a job may run by default, a hung hive query is killed rather than stalling the run forever
+DEFAULT_JOB_TIMEOUT_SECONDS = 4 * 3600
+# seconds past job_timeout after which scale() terminates a worker that did not give up the job itself
+WORKER_KILL_GRACE_SECONDS = 120
+# seconds between two redraws of the progress line on a terminal, and between two progress lines in a log
+PROGRESS_REFRESH_SECONDS = 1
+PROGRESS_LOG_SECONDS = 60
 
 
-def worker(jobs):
+def get_check_type(job):
+    """ Constraint type a job is reported under, 'fused' for the fused PK/UK/NULL check, 'watermark' for the read of
+        the new watermark
+    """
+    if job.mode in ('fused', 'watermark'):
+        return job.mode
+    return job.constraints[0].constraint_type
+
+
+def run_job(job, executor, options, stopwatch, list_violation=None):
+    """
+    Run the checks of a job, return the new watermark of the checked constraints, None if not incremental. The issue
+    rows found are appended to list_violation as Violation if it is given
+    """
+    if job.mode == 'watermark':
+        with stopwatch.stage('execute'):
+            return get_new_watermark(executor, job.schema_name, job.table_name, job.param_src_sys_cd,
+                                     options.watermark_column, job.watermark)
+    watermark_range = None
+    new_watermark = job.new_watermark
+    if options.watermark_column is not None and job.watermark is not None:
+        if new_watermark is None:
+            for constraint in job.constraints:
+                print('No new data in {0}.{1} since {2}={3}, skipping {4}...'.format(
+                    job.schema_name, job.table_name, options.watermark_column, job.watermark,
+                    constraint.constraint_name))
+            return job.watermark
+        watermark_range = (options.watermark_column, job.watermark, new_watermark)
+
+    if options.prescreen is not None and watermark_range is None:
+        list_candidate = [constraint for constraint in job.constraints if constraint.constraint_type in ('p', 'u')]
+        if list_candidate:
+            with stopwatch.stage('execute'):
+                set_clean = prescreen(job.schema_name, job.table_name, job.param_src_sys_cd, list_candidate,
+                                      executor, options.prescreen, options.prescreen_tolerance)
+            list_constraint = [constraint for constraint in job.constraints
+                               if constraint.constraint_name not in set_clean]
+            if list_violation is not None:
+                list_violation.extend(get_clean_record(job.schema_name, job.table_name, constraint)
+                                      for constraint in job.constraints if constraint.constraint_name in set_clean)
+            if not list_constraint:
+                return new_watermark
+            job = job._replace(constraints=list_constraint)
+
+    if job.mode == 'fused':
+        analyze_fused(job.schema_name, job.table_name, job.param_src_sys_cd, job.constraints, executor, stopwatch,
+                      options.sample_size, list_violation, watermark_range)
+    elif job.mode == 'fk_batch':
+        analyze_fk_batch(job.schema_name, job.table_name, job.param_src_sys_cd, job.constraints,
+                         executor, options.mapjoin_rows, stopwatch, options.sample_size, list_violation,
+                         watermark_range)
+    else:
+        constraint = job.constraints[0]
+        analyze(job.schema_name, job.table_name, job.param_src_sys_cd, constraint.constraint_type,
+                constraint.constraint_name, constraint.reference_table_name,
+                constraint.reference_keys, constraint.reference_column_name, executor, stopwatch, watermark_range,
+                options.sample_size, list_violation)
+    return new_watermark
+
+
+def worker(jobs, results, executor_config, options, current=None):
+    # current is shared memory holding (job id, start time, process group of the running hive CLI) of the job
+    # running, so scale() knows which job a dead worker took and which queries to kill, a message on results could be
+    # lost with the process
+    # what a job prints is captured and sent back in its Result, scale() prints the reports of all jobs in order
+    # the session outlives the jobs, so JVM/session startup is paid once per worker process
+    tracer = Tracer('worker', options.trace)
+    session_pool = SessionPool(executor_config, tracer=tracer)
     while True:
+        item = jobs.get()
+        if item is None:
+            break
+        job_id, job, scheduled_time = item
+        start_time = time.time()
+        if current is not None:
+            current[0], current[1] = job_id, start_time
+        tracer.context = collections.OrderedDict([
+            ('job_id', job_id), ('table', '{0}.{1}'.format(job.schema_name, job.table_name)),
+            ('constraints', ','.join(c.constraint_name for c in job.constraints)), ('check_type', get_check_type(job))])
+        tracer.add('queue_wait', 'job', scheduled_time, start_time)
+        success = False
+        watermark = None
+        report = io.StringIO()
+        with contextlib.redirect_stdout(report):
+            for attempt in range(options.retries + 1):
+                if attempt > 0:
+                    with tracer.span('retry_backoff', 'job'):
+                        time.sleep(options.retry_backoff * 2 ** (attempt - 1))
+                    print('Retrying {0}.{1} {2}, attempt {3} of {4}...'.format(
+                        job.schema_name, job.table_name, ','.join(c.constraint_name for c in job.constraints),
+                        attempt + 1, options.retries + 1))
+                stopwatch = Stopwatch(tracer)
+                list_violation = []
+                num_queries = 0
+                try:
+                    with session_pool.session() as executor:
+                        executor.deadline = None if options.job_timeout is None else \
+                            time.time() + options.job_timeout
+                        executor.current = current
+                        queries_before = executor.num_queries
+                        try:
+                            watermark = run_job(job, TracedExecutor(executor, tracer) if tracer.enabled else executor,
+                                                options, stopwatch, list_violation)
+                        finally:
+                            num_queries = executor.num_queries - queries_before
+                    success = True
+                    break
+                except JobTimeoutException:
+                    # a query that ran out of time will run out of time again
+                    print('Error: {0}.{1} {2} timed out after {3} seconds'.format(
+                        job.schema_name, job.table_name, ','.join(c.constraint_name for c in job.constraints),
+                        options.job_timeout))
+                    break
+                except Exception as err:
+                    print('Error: {0}.{1} {2} failed: {3}'.format(
+                        job.schema_name, job.table_name, ','.join(c.constraint_name for c in job.constraints), err))
+        tracer.add('job', 'job', start_time, time.time(), success=success, attempts=attempt + 1,
+                   queries=num_queries, violations=count_issue_rows(list_violation),
+                   **{stage + '_seconds': seconds for stage, seconds in stopwatch.seconds.items()})
+        # MUST put a result to let scale() know the job is done, the worker stays alive for the next job
+        results.put(Result(job_id, job.schema_name, job.table_name, get_check_type(job), int(success),
+                           int(not success), (time.time() - start_time) / 60, start_time - scheduled_time,
+                           stopwatch.seconds['build'], stopwatch.seconds['execute'], stopwatch.seconds['parse'],
+                           watermark, list_violation, num_queries, report.getvalue(), tracer.drain()))
+        if current is not None:
+            current[0] = 0
+    session_pool.close()
+
+
+class JobScheduler(object):
+    """ Hand out the jobs of all tables to one worker pool. Jobs of the tables with the highest priority (largest
+        first) go first, and a table never has more than table_concurrency jobs in flight, so one huge fact table
+        can not take every worker.
+    """
+
+    def __init__(self, table_concurrency, dict_table_priority=None):
+        self.table_concurrency = table_concurrency
+        self.dict_table_priority = dict_table_priority or {}
+        self.heap = []
+        self.counter = itertools.count()
+        self.in_flight = collections.Counter()
+        self.dict_held = {}
+
+    def put(self, job):
+        if (job.schema_name, job.table_name) in self.dict_held:
+            self.dict_held[(job.schema_name, job.table_name)].append(job)
+            return
+        priority = self.dict_table_priority.get((job.schema_name, job.table_name), 0)
+        # counter keeps the jobs of one table in the order add_jobs() created them
+        heapq.heappush(self.heap, (-priority, next(self.counter), time.time(), job))
+
+    def hold(self, schema_name, table_name):
+        """ Keep the jobs of a table put from now on back until release() """
+        self.dict_held[(schema_name, table_name)] = []
+
+    def release(self, schema_name, table_name, update=None):
+        """ Schedule the jobs held back of a table, changed by update(job) if given """
+        for job in self.dict_held.pop((schema_name, table_name), []):
+            self.put(job if update is None else update(job))
+
+    def pending(self):
+        return len(self.heap) + sum(len(list_job) for list_job in self.dict_held.values())
+
+    def get(self):
+        """ Return (job, time the job was scheduled) of the next job whose table is below its concurrency cap,
+            (None, None) if there is none
+        """
+        list_skipped = []
+        job = scheduled_time = None
+        while self.heap:
+            item = heapq.heappop(self.heap)
+            if self.in_flight[(item[3].schema_name, item[3].table_name)] < self.table_concurrency:
+                scheduled_time, job = item[2], item[3]
+                break
+            list_skipped.append(item)
+        for item in list_skipped:
+            heapq.heappush(self.heap, item)
+        if job is not None:
+            self.in_flight[(job.schema_name, job.table_name)] += 1
+        return job, scheduled_time
+
+    def task_done(self, job):
+        self.in_flight[(job.schema_name, job.table_name)] -= 1
+
+
+class YarnQueueProbe(object):
+    """ Read the used capacity of a YARN queue from the ResourceManager REST API """
+
+    def __init__(self, resource_manager_url, queue_name='default', timeout=10):
+        self.url = '{0}/ws/v1/cluster/scheduler'.format(resource_manager_url.rstrip('/'))
+        self.queue_name = queue_name
+        self.timeout = timeout
+
+    def find_queue(self, queue):
+        if queue.get('queueName') == self.queue_name:
+            return queue
+        for child in (queue.get('queues') or {}).get('queue', []):
+            found = self.find_queue(child)
+            if found is not None:
+                return found
+        return None
+
+    def __call__(self):
+        """ Return used capacity of the queue, 1.0 means the queue is full, None if it can not be read """
         try:
-            (schema_name, table_name, param_src_sys_cd, constraint_type, constraint_name, reference_table_name,
-             reference_keys, reference_column_name) = jobs.get()
-            try:
-                analyze(schema_name, table_name, param_src_sys_cd, constraint_type, constraint_name,
-                        reference_table_name,
-                        reference_keys, reference_column_name)
-            except Exception as err:
-                raise err
-        finally:
-            # MUST call task_done() method to let jobs.join() know ALL jobs are done
-            jobs.task_done()
+            response = urllib.request.urlopen(self.url, timeout=self.timeout)
+            scheduler_info = json.loads(response.read().decode('utf-8'))['scheduler']['schedulerInfo']
+        except Exception as err:
+            print('Warning: can not read YARN queue utilization from {0} ({1})'.format(self.url, err))
+            return None
+        queue = self.find_queue(scheduler_info)
+        if queue is None or 'usedCapacity' not in queue:
+            return None
+        return queue['usedCapacity'] / 100.0
+
+
+class ConcurrencyController(object):
+    """ Decide how many jobs run in parallel, between min_concurrency and max_concurrency.
+        The cost of a job is its execute seconds per byte of the table, given the table sizes, so the jobs of all
+        tables are compared. It is compared with the lowest median cost of the last jobs of the same check type,
+        when it grows the cluster is contended and concurrency goes down, when it stays close and jobs are waiting
+        concurrency goes up. A table of unknown size is only compared with itself, by seconds per check type.
+        If a probe is given, e.g. YarnQueueProbe or any callable returning queue utilization 0.0-1.0, a busy queue
+        lowers and an idle queue raises concurrency as well. Without a latency or a queue signal concurrency stays
+        where it is.
+    """
+    SLOW_RATIO = 1.5
+    FAST_RATIO = 1.2
+    BUSY_UTILIZATION = 0.9
+    IDLE_UTILIZATION = 0.5
+    # the fixed cost of a job (JVM, compilation, containers) as the bytes it could scan meanwhile, so a small table
+    # is not slow per byte
+    OVERHEAD_BYTES = 1 << 30
+    # jobs the median cost is taken over
+    COST_WINDOW = 5
+
+    def __init__(self, min_concurrency, max_concurrency, initial=None, probe=None, probe_interval=60,
+                 dict_table_size=None):
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        if initial is None:
+            initial = 3
+        self.target = min(max(initial, self.min_concurrency), self.max_concurrency)
+        self.probe = probe
+        self.probe_interval = probe_interval
+        self.probe_time = None
+        self.utilization = None
+        self.dict_table_size = dict_table_size or {}
+        self.dict_cost = {}
+        self.dict_baseline = {}
+        self.latency_ratio = None
+        self.history = [(time.time(), self.target)]
+
+    def current(self):
+        return self.target
 
+    def observe(self, result, pending):
+        """
+        This function is to adjust concurrency after a job is done
+        :param result: Result of the job
+        :param pending: number of jobs waiting to be dispatched
+        :return: new concurrency
+        """
+        if self.min_concurrency == self.max_concurrency:
+            return self.target
+        if result.success and result.execute_seconds > 0:
+            table_size = self.dict_table_size.get((result.schema_name, result.table_name))
+            if table_size is not None:
+                key = result.check_type
+                cost = result.execute_seconds / (table_size + self.OVERHEAD_BYTES)
+            else:
+                key = (result.schema_name, result.table_name, result.check_type)
+                cost = result.execute_seconds
+            if key in self.dict_baseline:
+                ratio = cost / self.dict_baseline[key]
+                # exponentially weighted, so one slow query does not halve the pool
+                self.latency_ratio = ratio if self.latency_ratio is None else \
+                    0.7 * self.latency_ratio + 0.3 * ratio
+            list_cost = self.dict_cost.setdefault(key, collections.deque(maxlen=self.COST_WINDOW))
+            list_cost.append(cost)
+            median_cost = sorted(list_cost)[len(list_cost) // 2]
+            self.dict_baseline[key] = min(self.dict_baseline.get(key, median_cost), median_cost)
+        if self.probe is not None and (self.probe_time is None or time.time() - self.probe_time >= self.probe_interval):
+            self.probe_time = time.time()
+            self.utilization = self.probe()
+
+        target = self.target
+        if (self.latency_ratio is not None and self.latency_ratio > self.SLOW_RATIO) or \
+                (self.utilization is not None and self.utilization >= self.BUSY_UTILIZATION):
+            target = self.target * 3 // 4
+        elif pending > 0 and (self.latency_ratio is not None or self.utilization is not None) and \
+                (self.latency_ratio is None or self.latency_ratio < self.FAST_RATIO) and \
+                (self.utilization is None or self.utilization < self.IDLE_UTILIZATION):
+            target = self.target + 1
+        target = min(max(target, self.min_concurrency), self.max_concurrency)
+        if target != self.target:
+            self.target = target
+            self.history.append((time.time(), target))
+        return self.target
 
-def add_jobs(schema_name, table_name, param_src_sys_cd, list_constraint_definition, jobs):
+
+def parse_constraint_definition(list_constraint_definition):
+    """
+    This function is to parse constraint definitions looked up from radar.constraint_columns
+    :param list_constraint_definition: lines like 'f^FK1_ADDR^CTRY_CTY^CTRY_CTY_ID,SRC_SYS_CD^CTRY_CTY_ID,SRC_SYS_CD'
+    :return: list of Constraint
+    """
+    list_constraint = []
     for item in list_constraint_definition:
         if item != '':
             arr_itm = item.split('^')
-            constraint_type = arr_itm[0]
-            constraint_name = arr_itm[1]
-            reference_table_name = arr_itm[2]
-            reference_keys = arr_itm[3]
-            reference_column_name = arr_itm[4]
-            jobs.put((schema_name, table_name, param_src_sys_cd, constraint_type, constraint_name, reference_table_name,
-                      reference_keys, reference_column_name))
-    return len(list_constraint_definition)
+            list_constraint.append(Constraint(arr_itm[0], arr_itm[1], arr_itm[2], arr_itm[3], arr_itm[4]))
+    return list_constraint
+
+
+def add_jobs(schema_name, table_name, param_src_sys_cd, list_constraint_definition, jobs,
+             options=DEFAULT_CHECK_OPTIONS, dict_watermark=None):
+    list_job = []
+    dict_fused = collections.OrderedDict()
+    dict_fk_group = collections.OrderedDict()
+    dict_watermark = dict_watermark or {}
+    for constraint in parse_constraint_definition(list_constraint_definition):
+        # constraints checked before are checked for the new rows only, the ones checked up to the same watermark
+        # are still fused and batched
+        watermark = dict_watermark.get(constraint.constraint_name)
+        if options.fuse and constraint.constraint_type in FUSED_CONSTRAINT_TYPES:
+            dict_fused.setdefault(watermark, []).append(constraint)
+        elif options.batch_fk and constraint.constraint_type == 'f' \
+                and constraint.reference_table_name.upper() != table_name.upper():
+            dict_fk_group.setdefault((constraint.reference_table_name.upper(), watermark), []).append(constraint)
+        else:
+            list_job.append(Job(schema_name, table_name, param_src_sys_cd, 'single', [constraint], watermark, None))
+    for (_, watermark), list_fk in dict_fk_group.items():
+        mode = 'fk_batch' if len(list_fk) > 1 else 'single'
+        list_job.append(Job(schema_name, table_name, param_src_sys_cd, mode, list_fk, watermark, None))
+    list_job[:0] = [Job(schema_name, table_name, param_src_sys_cd, 'fused', list_fused, watermark, None)
+                    for watermark, list_fused in dict_fused.items()]
+    for job in list_job:
+        jobs.put(job)
+    return len(list_job)
 
 
-def scale(schema_name, table_name, param_src_sys_cd, list_constraint_definition, concurrency):
+def get_common_watermark(list_constraint_definition, dict_watermark):
+    """ The watermark all constraints of a table are checked up to, None if one is not checked yet or they differ """
+    set_watermark = set(dict_watermark.get(constraint.constraint_name)
+                        for constraint in parse_constraint_definition(list_constraint_definition))
+    if len(set_watermark) == 1:
+        return set_watermark.pop()
+    return None
+
+
+def scale(dict_constraint_definition, param_src_sys_cd, concurrency, executor_config,
+          options=DEFAULT_CHECK_OPTIONS, table_concurrency=2, dict_table_priority=None, controller=None,
+          watermark_store=None, journal=None, progress=None, tracer=None):
     """ Run jobs in parallelism by which is defined in concurrency, and jobs are defined in table_list_file.
         Args:
-        table_list_file(str): file name and path which defines all tables to be moved.
-        concurrency(str): the number of jobs in parallel.
+        dict_constraint_definition(dict): (schema_name, table_name) to constraint definitions of the table, all
+            tables of the table_list_file are scheduled to the same worker processes.
+        param_src_sys_cd(str):
+        concurrency(str): the number of worker processes, the max number of jobs in parallel.
+        executor_config(ExecutorConfig): how worker processes run their queries.
+        options(CheckOptions): how constraints are grouped into jobs and checked.
+        controller(ConcurrencyController): adjusts the number of jobs in parallel, fixed to concurrency if not given.
+        table_concurrency(int): the max number of jobs of one table in parallel.
+        dict_table_priority(dict): (schema_name, table_name) to priority, higher goes first.
+        watermark_store(WatermarkStore): watermarks of the incremental mode, options.watermark_column must be set.
+            A 'watermark' job per table reads the new watermark, the other jobs of the table wait for it.
+        journal(CheckpointJournal): records the constraints of every succeeded job, for --resume.
+        progress(bool): True to redraw a progress line in place, False to show none, None to redraw it on a
+            terminal and print a line every PROGRESS_LOG_SECONDS otherwise.
+        tracer(Tracer): collects the span events the workers send back, options.trace must be set.
     Returns:
         namedTuple: "todo success failure total_time_in_minutes cancelled"
     """
     canceled = False
-    jobs = multiprocessing.JoinableQueue()
+    jobs = multiprocessing.Queue()
     results = multiprocessing.Queue()
-    create_processes(jobs, concurrency)
-    todo = add_jobs(schema_name, table_name, param_src_sys_cd, list_constraint_definition, jobs)
+    scheduler = JobScheduler(table_concurrency, dict_table_priority)
+    todo = 0
+    for (schema_name, table_name), list_constraint_definition in dict_constraint_definition.items():
+        dict_watermark = None
+        if watermark_store is not None:
+            dict_watermark = watermark_store.get_table(param_src_sys_cd, schema_name, table_name)
+            scheduler.put(Job(schema_name, table_name, param_src_sys_cd, 'watermark', [],
+                              get_common_watermark(list_constraint_definition, dict_watermark), None))
+            scheduler.hold(schema_name, table_name)
+            todo += 1
+        todo += add_jobs(schema_name, table_name, param_src_sys_cd, list_constraint_definition, scheduler, options,
+                         dict_watermark)
+    concurrency = min(concurrency, todo)
+    if controller is None:
+        controller = ConcurrencyController(concurrency, concurrency, concurrency)
+    list_worker = create_processes(jobs, results, concurrency, executor_config, options)
+    reporter = ProgressReporter(todo, progress)
+    dict_in_flight = {}
+    job_id = 0
+    list_result = []
+    last_check_time = time.time()
     try:
-        jobs.join()
+        while scheduler.pending() or dict_in_flight:
+            while len(dict_in_flight) < min(controller.current(), concurrency):
+                job, scheduled_time = scheduler.get()
+                if job is None:
+                    break
+                job_id += 1
+                dict_in_flight[job_id] = job
+                jobs.put((job_id, job, scheduled_time))
+            list_finished = []
+            try:
+                list_finished.append(results.get(timeout=PROGRESS_REFRESH_SECONDS))
+            except queue.Empty:
+                if time.time() - last_check_time >= WORKER_POLL_SECONDS:
+                    last_check_time = time.time()
+                    reporter.clear()
+                    list_finished = check_workers(list_worker, dict_in_flight, jobs, results, executor_config,
+                                                  options)
+            for result in list_finished:
+                reporter.finish(result)
+                if tracer is not None:
+                    tracer.events.extend(result.trace)
+                result = result._replace(report=None, trace=None)
+                job = dict_in_flight.pop(result.job_id)
+                scheduler.task_done(job)
+                if job.mode == 'watermark':
+                    if result.success:
+                        scheduler.release(job.schema_name, job.table_name,
+                                          lambda held: held._replace(new_watermark=result.watermark))
+                    else:
+                        # without the new watermark the new rows are unknown, check the table in full
+                        scheduler.release(job.schema_name, job.table_name,
+                                          lambda held: held._replace(watermark=None, new_watermark=None))
+                elif result.success:
+                    if watermark_store is not None:
+                        for constraint in job.constraints:
+                            watermark_store.put(param_src_sys_cd, job.schema_name, job.table_name,
+                                                constraint.constraint_name, result.watermark, job.watermark is None)
+                    if journal is not None:
+                        journal.put(param_src_sys_cd, job)
+                list_result.append(result)
+                controller.observe(result, scheduler.pending())
+            list_running = [(time.time() - current[1], dict_in_flight[int(current[0])])
+                            for _, current in list_worker if int(current[0]) in dict_in_flight]
+            reporter.refresh(len(dict_in_flight), list_running)
     except KeyboardInterrupt:  # May not work on Windows
         canceled = True
-    success = failures = total_time_in_minutes = 0
-    while not results.empty():  # Safe because all jobs have finished
-        result = results.get_nowait()
-        success += result.success
-        failures += result.failure
-        total_time_in_minutes += result.time_in_minutes
-    return Summary(todo, success, failures, total_time_in_minutes, canceled)
+    reporter.close()
+    for _ in range(len(list_worker)):
+        jobs.put(None)
+    return Summary(todo, sum(result.success for result in list_result),
+                   sum(result.failure for result in list_result),
+                   sum(result.time_in_minutes for result in list_result), canceled, list_result)
+
+
+def check_workers(list_worker, dict_in_flight, jobs, results, executor_config, options):
+    """ Replace the worker processes that died, and terminate the ones stuck in a job far past job_timeout
+        Args:
+        list_worker(list): (process, current job) of the workers, updated in place.
+        dict_in_flight(dict): job id to Job of the jobs sent to the workers.
+        jobs(Queue object), results(Queue object), executor_config(ExecutorConfig), options(CheckOptions): to start
+            a replacement worker.
+    Returns:
+        list: a failed Result per job lost with a dead worker
+    """
+    list_result = []
+    for i, (process, current) in enumerate(list_worker):
+        job_id, start_time = int(current[0]), current[1]
+        if options.job_timeout is not None and job_id != 0 and process.is_alive() and \
+                time.time() - start_time > options.job_timeout + WORKER_KILL_GRACE_SECONDS:
+            print('Error: worker {0} is stuck in job {1}, terminating it...'.format(process.pid, job_id))
+            process.terminate()
+            process.join(5)
+        if process.is_alive():
+            continue
+        # the hive CLI runs in a session of its own and outlives the worker
+        kill_process_group(int(current[2]))
+        print('Error: worker {0} died with exit code {1}, starting a new one...'.format(process.pid,
+                                                                                   process.exitcode))
+        list_worker[i] = create_processes(jobs, results, 1, executor_config, options)[0]
+        if job_id in dict_in_flight:
+            job = dict_in_flight[job_id]
+            list_result.append(Result(job_id, job.schema_name, job.table_name, get_check_type(job), 0, 1,
+                                      (time.time() - start_time) / 60, 0, 0, 0, 0, None, [], 0, '', []))
+    return list_result
+
+
+class ProgressReporter(object):
+    """ Print the reports of finished jobs in the order the jobs were scheduled, and a progress line of jobs done,
+        in flight, ETA and the longest running job. A report waits for the reports of all jobs scheduled before it.
+    """
+
+    def __init__(self, todo, live=None, stream=None):
+        self.todo = todo
+        self.stream = sys.stdout if stream is None else stream
+        # live: redraw the line in place, only on a terminal
+        self.live = self.stream.isatty() if live is None else live
+        self.enabled = live is not False
+        self.start_time = time.time()
+        self.last_print_time = self.start_time
+        self.line_width = 0
+        self.done = 0
+        self.failure = 0
+        self.next_job_id = 1
+        self.dict_report = {}
+
+    def finish(self, result):
+        self.done += 1
+        self.failure += result.failure
+        self.dict_report[result.job_id] = result.report or ''
+        self.clear()
+        while self.next_job_id in self.dict_report:
+            self.stream.write(self.dict_report.pop(self.next_job_id))
+            self.next_job_id += 1
+        self.stream.flush()
+
+    def format_line(self, num_in_flight, list_running):
+        elapsed = time.time() - self.start_time
+        line = 'Progress: {0}/{1} jobs done, {2} failed, {3} in flight'.format(self.done, self.todo, self.failure,
+                                                                              num_in_flight)
+        if 0 < self.done < self.todo:
+            line += ', ETA {0}'.format(datetime.timedelta(seconds=int(elapsed / self.done * (self.todo - self.done))))
+        if list_running:
+            seconds, job = max(list_running, key=lambda running: running[0])
+            line += ', slowest {0}.{1} {2} {3}s'.format(job.schema_name, job.table_name,
+                                                        ','.join(c.constraint_name for c in job.constraints),
+                                                        int(seconds))
+        return line
+
+    def refresh(self, num_in_flight, list_running):
+        if not self.enabled:
+            return
+        if self.live:
+            line = self.format_line(num_in_flight, list_running)
+            self.stream.write('\r{0}{1}'.format(line, ' ' * max(self.line_width - len(line), 0)))
+            self.line_width = len(line)
+            self.stream.flush()
+        elif time.time() - self.last_print_time >= PROGRESS_LOG_SECONDS:
+            self.last_print_time = time.time()
+            self.stream.write(self.format_line(num_in_flight, list_running) + '\n')
+            self.stream.flush()
 
+    def clear(self):
+        """ Wipe the progress line so the next print starts at the beginning of an empty line """
+        if self.live and self.line_width:
+            self.stream.write('\r{0}\r'.format(' ' * self.line_width))
+            self.line_width = 0
 
-def create_processes(jobs, concurrency):
+    def close(self):
+        """ Print the reports still waiting for an earlier job, the run was cancelled or a job was lost """
+        self.clear()
+        for job_id in sorted(self.dict_report):
+            self.stream.write(self.dict_report[job_id])
+        self.dict_report = {}
+        self.stream.flush()
+
+
+def create_processes(jobs, results, concurrency, executor_config, options):
     """ Create OS process
         Args:
-        jobs(Joinable object):
-        results(object):
+        jobs(Queue object):
+        results(Queue object):
         concurrency(str): the number of jobs in parallel.
+        executor_config(ExecutorConfig): each process opens its own executor session with it.
+        options(CheckOptions):
     Returns:
-        namedTuple: "todo success failure total_time_in_minutes cancelled"
+        list: (process, current job) of the started processes, current job is shared memory holding the id,
+            start time and hive CLI process group of the job the process runs, id and process group 0 if none
     """
+    list_worker = []
     for _ in range(concurrency):
-        process = multiprocessing.Process(target=worker, args=(jobs,))
+        current = multiprocessing.Array('d', 3)
+        process = multiprocessing.Process(target=worker, args=(jobs, results, executor_config, options, current))
         process.daemon = True
-        # process.pid
         process.start()
+        list_worker.append((process, current))
+    return list_worker
 
 
 # ----------------end region----------------
 
 
+CONSTRAINT_TYPE_NAME = {'p': 'PRIMARY', 'u': 'UNIQUE', 'n': 'NULL', 'f': 'FOREIGN'}
+CONSTRAINT_TYPE_SHORT_NAME = {'p': 'PK', 'u': 'UK', 'n': 'Null', 'f': 'FK'}
+FUSED_CONSTRAINT_TYPES = ('p', 'u', 'n')
+
+
 class ArgumentErrorException(Exception):
     def __init__(self, name):
         self.name = name
 
 
-def create_tmp_file(query):
+class JobTimeoutException(Exception):
+    def __init__(self, deadline):
+        self.deadline = deadline
+
+
+class QueryFailedException(Exception):
+    def __init__(self, returncode, message):
+        super(QueryFailedException, self).__init__('hive exited with code {0}: {1}'.format(returncode, message))
+        self.returncode = returncode
+
+
+# ----------region trace----------
+class Tracer(object):
+    """ Record spans in the Chrome trace event format, the file write() makes opens in chrome://tracing or Perfetto.
+        Every span carries the args in context, e.g. the table and constraints of the job it belongs to.
+        A disabled Tracer records nothing, so callers need not check.
     """
-    This function is to gegerate temporary file for query use
-    :param query: query to be executed
-    :return: query result as string
+
+    def __init__(self, name=None, enabled=True):
+        self.enabled = enabled
+        self.pid = os.getpid()
+        self.context = {}
+        self.events = []
+        if name is not None:
+            self.metadata('process_name', name=name)
+
+    def metadata(self, event_name, **args):
+        if self.enabled:
+            self.events.append({'name': event_name, 'ph': 'M', 'pid': self.pid, 'tid': self.pid, 'args': args})
+
+    def add(self, name, category, start_time, end_time, **args):
+        """ Record a span of unix times start_time to end_time """
+        if not self.enabled:
+            return
+        dict_args = dict(self.context)
+        dict_args.update(args)
+        self.events.append({'name': name, 'cat': category, 'ph': 'X', 'ts': int(start_time * 1000000),
+                            'dur': int(max(end_time - start_time, 0) * 1000000), 'pid': self.pid, 'tid': self.pid,
+                            'args': dict_args})
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        """ Record a span of the with block, args added to the dict it yields are recorded as well """
+        start_time = time.time()
+        try:
+            yield args
+        finally:
+            self.add(name, category, start_time, time.time(), **args)
+
+    def drain(self):
+        """ Hand over the events recorded so far, to send them to another process """
+        events, self.events = self.events, []
+        return events
+
+    def write(self, path):
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, file)
+        return len(self.events)
+
+
+def get_sql_hash(query):
+    """ Short hash of a query, the same query gets the same hash in every run """
+    return hashlib.sha1(query.encode('utf-8')).hexdigest()[:12]
+
+
+class TracedExecutor(object):
+    """ Wrap a query executor to record a span per query with the SQL, its hash and the number of rows returned.
+        Attributes other than execute() and iter_rows() are the ones of the executor wrapped.
     """
-    # print('---begin---')
-    # print(query)
-    # print('---end---')
-    try:
-        with tempfile.NamedTemporaryFile(mode='w+t', dir=os.getcwd(), prefix='analyze_constraint.tmp.',
-                                         delete=False) as file:
-            file.write(query)
-        result = os.popen('hive --config hive-site.xml -S -f {0}'.format(file.name)).read()
-    finally:
-        file.close()
-        os.remove(file.name)
-    return result
 
+    def __init__(self, executor, tracer):
+        self.executor = executor
+        self.tracer = tracer
 
-def parse_args():
+    def __getattr__(self, name):
+        return getattr(self.executor, name)
+
+    def execute(self, query):
+        with self.tracer.span('query', 'query', sql_hash=get_sql_hash(query), sql=query) as args:
+            result = self.executor.execute(query)
+            args['rows'] = len(result.splitlines())
+        return result
+
+    def iter_rows(self, query):
+        """ The span of a streaming query includes the time the caller takes to process the rows """
+        start_time = time.time()
+        num_rows = 0
+        try:
+            for row in self.executor.iter_rows(query):
+                num_rows += 1
+                yield row
+        finally:
+            self.tracer.add('query', 'query', start_time, time.time(), sql_hash=get_sql_hash(query), sql=query,
+                            rows=num_rows)
+
+
+# ----------------end region----------------
+
+
+# ----------region metrics----------
+TIMED_STAGES = ('build', 'execute', 'parse')
+
+
+class Stopwatch(object):
+    """ Sum up the seconds a job spends in each stage, and record a span per stage if a Tracer is given """
+
+    def __init__(self, tracer=None):
+        self.seconds = collections.OrderedDict((stage, 0.0) for stage in TIMED_STAGES)
+        self.tracer = tracer
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            end_time = time.time()
+            self.seconds[name] += end_time - start_time
+            if self.tracer is not None:
+                self.tracer.add(name, 'stage', start_time, end_time)
+
+    def time_rows(self, rows):
+        """ Yield rows of a streaming query, the time waiting for a row counts as execute, the time the caller takes
+            to process it counts as parse
+        """
+        iterator = iter(rows)
+        while True:
+            start_time = time.time()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.seconds['execute'] += time.time() - start_time
+            start_time = time.time()
+            yield row
+            self.seconds['parse'] += time.time() - start_time
+
+
+def percentile(list_value, percent):
     """
-    This function is to parse use entered arguments, of which -table and -asset is required, -key and -rfnc is optional
-    :return:
-        table_schema
-        table_name
-        asset_name
-        key_type(optional)
-        reference_table_name(optional)
+    This function is to get the nearest-rank percentile
+    :param list_value: numbers
+    :param percent: 0 to 100
+    :return: the percentile, 0 for an empty list
     """
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-t', '--table', help='table name to be analyzed', required=True, type=str)
-    parser.add_argument('-s', '--asset', help='asset name the table belongs to', required=True, type=str)
-    parser.add_argument('-k', '--key', help='specify constraint key type', required=False, type=str)
-    parser.add_argument('-r', '--reference', help='specify constraint reference table', required=False, type=str)
-    args = parser.parse_args()
-    table = args.table
-    asset_name = args.asset
-    key_type = args.key
-    reference_table_name = args.reference
-    
-    schema_name = ''
-    table_name = ''
-    if table.find('.') == -1:
-        raise ArgumentErrorException(table)
-    else:
-        schema_name = table.split('.')[0]
-        table_name = table.split('.')[1]
-    return schema_name, table_name, asset_name, key_type, reference_table_name
+    if not list_value:
+        return 0
+    list_sorted = sorted(list_value)
+    rank = int(math.ceil(percent / 100.0 * len(list_sorted)))
+    return list_sorted[max(rank, 1) - 1]
 
 
-def output_data(num_keys, data):
+def summarize_latency(list_result):
     """
-    This function is to output issue data as an appropriate format
-    :param num_keys:
-    :param data:
-    :return:
+    This function is to aggregate the results of a group of jobs
+    :param list_result: list of Result
+    :return: dict of job and query counts and p50/p95 seconds of each stage
     """
-    list_data = data.split('^')
-    i = 0
-    while i <= len(list_data) - num_keys:
-        if i != len(list_data):
-            if i == 0:
-                print('Column Values   | {0}'.format(list_data[i:i + num_keys]))
-            else:
-                print('                | {0}'.format(list_data[i:i + num_keys]))
-        else:
-            print(list_data[i:-1])
+    dict_stage_seconds = collections.OrderedDict([
+        ('total', [result.time_in_minutes * 60 for result in list_result]),
+        ('queue_wait', [result.queue_wait_seconds for result in list_result]),
+        ('build', [result.build_seconds for result in list_result]),
+        ('execute', [result.execute_seconds for result in list_result]),
+        ('parse', [result.parse_seconds for result in list_result])])
+    dict_summary = collections.OrderedDict([
+        ('jobs', len(list_result)),
+        ('success', sum(result.success for result in list_result)),
+        ('failure', sum(result.failure for result in list_result)),
+        ('queries', sum(result.queries for result in list_result))])
+    for stage, list_seconds in dict_stage_seconds.items():
+        dict_summary[stage] = collections.OrderedDict([('sum', round(sum(list_seconds), 3)),
+                                                       ('p50', round(percentile(list_seconds, 50), 3)),
+                                                       ('p95', round(percentile(list_seconds, 95), 3))])
+    return dict_summary
+
 
-        i += num_keys
+def write_metrics(metrics_file, summary, controller, wall_seconds):
+    """
+    This function is to write the run summary per table and per constraint type as JSON
+    :param metrics_file: file name and path
+    :param summary: Summary returned by scale()
+    :param controller: ConcurrencyController the run was scaled by
+    :param wall_seconds: run time of scale()
+    :return: the metrics as dict
+    """
+    dict_table = collections.defaultdict(list)
+    dict_check_type = collections.defaultdict(list)
+    for result in summary.results:
+        dict_table['{0}.{1}'.format(result.schema_name, result.table_name)].append(result)
+        dict_check_type[result.check_type].append(result)
+    metrics = collections.OrderedDict([
+        ('start_time', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+        ('min_concurrency', controller.min_concurrency),
+        ('max_concurrency', controller.max_concurrency),
+        ('concurrency_history', [[round(timestamp, 3), target] for timestamp, target in controller.history]),
+        ('wall_seconds', round(wall_seconds, 3)),
+        ('jobs_per_minute', round(len(summary.results) / (wall_seconds / 60), 3) if wall_seconds > 0 else 0),
+        ('todo', summary.todo),
+        ('cancelled', summary.cancelled),
+        ('overall', summarize_latency(summary.results)),
+        ('tables', collections.OrderedDict((key, summarize_latency(value))
+                                           for key, value in sorted(dict_table.items()))),
+        ('constraint_types', collections.OrderedDict((key, summarize_latency(value))
+                                                     for key, value in sorted(dict_check_type.items())))])
+    with open(metrics_file, 'w') as file:
+        json.dump(metrics, file, indent=2)
+    return metrics
 
 
-def analyze(schema_name, table_name, param_src_sys_cd, constraint_type, constraint_name,
-            reference_table_name,
-            reference_keys,
-            reference_column_name):
+# ----------------end region----------------
+
+
+# ----------region constraint definition cache----------
+class ConstraintDefinitionCache(object):
+    """ Keep the constraint definitions looked up from radar.constraint_columns in a SQLite file, one entry per
+        schema.table given by the user. An entry is used while it is younger than ttl_seconds and
+        radar.constraint_columns has not been modified since it was cached.
     """
-    This function is to analyze specified constraint type and return error value if exists
-    :param schema_name:
-    :param table_name:
+
+    def __init__(self, path, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("create table if not exists constraint_definition (table_pattern text primary key, "
+                                "cached_time real, source_modified_time integer, definitions text)")
+        self.connection.commit()
+
+    def get(self, table_pattern, source_modified_time):
+        """
+        This function is to get the cached constraint definitions of a schema.table
+        :param table_pattern: (schema_name, table_name), either may be a glob
+        :param source_modified_time: last modified time of radar.constraint_columns, None if unknown
+        :return: OrderedDict of (schema_name, table_name) to list of constraint definitions, None if not cached
+        """
+        row = self.connection.execute("select cached_time, source_modified_time, definitions from "
+                                      "constraint_definition where table_pattern = ?",
+                                      ('.'.join(table_pattern).upper(),)).fetchone()
+        if row is None or time.time() - row[0] > self.ttl_seconds:
+            return None
+        if source_modified_time is not None and row[1] != source_modified_time:
+            return None
+        return collections.OrderedDict(((schema_name, table_name), list_constraint_definition)
+                                       for schema_name, table_name, list_constraint_definition in json.loads(row[2]))
+
+    def put(self, table_pattern, source_modified_time, dict_constraint_definition):
+        definitions = json.dumps([[schema_name, table_name, list_constraint_definition]
+                                  for (schema_name, table_name), list_constraint_definition
+                                  in dict_constraint_definition.items()])
+        self.connection.execute("insert or replace into constraint_definition values (?, ?, ?, ?)",
+                                ('.'.join(table_pattern).upper(), time.time(), source_modified_time, definitions))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+# ----------------end region----------------
+
+
+# ----------region watermark----------
+class WatermarkStore(object):
+    """ Keep the watermark up to which each constraint of a table has been checked for a source system, in the same
+        SQLite file as the constraint definition cache. A constraint is checked in full when it has no watermark,
+        when force_full is set, or when its last full check is older than full_every_seconds.
+    """
+
+    def __init__(self, path, full_every_seconds=None, force_full=False):
+        self.full_every_seconds = full_every_seconds
+        self.force_full = force_full
+        self.connection = sqlite3.connect(path)
+        list_column = [row[1] for row in self.connection.execute("pragma table_info(watermark)")]
+        if list_column and 'src_sys_cd' not in list_column:
+            # the watermarks of older versions do not say which source system they belong to, they are dropped
+            # and every constraint is checked in full once
+            self.connection.execute("drop table watermark")
+        self.connection.execute("create table if not exists watermark (src_sys_cd text, table_schema text, "
+                                "table_name text, constraint_name text, watermark text, full_check_time real, "
+                                "primary key (src_sys_cd, table_schema, table_name, constraint_name))")
+        self.connection.commit()
+
+    def get_table(self, param_src_sys_cd, schema_name, table_name):
+        """
+        This function is to get the watermarks of the constraints of a table that can be checked incrementally
+        :param param_src_sys_cd:
+        :param schema_name:
+        :param table_name:
+        :return: dict of constraint name to watermark, constraints due for a full check are left out
+        """
+        dict_watermark = {}
+        if self.force_full:
+            return dict_watermark
+        for constraint_name, watermark, full_check_time in self.connection.execute(
+                "select constraint_name, watermark, full_check_time from watermark where src_sys_cd = ? and "
+                "upper(table_schema) = ? and upper(table_name) = ?",
+                (param_src_sys_cd, schema_name.upper(), table_name.upper())):
+            if watermark is None:
+                continue
+            if self.full_every_seconds is not None and time.time() - full_check_time > self.full_every_seconds:
+                continue
+            dict_watermark[constraint_name] = watermark
+        return dict_watermark
+
+    def put(self, param_src_sys_cd, schema_name, table_name, constraint_name, watermark, full_check):
+        row = self.connection.execute("select full_check_time from watermark where src_sys_cd = ? and "
+                                      "upper(table_schema) = ? and upper(table_name) = ? and constraint_name = ?",
+                                      (param_src_sys_cd, schema_name.upper(), table_name.upper(),
+                                       constraint_name)).fetchone()
+        full_check_time = time.time() if full_check or row is None else row[0]
+        self.connection.execute("insert or replace into watermark values (?, ?, ?, ?, ?, ?)",
+                                (param_src_sys_cd, schema_name.upper(), table_name.upper(), constraint_name,
+                                 watermark, full_check_time))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+# ----------------end region----------------
+
+
+# ----------region checkpoint----------
+class CheckpointJournal(object):
+    """ Record the constraints checked by every succeeded job of a run, in the same SQLite file as the constraint
+        definition cache, so an interrupted or partly failed run can be resumed without checking them again.
+        A run clears the checkpoints of its own constraints when it starts without --resume and when it finishes
+        without failures, runs of other tables keep theirs.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("create table if not exists checkpoint (src_sys_cd text, table_schema text, "
+                                "table_name text, constraint_name text, finish_time real, "
+                                "primary key (src_sys_cd, table_schema, table_name, constraint_name))")
+        self.connection.commit()
+
+    def put(self, param_src_sys_cd, job):
+        self.connection.executemany("insert or replace into checkpoint values (?, ?, ?, ?, ?)",
+                                    [(param_src_sys_cd, job.schema_name.upper(), job.table_name.upper(),
+                                      constraint.constraint_name, time.time()) for constraint in job.constraints])
+        self.connection.commit()
+
+    def skip_done(self, dict_constraint_definition, param_src_sys_cd):
+        """
+        This function is to leave out the constraints a previous run already checked
+        :param dict_constraint_definition: (schema_name, table_name) to constraint definitions of the table
+        :param param_src_sys_cd:
+        :return: (OrderedDict of the constraint definitions left to check, number of constraints left out)
+        """
+        set_done = set(self.connection.execute("select table_schema, table_name, constraint_name from checkpoint "
+                                               "where src_sys_cd = ?", (param_src_sys_cd,)))
+        num_done = 0
+        dict_todo = collections.OrderedDict()
+        for (schema_name, table_name), list_constraint_definition in dict_constraint_definition.items():
+            list_todo = []
+            for constraint_definition in list_constraint_definition:
+                constraint_name = constraint_definition.split('^')[1]
+                if (schema_name.upper(), table_name.upper(), constraint_name) in set_done:
+                    num_done += 1
+                else:
+                    list_todo.append(constraint_definition)
+            if list_todo:
+                dict_todo[(schema_name, table_name)] = list_todo
+        return dict_todo, num_done
+
+    def clear(self, dict_constraint_definition, param_src_sys_cd):
+        """
+        This function is to forget the checkpoints of the constraints of a run
+        :param dict_constraint_definition: (schema_name, table_name) to constraint definitions of the run
+        :param param_src_sys_cd:
+        """
+        self.connection.executemany("delete from checkpoint where src_sys_cd = ? and table_schema = ? and "
+                                    "table_name = ? and constraint_name = ?",
+                                    [(param_src_sys_cd, schema_name.upper(), table_name.upper(),
+                                      constraint_definition.split('^')[1])
+                                     for (schema_name, table_name), list_constraint_definition
+                                     in dict_constraint_definition.items()
+                                     for constraint_definition in list_constraint_definition])
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+# ----------------end region----------------
+
+
+# ----------region results sink----------
+# an issue row as analyzeConstraints.sh inserted it into radar.constraints, constraint_values is '(value1,value2)'.
+# A constraint checked in full with no issue is recorded by one row with constraint_values None, so
+# radar.constraints keeps the history of every full check. An incremental check only adds the issues of the new rows,
+# the state of a constraint is its latest clean row and the issue rows after it.
+Violation = collections.namedtuple("Violation", "schema_name table_name reference_keys constraint_name constraint_type "
+                                                 "reference_table_name constraint_values check_time")
+# columns of the staging table, src_sys_cd and table_name are the partition columns of radar.constraints
+STAGING_COLUMNS = Violation._fields + ('src_sys_cd', 'partition_table_name')
+
+
+def get_clean_record(schema_name, table_name, constraint):
+    """ The row recording a constraint checked with no issue """
+    return Violation(schema_name, table_name, constraint.reference_keys, constraint.constraint_name,
+                     constraint.constraint_type, constraint.reference_table_name, None,
+                     datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def count_issue_rows(list_violation):
+    return sum(violation.constraint_values is not None for violation in list_violation)
+
+
+def get_violation_rows(summary, param_src_sys_cd):
+    """
+    This function is to get the rows to load, only succeeded jobs are loaded so a failed job keeps the last result
+    :param summary: Summary
     :param param_src_sys_cd:
-    :param constraint_type:
-    :param constraint_name:
-    :param reference_table_name:
-    :param reference_keys:
-    :param reference_column_name:
-    :return: None
+    :return: generator of lists in the order of STAGING_COLUMNS
     """
+    for result in summary.results:
+        if result.success:
+            for violation in result.violations:
+                yield list(violation) + [param_src_sys_cd, violation.table_name]
 
-    arr_reference_keys = reference_keys.split(',')
 
-    if constraint_type == 'p':
-        # f^FK1_ADDR^CTRY_CTY^CTRY_CTY_ID,SRC_SYS_CD^CTRY_CTY_ID,SRC_SYS_CD
-        # need to separate fields and re-arrange
-        pk_list_temp = ''
-        for i_field in range(len(arr_reference_keys)):
-            pk_list_temp += "nvl(cast (case when t.{0} is null then null else t.{0} end as string),'NULL')".format(
-                arr_reference_keys[i_field])
-            if i_field != len(arr_reference_keys) - 1:
-                pk_list_temp += ','
-        pk_list_formatted = "concat_ws('^', {0})".format(pk_list_temp)
-
-        sql_check_pk = \
-            ("select concat_ws('^', collect_set(A.s)) from ( select {0} as s from ( select {1} "
-             "from {2}.{3} where SRC_SYS_CD='{4}' group by {1} "
-             "having count(1) > 1 )t limit 10 )A").format(pk_list_formatted, reference_keys, schema_name, table_name,
-                                                          param_src_sys_cd)
-        res_check_pk = create_tmp_file(sql_check_pk)
+class LocalResultSink(object):
+    """ Append the results and violations of a run to a local JSON lines file, to test without a cluster. A
+        constraint checked with no issue is a 'clean' record
+    """
 
-        if res_check_pk.strip() == '':
-            print('No PK issue found!')
-        else:
-            print('SQL:')
-            print("\033[31m select {0} from {1}.{2} where SRC_SYS_CD='{3}' "
-                  "group by {0} having count(1) > 1 )t limit 10 )A\n \033[0m".format(reference_keys, schema_name,
-                                                                                     table_name, param_src_sys_cd))
-            print("-[  RECORD  ]---+----------------\n"
-                  "Schema Name     | {0}\n"
-                  "Table Name      | {1}\n"
-                  "Column Names    | {2}\n"
-                  "Constraint Name | {3}\n"
-                  "Constraint Type | PRIMARY\n"
-                  "----------------+----------------".format(schema_name, table_name, reference_keys,
-                                                               constraint_name))
-            if res_check_pk.find('^') == -1:
-                print("Column Values   | ('{0}')\n".format(res_check_pk))
-            else:
-                output_data(len(reference_keys.split(',')), res_check_pk)
-    elif constraint_type == 'u':
-        uk_list_temp = ''
-        for i_field in range(len(arr_reference_keys)):
-            uk_list_temp += "nvl(cast (case when t.{0} is null then null else t.{0} end as string),'NULL')".format(
-                arr_reference_keys[i_field])
-            if i_field != len(arr_reference_keys) - 1:
-                uk_list_temp += ','
-        uk_list_formatted = "concat_ws('^', {0})".format(uk_list_temp)
-
-        sql_check_uk = \
-            ("select concat_ws('^', collect_set(A.s)) from ( select {0} as s from ( select {1} "
-             "from {2}.{3} where SRC_SYS_CD='{4}' group by {1} "
-             "having count(1) > 1 )t limit 10 )A").format(uk_list_formatted, reference_keys, schema_name, table_name,
-                                                          param_src_sys_cd)
-        res_check_uk = create_tmp_file(sql_check_uk)
+    def __init__(self, path):
+        self.path = path
 
-        if res_check_uk.strip() == '':
-            print('No UK issue found!')
-        else:
-            print('SQL:')
-            print("\033[31m select {0} from {1}.{2} where SRC_SYS_CD='{3}' "
-                  "group by {0} having count(1) > 1 )t limit 10 )A\n \033[0m".format(reference_keys, schema_name,
-                                                                                     table_name, param_src_sys_cd))
-            print("-[  RECORD  ]---+----------------\n"
-                  "Schema Name     | {0}\n"
-                  "Table Name      | {1}\n"
-                  "Column Names    | {2}\n"
-                  "Constraint Name | {3}\n"
-                  "Constraint Type | UNIQUE\n"
-                  "----------------+----------------".format(schema_name, table_name, reference_keys,
-                                                               constraint_name))
-            if res_check_uk.find('^') == -1:
-                print("Column Values   | ('{0}')\n".format(res_check_uk))
-            else:
-                output_data(len(reference_keys.split(',')), res_check_uk)
-    elif constraint_type == 'n':
-        nk_list_temp = ''
-        null_condition = ''
-        for i_field in range(len(arr_reference_keys)):
-            null_condition = '{0}.{1} is null'.format(table_name, arr_reference_keys[i_field])
-            if arr_reference_keys[i_field] == 'RADAR_UPD_TS':
-                nk_list_temp += "case when RADAR_UPD_TS is null then 'NULL' else from_unixtime(unix_timestamp(),'yyyy-MM-dd HH:mm:ss') end"
-            else:
-                nk_list_temp += "nvl(cast (case when {0} is null then null else {0} end as string),'NULL')".format(
-                    arr_reference_keys[i_field])
-            if i_field != len(arr_reference_keys) - 1:
-                nk_list_temp += ','
-                null_condition += ' or '
-        nk_list_formatted = "concat_ws('^', {0})".format(nk_list_temp)
-
-        sql_check_nk = \
-            ("select concat_ws('^', collect_set(A.s)) from ( select {0} as s "
-             "from {1}.{2} where SRC_SYS_CD='{3}' and ( {4} ) limit 10 )A").format(nk_list_formatted, schema_name,
-                                                                                 table_name,
-                                                                                 param_src_sys_cd, null_condition)
-        res_check_nk = create_tmp_file(sql_check_nk)
-
-        if res_check_nk.strip() == '':
-            print('No Null issue found!')
-        else:
-            print('SQL:')
-            print("\033[31m select {0} from {1}.{2} where SRC_SYS_CD='{3}' and {4}\n \033[0m".format(nk_list_formatted,
-                                                                                                     schema_name,
-                                                                                                     table_name,
-                                                                                                     param_src_sys_cd,
-                                                                                                     null_condition))
-            print("-[  RECORD  ]---+----------------\n"
-                  "Schema Name     | {0}\n"
-                  "Table Name      | {1}\n"
-                  "Column Names    | {2}\n"
-                  "Constraint Name | {3}\n"
-                  "Constraint Type | NULL\n"
-                  "----------------+----------------".format(schema_name, table_name, reference_keys,
-                                                               constraint_name))
-            if res_check_nk.find('^') == -1:
-                print("Column Values   | ('{0}')\n".format(res_check_nk))
-            else:
-                output_data(len(reference_keys.split(',')), res_check_nk)
-    elif constraint_type == 'f':
-        if table_name.upper() == reference_table_name.upper():
-            print("Expression returned a reference to target table itself, skipping...")
-        else:
-            fk_list_temp = ''
-            join_condition = ''
-            null_condition = ''
-            source_column_name = ''
-            rfnc_column_name = ''
-            for i_field in range(len(arr_reference_keys)):
-                join_condition += "{0}.{1}={2}.{3}".format(table_name, arr_reference_keys[i_field],
-                                                           reference_table_name,
-                                                           reference_column_name.split(',')[i_field])
-                null_condition += '{0}.{1} is not null'.format(table_name, arr_reference_keys[i_field])
-                source_column_name += "{0}.{1}".format(table_name, arr_reference_keys[i_field])
-                rfnc_column_name += "{0}.{1}".format(reference_table_name, reference_column_name.split(',')[i_field])
-                fk_list_temp += "nvl(cast (case when t.{0} is null then null else t.{0} end as string),'NULL')".format(
-                    arr_reference_keys[i_field])
-                if i_field != len(arr_reference_keys) - 1:
-                    fk_list_temp += ','
-                    join_condition += ' and '
-                    null_condition += ' and '
-                    source_column_name += ','
-                    rfnc_column_name += ','
-            fk_list_formatted = "concat_ws('^', {0})".format(fk_list_temp)
-
-            sql_check_fk = \
-                ("select concat_ws('^', collect_set(A.s)) from ( select {0} as s from ( "
-                 "select distinct {1} from {2}.{3} where not exists ( select distinct {4} from {2}.{5} "
-                 "where {5}.SRC_SYS_CD='{6}' and {7} ) "
-                 " and {8} and {3}.SRC_SYS_CD='{6}' )t limit 10 )A").format(fk_list_formatted, source_column_name,
-                                                                            schema_name, table_name, rfnc_column_name,
-                                                                            reference_table_name,
-                                                                            param_src_sys_cd, join_condition,
-                                                                            null_condition)
-            res_check_fk = create_tmp_file(sql_check_fk)
-
-            if res_check_fk.strip() == '':
-                print('No FK issue found for reference table {0}! FK: {1}.'.format(reference_table_name, reference_keys))
-            else:
-                print('SQL:')
-                print("\033[31m select distinct {0} from {1}.{2} where not exists ( select distinct {3} from {1}.{4} "
-                      "where {4}.SRC_SYS_CD='{5}' and {6} ) "
-                      " and {7} and {2}.SRC_SYS_CD='{5}' limit 10\n \033[0m").format(source_column_name,
-                                                                                           schema_name, table_name,
-                                                                                           rfnc_column_name,
-                                                                                           reference_table_name,
-                                                                                           param_src_sys_cd,
-                                                                                           join_condition,
-                                                                                           null_condition)
-                print("-[  RECORD  ]---+----------------\n"
-                      "Schema Name     | {0}\n"
-                      "Table Name      | {1}\n"
-		      "Reference Table | {2}\n"
-                      "Column Names    | {3}\n"
-                      "Constraint Name | {4}\n"
-                      "Constraint Type | FOREIGN\n"
-                      "----------------+----------------".format(schema_name, table_name, reference_table_name, reference_keys,
-                                                                   constraint_name))
-                if res_check_fk.find('^') == -1:
-                    print("Column Values   | ('{0}')\n".format(res_check_fk))
+    def write(self, summary, param_src_sys_cd):
+        """ Return the number of issue rows written """
+        num_violations = 0
+        run_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with open(self.path, 'a') as file:
+            for result in summary.results:
+                record = collections.OrderedDict([('record', 'result'), ('run_time', run_time),
+                                                  ('src_sys_cd', param_src_sys_cd)])
+                record.update((name, value) for name, value in result._asdict().items() if name != 'violations')
+                file.write(json.dumps(record) + '\n')
+            for row in get_violation_rows(summary, param_src_sys_cd):
+                record = collections.OrderedDict([('record', 'violation'), ('run_time', run_time)])
+                record.update(zip(STAGING_COLUMNS, row))
+                if record['constraint_values'] is None:
+                    record['record'] = 'clean'
                 else:
-                    output_data(len(reference_keys.split(',')), res_check_fk)
-    else:
+                    num_violations += 1
+                file.write(json.dumps(record) + '\n')
+        return num_violations
+
+
+class HiveResultSink(object):
+    """
+    Append the violations and the clean checks of a run to radar.constraints by one insert, the rows are written to a
+    local staging file first, as text or as parquet if pyarrow is installed. The file is loaded by load data local
+    inpath, so it has to be on the host running the hive CLI or HiveServer2. Earlier runs, and constraints this run
+    did not check, keep their rows
+    """
+
+    def __init__(self, session_pool, table_name='radar.constraints', staging_format='text'):
+        self.session_pool = session_pool
+        self.table_name = table_name
+        self.staging_format = staging_format
+
+    def write_staging_file(self, list_row):
+        with tempfile.NamedTemporaryFile(mode='w+t', dir=os.getcwd(), prefix='analyze_constraint.stage.',
+                                         delete=False) as file:
+            if self.staging_format == 'text':
+                for row in list_row:
+                    file.write('\t'.join('\\N' if value is None else re.sub('[\t\r\n]', ' ', value)
+                                         for value in row) + '\n')
+        if self.staging_format == 'parquet':
+            import pyarrow
+            import pyarrow.parquet
+            table = pyarrow.Table.from_arrays([pyarrow.array(column, pyarrow.string()) for column in zip(*list_row)],
+                                              names=list(STAGING_COLUMNS))
+            pyarrow.parquet.write_table(table, file.name)
+        return file.name
+
+    def build_load_query(self, staging_path):
+        if self.staging_format == 'text':
+            storage = "row format delimited fields terminated by '\\t' stored as textfile"
+        else:
+            storage = 'stored as parquet'
+        return ("create temporary table analyze_constraint_stage ( {0} ) {1};\n"
+                "load data local inpath '{2}' overwrite into table analyze_constraint_stage;\n"
+                "set hive.exec.dynamic.partition=true;\n"
+                "set hive.exec.dynamic.partition.mode=nonstrict;\n"
+                "insert into table {3} partition(src_sys_cd,table_name) "
+                "select {4} from analyze_constraint_stage;").format(
+                    ', '.join('{0} string'.format(name) for name in STAGING_COLUMNS), storage, staging_path,
+                    self.table_name, ', '.join(STAGING_COLUMNS))
+
+    def write(self, summary, param_src_sys_cd):
+        """ Return the number of issue rows loaded """
+        list_row = list(get_violation_rows(summary, param_src_sys_cd))
+        if not list_row:
+            return 0
+        staging_path = self.write_staging_file(list_row)
+        try:
+            with self.session_pool.session() as executor:
+                executor.execute(self.build_load_query(staging_path))
+        finally:
+            os.remove(staging_path)
+        return sum(count_issue_rows(result.violations) for result in summary.results if result.success)
+
+
+# ----------------end region----------------
+
+
+# ----------region query executor----------
+# data_dir: directory of the local extracts read by the local backend
+ExecutorConfig = collections.namedtuple("ExecutorConfig", "backend host port username database data_dir")
+
+
+def split_statements(query):
+    """
+    This function is to split a hive script into single statements, semicolons in quoted literals are kept
+    :param query: one or more statements separated by ';'
+    :return: list of statements without the trailing ';'
+    """
+    statements = []
+    current = ''
+    quote = None
+    for char in query:
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in ('\'', '"'):
+            quote = char
+        elif char == ';':
+            if current.strip() != '':
+                statements.append(current.strip())
+            current = ''
+            continue
+        current += char
+    if current.strip() != '':
+        statements.append(current.strip())
+    return statements
+
+
+def format_rows(rows):
+    """
+    This function is to format fetched rows the same way as `hive -S` prints them
+    :param rows: iterable of tuples
+    :return: rows separated by new line, columns separated by tab, None printed as NULL
+    """
+    result = ''
+    for row in rows:
+        result += '\t'.join('NULL' if value is None else str(value) for value in row) + '\n'
+    return result
+
+
+@contextlib.contextmanager
+def deadline_timer(deadline, on_timeout):
+    """ Call on_timeout if the block is still running at deadline, the block then raises JobTimeoutException.
+        No limit if deadline is None.
+    """
+    if deadline is None:
+        yield
+        return
+    fired = threading.Event()
+
+    def fire():
+        fired.set()
+        on_timeout()
+
+    timer = threading.Timer(max(deadline - time.time(), 0), fire)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield
+    except Exception:
+        if fired.is_set():
+            raise JobTimeoutException(deadline)
+        raise
+    finally:
+        timer.cancel()
+    if fired.is_set():
+        raise JobTimeoutException(deadline)
+
+
+def kill_process_group(process_group_id):
+    """ Kill a process and all its children started in its own session, nothing if process_group_id is 0 """
+    if process_group_id <= 0:
+        return
+    try:
+        os.killpg(process_group_id, signal.SIGKILL)
+    except OSError:
+        # the group is gone already
         pass
 
 
-def main():
-	  try:
-		    # set work directory as home
-		    start_time = datetime.datetime.now()
-		    os.chdir('/home/radamgr')
-		    try:
-		    	  schema_name, table_name, asset_name, key_type, reference_table_name = parse_args()
-		    except ArgumentErrorException as e:
-		    	  print('Error: {0} is not a valid table name in search path, please check your input!'.format(e.name))
-		    else:
-				    try:
-				        config = configparser.ConfigParser()
-				        config.read('/home/radamgr/apps/Code/sh/radar_hadoop.env')
-				        param_src_sys_cd = config.get(asset_name.upper(), 'Param_SRC_SYS_CD')
-				    except configparser.NoSectionError:
-				        print('Error: no section: \'{0}\''.format(asset_name.upper()))
-
-				    if key_type is None:
-				        key_condition = ''
-				    else:
-				        key_condition = " and upper(constraint_type) = '{0}'".format(str(key_type).upper())
-
-				    if reference_table_name is None:
-				        reference_condition = ''
-				    else:
-				        reference_condition = " and upper(reference_table_name) = '{0}'".format(str(reference_table_name).upper())
-
-				        # need to find the constraint definition from radar.constraint_columns
-				    print('*'*50)
-				    print('\033[5m looking up constraint definitions... \033[0m')
-				    print('*'*50)
-				    sql_constraint_definition = \
-				        ("select concat_ws('^', constraint_type,\n"
-				         "constraint_name, nvl(cast (case when reference_table_name is null then null else reference_table_name end as string),'NULL'),\n"
-				         "concat_ws(',', collect_set(column_name)),\n"
-				         "nvl(cast (case when concat_ws(',',collect_set(reference_column_name)) is null then null else concat_ws(',',collect_set(reference_column_name)) end as string),\n"
-				         "'NULL')) from radar.constraint_columns where upper(table_schema)='{0}' and upper(table_name)='{1}'{2}{3}\n"
-				         "group by constraint_type, constraint_name, reference_table_name;").format(schema_name.upper(),
-				                                                                                    table_name.upper(), key_condition,
-				                                                                                    reference_condition)
-
-				    res_constraint_definition = create_tmp_file(sql_constraint_definition)
-				    # need to split string to list, the number of elements would be constraint num
-				    list_constraint_definition = res_constraint_definition.split('\n')
-				    # traverse the list
-				    print('*'*50)
-				    print('\033[5m analyzing... \033[0m')
-				    print('*'*50)
-				    concurrency = 3 if len(list_constraint_definition) >= 3 else len(list_constraint_definition)
-				    scale(schema_name, table_name, param_src_sys_cd, list_constraint_definition, concurrency)
-				    run_time = (datetime.datetime.now()-start_time).seconds
-				    hour = run_time // 3600
-				    minute = (run_time - hour * 3600) // 60
-				    second = run_time % 60
-				    print('{0} hours {1} minutes {2} seconds spent on the constraint checking.'.format(hour, minute, second))
-	  except KeyboardInterrupt:
-	  	  print('Error: KeyboardInterrupt, user pressed Ctrl+C!')
+# the last lines of hive stderr kept in the error of a failed query
+HIVE_ERROR_LINES = 5
+# selected before every statement of a script run by execute_each(), to tell the outputs of the statements apart
+STATEMENT_MARKER = 'analyze_constraint.statement '
+
+
+class HiveCliExecutor(object):
+    """ Run each query in a new hive CLI process, this is what the script always did. The process is killed at
+        deadline, a unix time set by the caller. hive starts a JVM and more children, so it runs in a session of its
+        own and the whole process group is killed.
+    """
+
+    def __init__(self):
+        self.deadline = None
+        self.num_queries = 0
+        # compute_stats(..., 'hll') is an estimate
+        self.exact_distinct = False
+        # shared memory of the worker, current[2] is set to the process group of the running query
+        self.current = None
+
+    def execute(self, query):
+        return ''.join(self.iter_lines(query))
+
+    def execute_each(self, list_statement):
+        """ Run independent statements, e.g. metastore lookups of many tables, by one hive process and return the
+            output of each. A statement that fails has no output, the ones after it still run.
+        """
+        list_output = [''] * len(list_statement)
+        script = 'set hive.cli.errors.ignore=true;\n' + ''.join(
+            "select '{0}{1}';\n{2};\n".format(STATEMENT_MARKER, i_statement, statement)
+            for i_statement, statement in enumerate(list_statement))
+        i_statement = None
+        try:
+            for line in self.iter_lines(script):
+                if line.startswith(STATEMENT_MARKER):
+                    i_statement = int(line[len(STATEMENT_MARKER):])
+                elif i_statement is not None:
+                    list_output[i_statement] += line
+        except QueryFailedException as err:
+            print('Warning: {0}'.format(err))
+        return list_output
 
+    def iter_rows(self, query):
+        """ Yield the result rows as hive prints them, a list of column values each, without buffering the output """
+        for line in self.iter_lines(query):
+            yield line.rstrip('\n').split('\t')
+
+    def iter_lines(self, query):
+        """ Yield the lines hive prints, raise QueryFailedException with the end of its stderr if hive fails """
+        self.num_queries += 1
+        with tempfile.NamedTemporaryFile(mode='w+t', dir=os.getcwd(), prefix='analyze_constraint.tmp.',
+                                         delete=False) as file:
+            file.write(query)
+        try:
+            # stderr goes to a file rather than a pipe, a full pipe nobody reads would block hive
+            with tempfile.TemporaryFile(mode='w+t') as stderr:
+                process = subprocess.Popen(['hive', '--config', 'hive-site.xml', '-S', '-f', file.name],
+                                           stdout=subprocess.PIPE, stderr=stderr, universal_newlines=True,
+                                           start_new_session=True)
+                if self.current is not None:
+                    self.current[2] = process.pid
+                try:
+                    with deadline_timer(self.deadline, lambda: kill_process_group(process.pid)):
+                        for line in process.stdout:
+                            yield line
+                        # raised inside the timer, so a query killed at deadline raises JobTimeoutException
+                        if process.wait() != 0:
+                            stderr.seek(0)
+                            list_line = [line.strip() for line in stderr if line.strip()]
+                            raise QueryFailedException(process.returncode, ' '.join(list_line[-HIVE_ERROR_LINES:]))
+                finally:
+                    # the caller may stop reading early, the query is killed then and its exit code means nothing.
+                    # children left behind by hive are killed as well
+                    kill_process_group(process.pid)
+                    process.stdout.close()
+                    process.wait()
+                    if self.current is not None:
+                        self.current[2] = 0
+        finally:
+            os.remove(file.name)
+
+    def close(self):
+        pass
+
+
+def execute_each(executor, list_statement):
+    """
+    This function is to run independent statements one by one in a session, where a statement costs no new process
+    :param executor: query executor keeping a session
+    :param list_statement: list of statements
+    :return: list of the output of every statement, '' if it failed
+    """
+    list_output = []
+    for statement in list_statement:
+        try:
+            list_output.append(executor.execute(statement))
+        except Exception as err:
+            print('Warning: {0} failed ({1})'.format(statement, err))
+            list_output.append('')
+    return list_output
+
+
+class HiveServer2Executor(object):
+    """ Run queries in one long-lived HiveServer2 session, pyhive is required. The running query is cancelled at
+        deadline, a unix time set by the caller.
+    """
+
+    def __init__(self, host, port, username=None, database='default'):
+        from pyhive import hive
+        self.connection = hive.Connection(host=host, port=port, username=username, database=database)
+        self.cursor = self.connection.cursor()
+        self.deadline = None
+        self.num_queries = 0
+        self.exact_distinct = False
+
+    def save_settings(self, list_statement):
+        """ Return the current values of the settings the set statements change, the session outlives the query and
+            restore_settings() puts them back. A setting Hive does not know has no value to go back to and is kept.
+        """
+        dict_setting = collections.OrderedDict()
+        for statement in list_statement:
+            match = re.match(r'set\s+([\w.]+)\s*=', statement, re.IGNORECASE)
+            if match is None or match.group(1) in dict_setting:
+                continue
+            self.cursor.execute('set {0}'.format(match.group(1)))
+            for row in self.cursor.fetchall():
+                name, separator, value = str(row[0]).partition('=')
+                if name == match.group(1) and separator == '=':
+                    dict_setting[name] = value
+        return dict_setting
+
+    def restore_settings(self, dict_setting):
+        for name, value in dict_setting.items():
+            self.cursor.execute('set {0}={1}'.format(name, value))
+
+    def execute(self, query):
+        self.num_queries += 1
+        result = ''
+        list_statement = split_statements(query)
+        dict_setting = self.save_settings(list_statement)
+        try:
+            with deadline_timer(self.deadline, self.cursor.cancel):
+                for statement in list_statement:
+                    self.cursor.execute(statement)
+                    if self.cursor.description is not None:
+                        result = format_rows(self.cursor.fetchall())
+        finally:
+            self.restore_settings(dict_setting)
+        return result
+
+    def execute_each(self, list_statement):
+        """ Run independent statements and return the output of each, a statement that fails has no output """
+        return execute_each(self, list_statement)
+
+    def iter_rows(self, query, fetch_size=1000):
+        """ Yield the result rows of the last statement, a list of column values each, fetch_size rows at a time. The
+            settings of the query are restored once the rows are read or the caller stops reading.
+        """
+        self.num_queries += 1
+        list_statement = split_statements(query)
+        dict_setting = self.save_settings(list_statement)
+        try:
+            with deadline_timer(self.deadline, self.cursor.cancel):
+                for statement in list_statement:
+                    self.cursor.execute(statement)
+                while self.cursor.description is not None:
+                    rows = self.cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield ['NULL' if value is None else str(value) for value in row]
+        finally:
+            self.restore_settings(dict_setting)
+
+    def close(self):
+        try:
+            self.cursor.close()
+        finally:
+            self.connection.close()
+
+
+def find_closing_paren(text, start):
+    """ Return the index of the ')' closing the '(' at start, parentheses in quoted literals are skipped """
+    depth = 0
+    quote = None
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in ('\'', '"'):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError('unbalanced parentheses in {0}'.format(text))
+
+
+def find_enclosing_end(text, start):
+    """ Return the index of the first ')' after start closing a '(' opened before start, len(text) if there is none """
+    depth = 0
+    quote = None
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in ('\'', '"'):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            if depth == 0:
+                return i
+            depth -= 1
+    return len(text)
+
+
+def split_arguments(text):
+    """ Split a function argument list at the commas outside of parentheses and quoted literals """
+    list_argument = []
+    depth = 0
+    quote = None
+    current = ''
+    for char in text:
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in ('\'', '"'):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            list_argument.append(current.strip())
+            current = ''
+            continue
+        current += char
+    list_argument.append(current.strip())
+    return list_argument
+
+
+def rewrite_stack(statement):
+    """
+    This function is to rewrite "select stack(n, ...) as (c1, c2) from t where w" as n selects of t by union all,
+    for engines without stack()
+    :param statement:
+    :return: statement without stack()
+    """
+    pattern = re.compile(r'select stack\(', re.IGNORECASE)
+    match = pattern.search(statement)
+    while match is not None:
+        stack_open = match.end() - 1
+        stack_close = find_closing_paren(statement, stack_open)
+        list_argument = split_arguments(statement[stack_open + 1:stack_close])
+        num_rows = int(list_argument[0])
+        list_value = list_argument[1:]
+        width = len(list_value) // num_rows
+        match_as = re.match(r'\s*as\s*\(', statement[stack_close + 1:], re.IGNORECASE)
+        names_open = stack_close + match_as.end()
+        names_close = find_closing_paren(statement, names_open)
+        list_name = split_arguments(statement[names_open + 1:names_close])
+        end = find_enclosing_end(statement, names_close + 1)
+        rest = statement[names_close + 1:end]
+        list_select = []
+        for i in range(num_rows):
+            list_select.append('select {0}{1}'.format(', '.join(
+                '{0} as {1}'.format(value, name) for value, name in zip(list_value[i * width:(i + 1) * width],
+                                                                        list_name)), rest))
+        statement = statement[:match.start()] + ' union all '.join(list_select) + statement[end:]
+        match = pattern.search(statement)
+    return statement
+
+
+def rewrite_semi_join(statement):
+    """
+    This function is to rewrite "t left semi join ( q )n on ( c ) where w" as "t where exists ( select 1 from ( q ) n
+    where c ) and w", for engines without left semi join
+    :param statement:
+    :return: statement without left semi join
+    """
+    pattern = re.compile(r'left semi join\s*\(', re.IGNORECASE)
+    match = pattern.search(statement)
+    while match is not None:
+        query_open = match.end() - 1
+        query_close = find_closing_paren(statement, query_open)
+        match_on = re.match(r'\s*(\w+)\s+on\s*\(', statement[query_close + 1:], re.IGNORECASE)
+        condition_open = query_close + match_on.end()
+        condition_close = find_closing_paren(statement, condition_open)
+        tail = statement[condition_close + 1:]
+        match_where = re.match(r'\s*where\s', tail, re.IGNORECASE)
+        if match_where is not None:
+            tail = ' and ' + tail[match_where.end():]
+        statement = '{0}where exists ( select 1 from {1} {2} where {3} ){4}'.format(
+            statement[:match.start()], statement[query_open:query_close + 1], match_on.group(1),
+            statement[condition_open:condition_close + 1], tail)
+        match = pattern.search(statement)
+    return statement
+
+
+def rewrite_function(statement, name, format_call):
+    """ Replace every call of a function by format_call(list of arguments) """
+    pattern = re.compile(r'\b{0}\('.format(name), re.IGNORECASE)
+    match = pattern.search(statement)
+    while match is not None:
+        close = find_closing_paren(statement, match.end() - 1)
+        statement = statement[:match.start()] + format_call(split_arguments(statement[match.end():close])) + \
+            statement[close + 1:]
+        match = pattern.search(statement, match.start() + 1)
+    return statement
+
+
+def translate_statement(statement, dialect):
+    """
+    This function is to translate a statement built for Hive to duckdb or sqlite
+    :param statement: one Hive statement
+    :param dialect: 'duckdb' or 'sqlite'
+    :return: translated statement, None if it has no meaning outside Hive, e.g. set
+    """
+    if re.match(r'set\s', statement, re.IGNORECASE):
+        return None
+    explain = ''
+    if re.match(r'explain\s', statement, re.IGNORECASE):
+        explain = 'explain query plan ' if dialect == 'sqlite' else 'explain '
+        statement = statement[len('explain '):]
+    aggregate = 'group_concat(distinct {0})' if dialect == 'sqlite' else "string_agg(distinct {0}, ',')"
+    statement = re.sub(r"concat_ws\(\s*','\s*,\s*collect_set\(([^()]*)\)\)",
+                       lambda match: aggregate.format(match.group(1)), statement)
+    statement = re.sub(r'\bnvl\(', 'coalesce(', statement, flags=re.IGNORECASE)
+    statement = rewrite_function(statement, 'compute_stats', lambda list_argument: (
+        'count(distinct {0})' if dialect == 'sqlite' else 'approx_count_distinct({0})').format(list_argument[0]))
+    statement = re.sub(r'\.numdistinctvalues\b', '', statement, flags=re.IGNORECASE)
+    # a regular expression in a Hive literal has its backslashes escaped, not in duckdb or sqlite
+    statement = re.sub(r"(upper\(\w+\)) rlike '([^']*)'", lambda match: (
+        "{0} regexp '{1}'" if dialect == 'sqlite' else "regexp_full_match({0}, '{1}')").format(
+            match.group(1), match.group(2).replace('\\\\', '\\')), statement)
+    statement = statement.replace('<=>', ' is ' if dialect == 'sqlite' else ' is not distinct from ')
+    statement = statement.replace("from_unixtime(unix_timestamp(),'yyyy-MM-dd HH:mm:ss')",
+                                  "strftime('%Y-%m-%d %H:%M:%S', 'now')" if dialect == 'sqlite'
+                                  else "strftime(now(), '%Y-%m-%d %H:%M:%S')")
+    if dialect == 'sqlite':
+        statement = re.sub(r'\bas string\)', 'as text)', statement, flags=re.IGNORECASE)
+    statement = rewrite_semi_join(rewrite_stack(statement))
+    return explain + statement
+
+
+def sqlite_concat_ws(separator, *values):
+    return separator.join(str(value) for value in values if value is not None)
+
+
+class LocalExecutor(object):
+    """ Run queries in process over local extracts, <data_dir>/<schema>/<table>.parquet or .csv (or
+        <data_dir>/<schema>.<table>.csv), by duckdb if it is installed, otherwise by sqlite3 which reads CSV only
+        unless pyarrow is installed. Hive SQL is translated by translate_statement(), all columns are read as
+        strings and empty CSV fields as NULL. The constraint definitions are read from radar/constraint_columns.csv.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.deadline = None
+        self.num_queries = 0
+        self.set_loaded = set()
+        try:
+            import duckdb
+            self.dialect = 'duckdb'
+            self.connection = duckdb.connect()
+        except ImportError:
+            self.dialect = 'sqlite'
+            self.connection = sqlite3.connect(':memory:', check_same_thread=False)
+            self.connection.create_function('concat_ws', -1, sqlite_concat_ws)
+            self.connection.create_function('regexp', 2, lambda pattern, value: value is not None and
+                                            re.search(pattern, value) is not None)
+        # compute_stats(..., 'hll') becomes count(distinct) in sqlite, approx_count_distinct() in duckdb
+        self.exact_distinct = self.dialect == 'sqlite'
+
+    def find_file(self, schema_name, table_name):
+        """ Path of the extract of a table, names are matched case insensitive, None if there is none """
+        list_candidate = [(self.data_dir, '{0}.{1}'.format(schema_name, table_name))]
+        for name in os.listdir(self.data_dir):
+            if name.lower() == schema_name.lower() and os.path.isdir(os.path.join(self.data_dir, name)):
+                list_candidate.append((os.path.join(self.data_dir, name), table_name))
+        for directory, base_name in list_candidate:
+            for name in sorted(os.listdir(directory)):
+                root, extension = os.path.splitext(name)
+                if root.lower() == base_name.lower() and extension.lower() in ('.parquet', '.csv'):
+                    return os.path.join(directory, name)
+        return None
+
+    def load_table(self, schema_name, table_name):
+        key = (schema_name.lower(), table_name.lower())
+        if key in self.set_loaded:
+            return
+        path = self.find_file(schema_name, table_name)
+        if path is None:
+            raise IOError('no extract of {0}.{1} in {2}'.format(schema_name, table_name, self.data_dir))
+        if self.dialect == 'duckdb':
+            self.connection.execute('create schema if not exists {0}'.format(schema_name))
+            if path.lower().endswith('.parquet'):
+                source = "read_parquet('{0}')".format(path)
+            else:
+                source = "read_csv_auto('{0}', header=true, all_varchar=true)".format(path)
+            self.connection.execute('create view {0}.{1} as select * from {2}'.format(schema_name, table_name,
+                                                                                      source))
+        else:
+            if schema_name.lower() not in [row[1].lower() for row in self.connection.execute('pragma database_list')]:
+                self.connection.execute("attach database ':memory:' as {0}".format(schema_name))
+            if path.lower().endswith('.parquet'):
+                import pyarrow.parquet
+                table = pyarrow.parquet.read_table(path)
+                list_column = table.column_names
+                list_row = [[None if value is None else str(value) for value in row.values()]
+                            for row in table.to_pylist()]
+            else:
+                with open(path, newline='') as file:
+                    reader = csv.reader(file)
+                    list_column = next(reader)
+                    list_row = [[None if value == '' else value for value in row] for row in reader]
+            self.connection.execute('create table {0}.{1} ( {2} )'.format(
+                schema_name, table_name, ', '.join('{0} text'.format(column) for column in list_column)))
+            self.connection.executemany('insert into {0}.{1} values ( {2} )'.format(
+                schema_name, table_name, ', '.join('?' for column in list_column)), list_row)
+        self.set_loaded.add(key)
+
+    def run(self, statement):
+        """ Run one Hive statement, return the cursor, None if the statement was skipped """
+        for schema_name, table_name in re.findall(r'\b(?:from|join|tblproperties)\s+(\w+)\.(\w+)', statement,
+                                                  re.IGNORECASE):
+            self.load_table(schema_name, table_name)
+        match = re.match(r'show tblproperties (\w+)\.(\w+)', statement, re.IGNORECASE)
+        if match is not None:
+            # the size of the extract and the row count stand in for the table statistics
+            return self.connection.execute(
+                "select 'totalSize', {0} union all select 'numRows', count(1) from {1}.{2}".format(
+                    os.path.getsize(self.find_file(match.group(1), match.group(2))), match.group(1),
+                    match.group(2)))
+        if re.match(r'(show|describe)\s', statement, re.IGNORECASE):
+            return None
+        statement = translate_statement(statement, self.dialect)
+        if statement is None:
+            return None
+        return self.connection.execute(statement)
+
+    def execute(self, query):
+        self.num_queries += 1
+        result = ''
+        with deadline_timer(self.deadline, self.connection.interrupt):
+            for statement in split_statements(query):
+                cursor = self.run(statement)
+                if cursor is not None and cursor.description is not None:
+                    result = format_rows(cursor.fetchall())
+        return result
+
+    def execute_each(self, list_statement):
+        """ Run independent statements and return the output of each, a statement that fails has no output """
+        return execute_each(self, list_statement)
+
+    def iter_rows(self, query, fetch_size=1000):
+        """ Yield the result rows of the last statement, a list of column values each, fetch_size rows at a time """
+        self.num_queries += 1
+        with deadline_timer(self.deadline, self.connection.interrupt):
+            cursor = None
+            for statement in split_statements(query):
+                cursor = self.run(statement)
+            while cursor is not None and cursor.description is not None:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield ['NULL' if value is None else str(value) for value in row]
+
+    def close(self):
+        self.connection.close()
+
+
+def create_executor(config):
+    """
+    This function is to create a query executor as defined in config, hs2 falls back to hive CLI if it is not available
+    :param config: ExecutorConfig
+    :return: executor object which has execute(query) and close()
+    """
+    if config.backend == 'local':
+        return LocalExecutor(config.data_dir)
+    if config.backend == 'hs2':
+        try:
+            return HiveServer2Executor(config.host, config.port, config.username, config.database)
+        except Exception as err:
+            print('Warning: HiveServer2 {0}:{1} is not available ({2}), falling back to hive CLI'.format(
+                config.host, config.port, err))
+    return HiveCliExecutor()
+
+
+class SessionPool(object):
+    """ Keep executor sessions open and hand them out to jobs, so a session is created once rather than per query.
+        Sessions can not be shared between OS processes, every worker process owns a pool.
+    """
+
+    def __init__(self, config, size=1, tracer=None):
+        self.config = config
+        self.size = size
+        self.tracer = tracer
+        self.idle = []
+        self.created = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while not self.idle and self.created >= self.size:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.created += 1
+        try:
+            if self.tracer is None:
+                return create_executor(self.config)
+            with self.tracer.span('connect', 'session', backend=self.config.backend):
+                return create_executor(self.config)
+        except Exception:
+            with self.condition:
+                self.created -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, executor, broken=False):
+        with self.condition:
+            if broken:
+                # drop the session, next acquire() will open a new one
+                self.created -= 1
+            else:
+                self.idle.append(executor)
+            self.condition.notify()
+        if broken:
+            try:
+                executor.close()
+            except Exception:
+                pass
+
+    @contextlib.contextmanager
+    def session(self):
+        executor = self.acquire()
+        try:
+            yield executor
+        except Exception:
+            self.release(executor, broken=True)
+            raise
+        else:
+            self.release(executor)
+
+    def close(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.created -= len(idle)
+        for executor in idle:
+            executor.close()
+
+
+# ----------------end region----------------
+
+
+def parse_args():
+    """
+    This function is to parse use entered arguments, of which -table (or -table-list-file) and -asset is required,
+    -key and -rfnc is optional
+    :return: argparse.Namespace with below attributes
+        list_table_pattern: schema.table names, the table name could be a glob like radar_rz.*
+        asset
+        key(optional)
+        reference(optional)
+        fuse, batch_fk, mapjoin_rows(optional)
+        priority, table_concurrency(optional): how jobs of many tables are scheduled
+        plan, explain(optional): print the jobs and queries without running them
+        metrics(optional): JSON file to write the run summary to
+        save_results, results_table, staging_format, results_file(optional): where the issue rows are saved
+        resume, job_timeout, retries, retry_backoff(optional): how failed and interrupted jobs are handled
+        cache_file, cache_ttl, no_cache(optional): local cache of constraint definitions
+        incremental, watermark_column, full, full_every_days(optional): check only rows loaded since the last run
+        concurrency, min_concurrency, max_concurrency, yarn_rm_url, yarn_queue(optional): how many jobs run in
+            parallel, fixed if concurrency is given, otherwise adjusted between min and max
+        backend, hs2_host, hs2_port, hs2_user, local_dir(optional): query executor settings
+        work_dir, env_file, src_sys_cd(optional): where the script runs and how the source system is found
+    """
+    parser = argparse.ArgumentParser()
+    group_table = parser.add_mutually_exclusive_group(required=True)
+    group_table.add_argument('-t', '--table', help='table name to be analyzed, schema.* or a glob for many tables',
+                             type=str)
+    group_table.add_argument('-l', '--table-list-file', help='file with one table name or glob per line', type=str)
+    parser.add_argument('-s', '--asset', help='asset name the table belongs to', required=True, type=str)
+    parser.add_argument('-k', '--key', help='specify constraint key type', required=False, type=str)
+    parser.add_argument('-r', '--reference', help='specify constraint reference table', required=False, type=str)
+    parser.add_argument('--fuse', help='check all PK/UK/NULL constraints of the table in a single scan',
+                        required=False, action='store_true')
+    parser.add_argument('--batch-fk', help='check FK constraints sharing a reference table in one anti join',
+                        required=False, action='store_true')
+    parser.add_argument('--mapjoin-rows', help='broadcast reference tables with at most this number of rows '
+                                               'in batched FK checks, 0 to disable',
+                        required=False, type=int, default=0)
+    parser.add_argument('--sample-size', help='the max number of issue rows shown per constraint',
+                        required=False, type=int, default=10)
+    parser.add_argument('--prescreen', help='skip the exact PK/UK check when an estimate of the distinct keys shows '
+                                            'no duplicate, stats reads the metastore column statistics and falls '
+                                            'back to hll', required=False, type=str, choices=['hll', 'stats'],
+                        default=None)
+    parser.add_argument('--prescreen-tolerance', help='how far below the row count an approximate distinct key '
+                                                      'estimate may be and still be taken as no duplicate, a '
+                                                      'duplicate rate below it is never checked exactly',
+                        required=False, type=float, default=0.0)
+    parser.add_argument('--priority', help='which tables go first, size reads the bytes stored from table statistics '
+                                           'in one lookup, constraints counts the constraints of a table',
+                        required=False, type=str, choices=['constraints', 'size'], default='size')
+    parser.add_argument('--table-concurrency', help='the max number of jobs of one table in parallel',
+                        required=False, type=int, default=2)
+    parser.add_argument('--metrics', help='write job timings summarized per table and constraint type to this '
+                                          'JSON file', required=False, type=str, default=None)
+    parser.add_argument('--trace', help='write spans of the lookup, every job, stage and query to this Chrome trace '
+                                        'JSON file, open it in chrome://tracing or Perfetto',
+                        required=False, type=str, default=None)
+    parser.add_argument('--no-progress', help='do not show the progress line of jobs done, in flight and ETA',
+                        required=False, action='store_true')
+    parser.add_argument('--resume', help='skip the constraints the last interrupted or failed run already checked',
+                        required=False, action='store_true')
+    parser.add_argument('--job-timeout', help='seconds a job may run before its query is killed, 0 for no limit',
+                        required=False, type=int, default=DEFAULT_JOB_TIMEOUT_SECONDS)
+    parser.add_argument('--retries', help='how often a failed job is run again', required=False, type=int,
+                        default=2)
+    parser.add_argument('--retry-backoff', help='seconds to wait before the first retry, doubled for every retry',
+                        required=False, type=int, default=30)
+    parser.add_argument('--plan', help='print the jobs with their queries and the bytes they scan, without running '
+                                       'them', required=False, action='store_true')
+    parser.add_argument('--explain', help='with --plan, print the Hive plan of every query, the queries are compiled '
+                                          'but not run', required=False, action='store_true')
+    parser.add_argument('--save-results', help='append the issue rows and the clean checks of the run to the results '
+                                               'table in one load', required=False, action='store_true')
+    parser.add_argument('--results-table', help='Hive table the issue rows are loaded into, partitioned by '
+                                                'src_sys_cd and table_name', required=False, type=str,
+                        default='radar.constraints')
+    parser.add_argument('--staging-format', help='format of the file the issue rows are loaded from, parquet needs '
+                                                 'pyarrow', required=False, type=str, choices=['text', 'parquet'],
+                        default='text')
+    parser.add_argument('--results-file', help='append the job results and issue rows to this JSON lines file',
+                        required=False, type=str, default=None)
+    parser.add_argument('-c', '--concurrency', help='fixed number of jobs in parallel, overrides adaptive concurrency',
+                        required=False, type=int, default=None)
+    parser.add_argument('--min-concurrency', help='the min number of jobs in parallel', required=False, type=int,
+                        default=1)
+    parser.add_argument('--max-concurrency', help='the max number of jobs in parallel', required=False, type=int,
+                        default=6)
+    parser.add_argument('--yarn-rm-url', help='YARN ResourceManager url, e.g. http://rm:8088, to adjust concurrency '
+                                              'by queue utilization', required=False, type=str, default=None)
+    parser.add_argument('--yarn-queue', help='YARN queue the Hive jobs run in', required=False, type=str,
+                        default='default')
+    parser.add_argument('--cache-file', help='SQLite file caching constraint definitions, relative to the work '
+                                             'directory', required=False, type=str,
+                        default='.analyze_constraint_cache.db')
+    parser.add_argument('--cache-ttl', help='seconds a cached constraint definition is valid', required=False,
+                        type=int, default=86400)
+    parser.add_argument('--no-cache', help='always look up constraint definitions from radar.constraint_columns',
+                        required=False, action='store_true')
+    parser.add_argument('--incremental', help='check only rows loaded since the last check of each constraint, '
+                                              'watermarks are kept in the cache file',
+                        required=False, action='store_true')
+    parser.add_argument('--watermark-column', help='column tracking new rows, e.g. the load date partition column',
+                        required=False, type=str, default='RADAR_UPD_TS')
+    parser.add_argument('--full', help='in incremental mode, check all rows and reset the watermarks',
+                        required=False, action='store_true')
+    parser.add_argument('--full-every-days', help='in incremental mode, check all rows again when the last full check '
+                                                  'is older than this', required=False, type=float, default=None)
+    parser.add_argument('--backend', help='query executor, hs2 falls back to cli when HiveServer2 is unreachable, '
+                                          'local reads the extracts in --local-dir', required=False, type=str,
+                        choices=['cli', 'hs2', 'local'], default=None)
+    parser.add_argument('--local-dir', help='directory of <schema>/<table>.parquet or .csv extracts for the local '
+                                            'backend, radar/constraint_columns.csv included', required=False,
+                        type=str, default=None)
+    parser.add_argument('--work-dir', help='directory the queries run in, where hive-site.xml is',
+                        required=False, type=str, default='/home/radamgr')
+    parser.add_argument('--env-file', help='file with the Param_SRC_SYS_CD of every asset', required=False, type=str,
+                        default='/home/radamgr/apps/Code/sh/radar_hadoop.env')
+    parser.add_argument('--src-sys-cd', help='source system code, instead of looking it up in --env-file',
+                        required=False, type=str, default=None)
+    parser.add_argument('--hs2-host', help='HiveServer2 host', required=False, type=str,
+                        default=os.environ.get('HIVESERVER2_HOST'))
+    parser.add_argument('--hs2-port', help='HiveServer2 port', required=False, type=int, default=10000)
+    parser.add_argument('--hs2-user', help='HiveServer2 user name', required=False, type=str, default=None)
+    args = parser.parse_args()
+    if args.backend is None:
+        args.backend = 'cli' if args.hs2_host is None else 'hs2'
+    if args.backend == 'local':
+        if args.local_dir is None:
+            parser.error('--local-dir is required by the local backend')
+        args.local_dir = os.path.abspath(args.local_dir)
+    # main() changes the work directory, so keep the paths relative to where the script is started
+    if args.metrics is not None:
+        args.metrics = os.path.abspath(args.metrics)
+    if args.results_file is not None:
+        args.results_file = os.path.abspath(args.results_file)
+    if args.trace is not None:
+        args.trace = os.path.abspath(args.trace)
+
+    if args.table is not None:
+        list_table = [args.table]
+    else:
+        with open(args.table_list_file) as file:
+            list_table = [line.strip() for line in file if line.strip() != '' and not line.startswith('#')]
+    args.list_table_pattern = []
+    for table in list_table:
+        if table.find('.') == -1:
+            raise ArgumentErrorException(table)
+        else:
+            args.list_table_pattern.append((table.split('.')[0], table.split('.')[1]))
+    return args
+
+
+def glob_to_regex(pattern):
+    """
+    This function is to convert a table name glob to a regular expression for rlike
+    :param pattern: name with * and ? wildcards
+    :return: anchored regular expression, escaped for a Hive string literal
+    """
+    regex = ''
+    for char in pattern.upper():
+        if char == '*':
+            regex += '.*'
+        elif char == '?':
+            regex += '.'
+        else:
+            regex += re.escape(char)
+    return '^{0}$'.format(regex).replace('\\', '\\\\')
+
+
+def build_constraint_definition_query(list_table_pattern):
+    """
+    This function is to build one query looking up the constraint definitions of all tables from
+    radar.constraint_columns, -key and -rfnc are applied by filter_constraint_definition() so the result can be cached
+    :param list_table_pattern: list of (schema_name, table_name), either may be a glob
+    :return: query returning lines like 'RADAR_RZ^ADDR^f^FK1_ADDR^CTRY_CTY^CTRY_CTY_ID,SRC_SYS_CD^CTRY_CTY_ID,SRC_SYS_CD'
+    """
+    list_condition = []
+    for schema_name, table_name in list_table_pattern:
+        list_name_condition = []
+        for column, name in (('table_schema', schema_name), ('table_name', table_name)):
+            if name.find('*') == -1 and name.find('?') == -1:
+                list_name_condition.append("upper({0})='{1}'".format(column, name.upper()))
+            else:
+                list_name_condition.append("upper({0}) rlike '{1}'".format(column, glob_to_regex(name)))
+        list_condition.append('( {0} )'.format(' and '.join(list_name_condition)))
+
+    return ("select concat_ws('^', table_schema, table_name, constraint_type,\n"
+            "constraint_name, nvl(cast (case when reference_table_name is null then null else reference_table_name end as string),'NULL'),\n"
+            "concat_ws(',', collect_set(column_name)),\n"
+            "nvl(cast (case when concat_ws(',',collect_set(reference_column_name)) is null then null else concat_ws(',',collect_set(reference_column_name)) end as string),\n"
+            "'NULL')) from radar.constraint_columns where ( {0} )\n"
+            "group by table_schema, table_name, constraint_type, constraint_name, reference_table_name;").format(
+                ' or '.join(list_condition))
+
+
+def split_constraint_definition(res_constraint_definition):
+    """
+    This function is to split the looked up constraint definitions by table
+    :param res_constraint_definition: output of build_constraint_definition_query()
+    :return: OrderedDict of (schema_name, table_name) to list of constraint definitions
+    """
+    dict_constraint_definition = collections.OrderedDict()
+    for line in res_constraint_definition.split('\n'):
+        if line.strip() != '':
+            arr_line = line.split('^', 2)
+            dict_constraint_definition.setdefault((arr_line[0], arr_line[1]), []).append(arr_line[2])
+    return dict_constraint_definition
+
+
+def filter_constraint_definition(dict_constraint_definition, key_type=None, reference_table_name=None):
+    """
+    This function is to keep the constraint definitions matching -key and -rfnc
+    :param dict_constraint_definition: (schema_name, table_name) to list of constraint definitions
+    :param key_type: constraint type filter(optional)
+    :param reference_table_name: reference table filter(optional)
+    :return: OrderedDict of (schema_name, table_name) to list of constraint definitions, tables left without
+        constraints are dropped
+    """
+    dict_filtered = collections.OrderedDict()
+    for key, list_constraint_definition in dict_constraint_definition.items():
+        for item in list_constraint_definition:
+            arr_itm = item.split('^')
+            if key_type is not None and arr_itm[0].upper() != str(key_type).upper():
+                continue
+            if reference_table_name is not None and arr_itm[2].upper() != str(reference_table_name).upper():
+                continue
+            dict_filtered.setdefault(key, []).append(item)
+    return dict_filtered
+
+
+def match_table_pattern(table_pattern, schema_name, table_name):
+    """
+    This function is to check whether a table matches a schema.table glob, case insensitive
+    :param table_pattern: (schema_name, table_name), either may be a glob
+    :param schema_name:
+    :param table_name:
+    :return: bool
+    """
+    return fnmatch.fnmatchcase(schema_name.upper(), table_pattern[0].upper()) and \
+        fnmatch.fnmatchcase(table_name.upper(), table_pattern[1].upper())
+
+
+def lookup_constraint_definition(list_table_pattern, session_pool, cache=None):
+    """
+    This function is to get the constraint definitions of all tables, from the cache if it is still valid, the tables
+    missing in the cache are looked up from radar.constraint_columns by one query
+    :param list_table_pattern: list of (schema_name, table_name), either may be a glob
+    :param session_pool: SessionPool to run the lookup with
+    :param cache: ConstraintDefinitionCache(optional)
+    :return: OrderedDict of (schema_name, table_name) to list of constraint definitions
+    """
+    dict_constraint_definition = collections.OrderedDict()
+    list_missing = list(list_table_pattern)
+    with session_pool.session() as executor:
+        if cache is not None:
+            source_modified_time = get_table_modified_time(executor, 'radar', 'constraint_columns')
+            list_missing = []
+            for table_pattern in list_table_pattern:
+                dict_cached = cache.get(table_pattern, source_modified_time)
+                if dict_cached is None:
+                    list_missing.append(table_pattern)
+                else:
+                    dict_constraint_definition.update(dict_cached)
+        if list_missing:
+            dict_looked_up = split_constraint_definition(
+                executor.execute(build_constraint_definition_query(list_missing)))
+            dict_constraint_definition.update(dict_looked_up)
+            if cache is not None:
+                for table_pattern in list_missing:
+                    cache.put(table_pattern, source_modified_time, collections.OrderedDict(
+                        (key, value) for key, value in dict_looked_up.items()
+                        if match_table_pattern(table_pattern, key[0], key[1])))
+    return dict_constraint_definition
+
+
+def get_table_priority(dict_constraint_definition, priority, session_pool, dict_table_size=None):
+    """
+    This function is to rank tables for the scheduler, the larger the table the higher the priority
+    :param dict_constraint_definition: (schema_name, table_name) to list of constraint definitions
+    :param priority: 'size' for the bytes stored, 'constraints' for the number of constraints
+    :param session_pool: SessionPool to read table statistics with
+    :param dict_table_size: the sizes of get_table_sizes() if they were read already(optional)
+    :return: dict of (schema_name, table_name) to priority
+    """
+    dict_table_priority = {}
+    if priority == 'size':
+        if dict_table_size is None:
+            with session_pool.session() as executor:
+                dict_table_size = get_table_sizes(executor, list(dict_constraint_definition))
+        for key, table_size in dict_table_size.items():
+            dict_table_priority[key] = table_size or 0
+    else:
+        for key, list_constraint_definition in dict_constraint_definition.items():
+            dict_table_priority[key] = len(list_constraint_definition)
+    return dict_table_priority
+
+
+def output_data(rows):
+    """
+    This function is to output issue data as an appropriate format, rows are printed as they arrive
+    :param rows: iterable of column value lists
+    :return: number of rows printed
+    """
+    num_rows = 0
+    for row in rows:
+        if num_rows == 0:
+            print('Column Values   | {0}'.format(row))
+        else:
+            print('                | {0}'.format(row))
+        num_rows += 1
+    return num_rows
+
+
+def format_columns(list_keys, alias='t.'):
+    """
+    This function is to cast key columns to string and keep NULL visible
+    :param list_keys: column names
+    :param alias: prefix of the column names
+    :return: list of column expressions
+    """
+    list_formatted = []
+    for key in list_keys:
+        list_formatted.append("nvl(cast (case when {0}{1} is null then null else {0}{1} end as string),'NULL')".format(
+            alias, key))
+    return list_formatted
+
+
+def format_null_columns(list_keys):
+    """
+    This function is to format not null columns for output, RADAR_UPD_TS is replaced by the current timestamp
+    :param list_keys: column names
+    :return: list of column expressions
+    """
+    list_formatted = []
+    for key in list_keys:
+        if key == 'RADAR_UPD_TS':
+            list_formatted.append(
+                "case when RADAR_UPD_TS is null then 'NULL' else from_unixtime(unix_timestamp(),'yyyy-MM-dd HH:mm:ss') end")
+        else:
+            list_formatted.append("nvl(cast (case when {0} is null then null else {0} end as string),'NULL')".format(key))
+    return list_formatted
+
+
+def pad_columns(list_column, width):
+    """
+    This function is to pad column expressions with NULL, union all branches need the same number of columns
+    :param list_column: column expressions
+    :param width: number of columns wanted
+    :return: list of column expressions
+    """
+    return list_column + ['cast(null as string)'] * (width - len(list_column))
+
+
+def build_range_predicate(watermark_range, alias=''):
+    """
+    This function is to build the predicate of the rows loaded after the watermark. A row without watermark can not
+    be told new or old, it is taken as new by every incremental check, so a NULL in it is found as well
+    :param watermark_range: (watermark column, last checked watermark, new watermark)
+    :param alias: prefix of the watermark column
+    :return: predicate in brackets
+    """
+    column, low, high = watermark_range
+    return "( {0}{1} > '{2}' and {0}{1} <= '{3}' or {0}{1} is null )".format(alias, column, low, high)
+
+
+def build_range_condition(watermark_range, alias=''):
+    """
+    This function is to build the filter of the rows loaded after the watermark
+    :param watermark_range: (watermark column, last checked watermark, new watermark)
+    :param alias: prefix of the watermark column
+    :return: condition starting with ' and ', empty if watermark_range is None
+    """
+    if watermark_range is None:
+        return ''
+    return ' and ' + build_range_predicate(watermark_range, alias)
+
+
+def build_check_query(schema_name, table_name, param_src_sys_cd, constraint, watermark_range=None, sample_size=10):
+    """
+    This function is to build the query checking one constraint
+    :param schema_name:
+    :param table_name:
+    :param param_src_sys_cd:
+    :param constraint: Constraint
+    :param watermark_range: (watermark column, last checked watermark, new watermark) to check only the rows loaded
+        in between, PK/UK keys of those rows are semi joined to the whole table(optional)
+    :param sample_size: the max number of issue rows returned
+    :return: query returning one row per issue with a column per key, None if the constraint can not be checked
+    """
+    constraint_type = constraint.constraint_type
+    reference_keys = constraint.reference_keys
+    reference_table_name = constraint.reference_table_name
+    arr_reference_keys = reference_keys.split(',')
+
+    if constraint_type in ('p', 'u') and watermark_range is not None:
+        # only keys of the new rows can be duplicated by the new rows, group by the rows having those keys
+        old_column_name = ','.join('o.{0}'.format(key) for key in arr_reference_keys)
+        semi_join_condition = ' and '.join('o.{0} <=> n.{0}'.format(key) for key in arr_reference_keys)
+        sql_new_key = "select distinct {0} from {1}.{2} where SRC_SYS_CD='{3}'{4}".format(
+            reference_keys, schema_name, table_name, param_src_sys_cd, build_range_condition(watermark_range))
+        sql_check = \
+            ("select {0} from ( select {1} "
+             "from {2}.{3} o left semi join ( {4} )n on ( {5} ) where o.SRC_SYS_CD='{6}' group by {1} "
+             "having count(1) > 1 )t limit {7}").format(','.join(format_columns(arr_reference_keys)),
+                                                        old_column_name, schema_name, table_name, sql_new_key,
+                                                        semi_join_condition, param_src_sys_cd, sample_size)
+    elif constraint_type in ('p', 'u'):
+        # f^FK1_ADDR^CTRY_CTY^CTRY_CTY_ID,SRC_SYS_CD^CTRY_CTY_ID,SRC_SYS_CD
+        # need to separate fields and re-arrange
+        sql_check = \
+            ("select {0} from ( select {1} "
+             "from {2}.{3} where SRC_SYS_CD='{4}' group by {1} "
+             "having count(1) > 1 )t limit {5}").format(','.join(format_columns(arr_reference_keys)), reference_keys,
+                                                        schema_name, table_name, param_src_sys_cd, sample_size)
+    elif constraint_type == 'n':
+        null_condition = ' or '.join('{0}.{1} is null'.format(table_name, key) for key in arr_reference_keys)
+        nk_list_formatted = ','.join(format_null_columns(arr_reference_keys))
+        range_condition = build_range_condition(watermark_range)
+        sql_check = \
+            ("select distinct {0} "
+             "from {1}.{2} where SRC_SYS_CD='{3}' and ( {4} ){5} limit {6}").format(nk_list_formatted, schema_name,
+                                                                                  table_name, param_src_sys_cd,
+                                                                                  null_condition, range_condition,
+                                                                                  sample_size)
+    elif constraint_type == 'f':
+        if table_name.upper() == reference_table_name.upper():
+            return None
+        arr_reference_columns = constraint.reference_column_name.split(',')
+        join_condition = ' and '.join("{0}.{1}={2}.{3}".format(table_name, key, reference_table_name,
+                                                               arr_reference_columns[i_field])
+                                      for i_field, key in enumerate(arr_reference_keys))
+        null_condition = ' and '.join('{0}.{1} is not null'.format(table_name, key) for key in arr_reference_keys)
+        source_column_name = ','.join("{0}.{1}".format(table_name, key) for key in arr_reference_keys)
+        rfnc_column_name = ','.join("{0}.{1}".format(reference_table_name, column) for column in arr_reference_columns)
+        # only the rows loaded after the watermark are checked, the reference table is always read in full
+        null_condition += build_range_condition(watermark_range, '{0}.'.format(table_name))
+
+        sql_check = \
+            ("select {0} from ( "
+             "select distinct {1} from {2}.{3} where not exists ( select distinct {4} from {2}.{5} "
+             "where {5}.SRC_SYS_CD='{6}' and {7} ) "
+             " and {8} and {3}.SRC_SYS_CD='{6}' )t limit {9}").format(','.join(format_columns(arr_reference_keys)),
+                                                                      source_column_name, schema_name, table_name,
+                                                                      rfnc_column_name, reference_table_name,
+                                                                      param_src_sys_cd, join_condition,
+                                                                      null_condition, sample_size)
+    else:
+        return None
+    return sql_check
+
+
+def build_fused_query(schema_name, table_name, param_src_sys_cd, list_constraint, sample_size=10,
+                      watermark_range=None):
+    """
+    This function is to build one query checking all PK/UK/NULL constraints of a table. The table is read once into a
+    materialized CTE, duplicate keys are checked by one group by per key over it, NULL samples of all NOT NULL
+    constraints are taken in one pass with stack().
+    :param schema_name:
+    :param table_name:
+    :param param_src_sys_cd:
+    :param list_constraint: list of Constraint of type 'p', 'u' or 'n'
+    :param sample_size: the max number of issue rows returned per constraint
+    :param watermark_range: (watermark column, last checked watermark, new watermark) to check only the rows loaded
+        in between, a duplicate key is found if one of its rows is new(optional)
+    :return: query returning rows of constraint name and a column per key, padded with NULL
+    """
+    has_key = any(constraint.constraint_type in ('p', 'u') for constraint in list_constraint)
+    base_condition = ''
+    new_condition = ''
+    having_condition = ''
+    list_flag = []
+    if watermark_range is not None and has_key:
+        # duplicates of a new key can be old rows, the whole table is read and is_new flags the new rows
+        list_flag.append('case when {0} then 1 else 0 end as is_new'.format(build_range_predicate(watermark_range)))
+        new_condition = 'is_new = 1 and '
+        having_condition = ' and max(is_new) = 1'
+    else:
+        base_condition = build_range_condition(watermark_range)
+    list_column = []
+    list_branch = []
+    list_stack = []
+    list_null_condition = []
+    width = max(len(constraint.reference_keys.split(',')) for constraint in list_constraint)
+    list_value = ['v{0}'.format(i_field) for i_field in range(1, width + 1)]
+    for constraint in list_constraint:
+        arr_reference_keys = constraint.reference_keys.split(',')
+        for key in arr_reference_keys:
+            if key not in list_column:
+                list_column.append(key)
+        if constraint.constraint_type in ('p', 'u'):
+            list_select = pad_columns(format_columns(arr_reference_keys), width)
+            list_branch.append(
+                ("select A.constraint_name, {0} from ( select '{1}' as constraint_name, {2} from ( select {3} "
+                 "from base group by {3} having count(1) > 1{4} )t limit {5} )A").format(
+                    ', '.join('A.{0}'.format(value) for value in list_value), constraint.constraint_name,
+                    ', '.join('{0} as {1}'.format(column, value) for column, value in zip(list_select, list_value)),
+                    constraint.reference_keys, having_condition, sample_size))
+        else:
+            null_condition = ' or '.join('{0} is null'.format(key) for key in arr_reference_keys)
+            list_null_condition.append(null_condition)
+            list_stack.append(', '.join(["case when {0} then '{1}' end".format(null_condition,
+                                                                                 constraint.constraint_name)] +
+                                        ['case when {0} then {1} end'.format(null_condition, column) for column in
+                                         format_null_columns(arr_reference_keys)] +
+                                        pad_columns([], width - len(arr_reference_keys))))
+    if list_stack:
+        list_branch.append(
+            ("select N.constraint_name, {0} from ( select X.*, row_number() over "
+             "(partition by X.constraint_name order by {1}) as rn from ( select distinct S.* from "
+             "( select stack({2}, {3}) as (constraint_name, {4}) from base where {5}( {6} ) )S "
+             "where S.constraint_name is not null )X )N where N.rn <= {7}").format(
+                ', '.join('N.{0}'.format(value) for value in list_value),
+                ', '.join('X.{0}'.format(value) for value in list_value), len(list_stack), ', '.join(list_stack),
+                ', '.join(list_value), new_condition,
+                ' or '.join('( {0} )'.format(item) for item in list_null_condition), sample_size))
+    # the setting only lasts for the query, a hive CLI process ends with it and a HiveServer2 session restores it
+    return ("set hive.optimize.cte.materialize.threshold=1;\n"
+            "with base as ( select {0} from {1}.{2} where SRC_SYS_CD='{3}'{4} )\n"
+            "select R.* from ( {5} )R").format(','.join(list_column + list_flag), schema_name, table_name,
+                                              param_src_sys_cd, base_condition, ' union all '.join(list_branch))
+
+
+def build_fk_batch_query(schema_name, table_name, param_src_sys_cd, list_constraint, mapjoin=False, sample_size=10,
+                         watermark_range=None):
+    """
+    This function is to build one query checking all FK constraints of a table that point at the same reference
+    table. Both tables are read once, stack() turns every FK into a (constraint name, key) row and a left outer join
+    with an is null filter, which Hive runs as an anti join, keeps the keys missing in the reference table.
+    :param schema_name:
+    :param table_name:
+    :param param_src_sys_cd:
+    :param list_constraint: list of Constraint of type 'f' with the same reference_table_name
+    :param mapjoin: broadcast the reference table to the mappers
+    :param sample_size: the max number of issue rows returned per constraint
+    :param watermark_range: (watermark column, last checked watermark, new watermark) to check only the rows loaded
+        in between, the reference table is always read in full(optional)
+    The keys are compared as strings, split_fk_batch() keeps out the FKs whose column types differ.
+    :return: query returning rows of constraint name and a column per key, padded with NULL
+    """
+    reference_table_name = list_constraint[0].reference_table_name
+    width = max(len(constraint.reference_keys.split(',')) for constraint in list_constraint)
+    list_value = ['v{0}'.format(i_field) for i_field in range(1, width + 1)]
+    list_source = []
+    list_reference = []
+    for constraint in list_constraint:
+        arr_reference_keys = constraint.reference_keys.split(',')
+        arr_reference_columns = constraint.reference_column_name.split(',')
+        not_null_condition = ' and '.join('{0} is not null'.format(key) for key in arr_reference_keys)
+        # the join key joins all columns by \001, which does not show up in the data
+        list_source.append(', '.join(["case when {0} then '{1}' end".format(not_null_condition,
+                                                                             constraint.constraint_name),
+                                      "concat_ws('\\001', {0})".format(','.join(format_columns(arr_reference_keys,
+                                                                                                '')))] +
+                                     pad_columns(format_columns(arr_reference_keys, ''), width)))
+        list_reference.append("'{0}', concat_ws('\\001', {1})".format(
+            constraint.constraint_name, ','.join(format_columns(arr_reference_columns, ''))))
+    # Hive ignores the MAPJOIN hint unless hive.ignore.mapjoin.hint is off, the setting only lasts for the query
+    return (("set hive.ignore.mapjoin.hint=false;\n" if mapjoin else '') +
+            "select F.constraint_name, {0} from ( select X.*, row_number() over "
+            "(partition by X.constraint_name order by {1}) as rn from ( select {2}distinct K.constraint_name, {3} "
+            "from ( select stack({4}, {5}) as (constraint_name, k, {6}) from {7}.{8} where SRC_SYS_CD='{9}'{10} )K "
+            "left outer join ( select stack({4}, {11}) as (constraint_name, k) from {7}.{12} "
+            "where SRC_SYS_CD='{9}' )R on K.constraint_name=R.constraint_name and K.k=R.k "
+            "where K.constraint_name is not null and R.k is null )X )F where F.rn <= {13}").format(
+                ', '.join('F.{0}'.format(value) for value in list_value),
+                ', '.join('X.{0}'.format(value) for value in list_value), '/*+ MAPJOIN(R) */ ' if mapjoin else '',
+                ', '.join('K.{0}'.format(value) for value in list_value), len(list_constraint),
+                ', '.join(list_source), ', '.join(list_value), schema_name, table_name, param_src_sys_cd,
+                build_range_condition(watermark_range), ', '.join(list_reference), reference_table_name,
+                sample_size)
+
+
+def output_record(schema_name, table_name, constraint, sql, rows, list_violation=None, incremental=False):
+    """
+    This function is to print the check result of one constraint, the record is printed when the first issue row
+    arrives
+    :param schema_name:
+    :param table_name:
+    :param constraint: Constraint
+    :param sql: query the rows came from, shown in the report as it ran
+    :param rows: iterable of issue rows, a list of column values each
+    :param list_violation: list to append a Violation per issue row to, or the clean record if there is no
+        issue(optional)
+    :param incremental: the rows only cover the new data, no issue there says nothing of the old rows and no clean
+        record is kept
+    :return: number of issue rows
+    """
+    reference_keys = constraint.reference_keys
+    constraint_type = constraint.constraint_type
+    num_keys = len(reference_keys.split(','))
+    check_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def collect(list_row):
+        for row in list_row:
+            if list_violation is not None:
+                list_violation.append(Violation(schema_name, table_name, reference_keys, constraint.constraint_name,
+                                                constraint_type, constraint.reference_table_name,
+                                                '({0})'.format(','.join(row[:num_keys])), check_time))
+            yield row[:num_keys]
+
+    iterator = iter(rows)
+    for first_row in iterator:
+        print('SQL:')
+        print("\033[31m {0}\n \033[0m".format(sql))
+        if constraint_type == 'f':
+            print("-[  RECORD  ]---+----------------\n"
+                  "Schema Name     | {0}\n"
+                  "Table Name      | {1}\n"
+                  "Reference Table | {2}\n"
+                  "Column Names    | {3}\n"
+                  "Constraint Name | {4}\n"
+                  "Constraint Type | FOREIGN\n"
+                  "----------------+----------------".format(schema_name, table_name,
+                                                               constraint.reference_table_name, reference_keys,
+                                                               constraint.constraint_name))
+        else:
+            print("-[  RECORD  ]---+----------------\n"
+                  "Schema Name     | {0}\n"
+                  "Table Name      | {1}\n"
+                  "Column Names    | {2}\n"
+                  "Constraint Name | {3}\n"
+                  "Constraint Type | {4}\n"
+                  "----------------+----------------".format(schema_name, table_name, reference_keys,
+                                                               constraint.constraint_name,
+                                                               CONSTRAINT_TYPE_NAME[constraint_type]))
+        return output_data(collect(itertools.chain([first_row], iterator)))
+    if list_violation is not None and not incremental:
+        list_violation.append(get_clean_record(schema_name, table_name, constraint))
+    new = 'new ' if incremental else ''
+    if constraint_type == 'f':
+        print('No {0}FK issue found for reference table {1}! FK: {2}.'.format(new, constraint.reference_table_name,
+                                                                              reference_keys))
+    else:
+        print('No {0}{1} issue found!'.format(new, CONSTRAINT_TYPE_SHORT_NAME[constraint_type]))
+    return 0
+
+
+def analyze(schema_name, table_name, param_src_sys_cd, constraint_type, constraint_name,
+            reference_table_name,
+            reference_keys,
+            reference_column_name,
+            executor=None,
+            stopwatch=None,
+            watermark_range=None,
+            sample_size=10,
+            list_violation=None):
+    """
+    This function is to analyze specified constraint type and return error value if exists
+    :param schema_name:
+    :param table_name:
+    :param param_src_sys_cd:
+    :param constraint_type:
+    :param constraint_name:
+    :param reference_table_name:
+    :param reference_keys:
+    :param reference_column_name:
+    :param executor: query executor, a new hive CLI process per query if not given
+    :param stopwatch: Stopwatch to time the stages in
+    :param watermark_range: (watermark column, last checked watermark, new watermark) to check only new rows
+    :param sample_size: the max number of issue rows shown
+    :param list_violation: list to append a Violation per issue row to(optional)
+    :return: Stopwatch
+    """
+    if executor is None:
+        executor = HiveCliExecutor()
+    if stopwatch is None:
+        stopwatch = Stopwatch()
+
+    constraint = Constraint(constraint_type, constraint_name, reference_table_name, reference_keys,
+                            reference_column_name)
+    with stopwatch.stage('build'):
+        sql_check = build_check_query(schema_name, table_name, param_src_sys_cd, constraint, watermark_range,
+                                      sample_size)
+    if sql_check is None:
+        if constraint_type == 'f':
+            print("Expression returned a reference to target table itself, skipping...")
+        return stopwatch
+    rows = stopwatch.time_rows(executor.iter_rows(sql_check))
+    output_record(schema_name, table_name, constraint, sql_check, rows, list_violation, watermark_range is not None)
+    return stopwatch
+
+
+def group_issue_rows(rows, list_constraint):
+    """
+    This function is to group the rows of a fused or batched query by constraint, at most sample_size rows per
+    constraint are returned by the query so they are kept in memory
+    :param rows: iterable of rows, constraint name followed by the column values
+    :param list_constraint: list of Constraint
+    :return: dict of constraint name to list of issue rows
+    """
+    dict_issue = dict((constraint.constraint_name, []) for constraint in list_constraint)
+    for row in rows:
+        if row[0] in dict_issue:
+            dict_issue[row[0]].append(row[1:])
+    return dict_issue
+
+
+def get_new_watermark(executor, schema_name, table_name, param_src_sys_cd, watermark_column, watermark=None):
+    """
+    This function is to get the watermark the next incremental check goes up to, with a partition column as
+    watermark only the partitions after the last watermark are read
+    :param executor: query executor
+    :param schema_name:
+    :param table_name:
+    :param param_src_sys_cd:
+    :param watermark_column: e.g. RADAR_UPD_TS or the load date partition column
+    :param watermark: last checked watermark, None to get the max of the whole table
+    :return: max of the watermark column as string, None if there is no (new) row
+    """
+    sql_watermark = "select max({0}) from {1}.{2} where SRC_SYS_CD='{3}'".format(watermark_column, schema_name,
+                                                                               table_name, param_src_sys_cd)
+    if watermark is not None:
+        sql_watermark += " and {0} > '{1}'".format(watermark_column, watermark)
+    res_watermark = executor.execute(sql_watermark).strip()
+    if res_watermark in ('', 'NULL'):
+        return None
+    return res_watermark
+
+
+def get_table_properties(executor, schema_name, table_name):
+    """
+    This function is to read the table properties, it is a metastore lookup and runs no job on the cluster
+    :param executor: query executor
+    :param schema_name:
+    :param table_name:
+    :return: dict of property name to value as string
+    """
+    return parse_table_properties(executor.execute('show tblproperties {0}.{1}'.format(schema_name, table_name)))
+
+
+def parse_table_properties(res_properties):
+    """ Return the dict of property name to value of the output of show tblproperties """
+    dict_properties = {}
+    for line in res_properties.split('\n'):
+        arr_line = line.split('\t')
+        if len(arr_line) == 2:
+            dict_properties[arr_line[0].strip()] = arr_line[1].strip()
+    return dict_properties
+
+
+def get_table_statistics(executor, schema_name, table_name):
+    """
+    This function is to read the basic statistics Hive keeps in the table properties
+    :param executor: query executor
+    :param schema_name:
+    :param table_name:
+    :return: dict of numRows, totalSize, rawDataSize, numFiles, -1 or missing if not collected
+    """
+    return parse_table_statistics(get_table_properties(executor, schema_name, table_name))
+
+
+def parse_table_statistics(dict_properties):
+    """ Return the basic statistics of the table properties as int """
+    dict_statistics = {}
+    for name, value in dict_properties.items():
+        if name in ('numRows', 'totalSize', 'rawDataSize', 'numFiles'):
+            try:
+                dict_statistics[name] = int(value)
+            except ValueError:
+                pass
+    return dict_statistics
+
+
+def get_table_modified_time(executor, schema_name, table_name):
+    """
+    This function is to get when a table was last changed
+    :param executor: query executor
+    :param schema_name:
+    :param table_name:
+    :return: unix time of the latest last_modified_time/transient_lastDdlTime, None if not available
+    """
+    list_time = []
+    for name, value in get_table_properties(executor, schema_name, table_name).items():
+        if name in ('last_modified_time', 'transient_lastDdlTime'):
+            try:
+                list_time.append(int(value))
+            except ValueError:
+                pass
+    return max(list_time) if list_time else None
+
+
+def get_column_statistics(executor, schema_name, table_name, column_name):
+    """
+    This function is to read the column statistics of the metastore, they are only there if the column statistics
+    were computed
+    :param executor: query executor
+    :param schema_name:
+    :param table_name:
+    :param column_name:
+    :return: dict of num_nulls, distinct_count, missing if not collected
+    """
+    list_line = [[field.strip() for field in line.split('\t')] for line in
+                 executor.execute('describe formatted {0}.{1} {2}'.format(schema_name, table_name,
+                                                                          column_name)).split('\n')]
+    dict_statistics = {}
+    list_header = None
+    for arr_line in list_line:
+        if arr_line[0] in ('num_nulls', 'distinct_count') and len(arr_line) > 1:
+            # Hive 3 prints a line per statistic
+            dict_statistics[arr_line[0]] = arr_line[1]
+        elif 'distinct_count' in arr_line:
+            list_header = arr_line
+        elif list_header is not None and arr_line[0].lower() == column_name.lower():
+            # older versions print a header line and a line of values
+            dict_statistics.update(zip(list_header, arr_line))
+    for name in list(dict_statistics.keys()):
+        try:
+            dict_statistics[name] = int(dict_statistics[name])
+        except ValueError:
+            del dict_statistics[name]
+    return dict((name, value) for name, value in dict_statistics.items() if name in ('num_nulls', 'distinct_count'))
+
+
+# relative error of the HLL distinct count of Hive, about 1% either way
+HLL_RELATIVE_ERROR = 0.01
+
+
+def build_prescreen_query(schema_name, table_name, param_src_sys_cd, list_constraint):
+    """
+    This function is to build the query estimating the distinct keys of PK/UK constraints in one scan, without the
+    shuffle of the exact group by
+    :param schema_name:
+    :param table_name:
+    :param param_src_sys_cd:
+    :param list_constraint: list of Constraint of type 'p' or 'u'
+    :return: query returning the row count followed by the estimated number of distinct keys per constraint
+    """
+    list_stats = []
+    list_ndv = []
+    for i, constraint in enumerate(list_constraint):
+        # NULL keys are grouped together by the exact check, keep them as a value
+        list_stats.append("compute_stats(concat_ws('\\001', {0}), 'hll') s{1}".format(
+            ', '.join(format_columns(constraint.reference_keys.split(','), '')), i))
+        list_ndv.append('t.s{0}.numdistinctvalues'.format(i))
+    return "select t.num_rows, {0} from ( select count(1) num_rows, {1} from {2}.{3} where SRC_SYS_CD='{4}' )t".format(
+        ', '.join(list_ndv), ', '.join(list_stats), schema_name, table_name, param_src_sys_cd)
+
+
+def estimate_distinct_keys(executor, schema_name, table_name, param_src_sys_cd, list_constraint, prescreen_mode):
+    """
+    This function is to estimate the number of rows and of distinct keys per PK/UK constraint
+    :param executor: query executor
+    :param schema_name:
+    :param table_name:
+    :param param_src_sys_cd:
+    :param list_constraint: list of Constraint of type 'p' or 'u'
+    :param prescreen_mode: 'stats' uses the metastore statistics of single column keys of the whole table and
+        estimates the rest by 'hll', 'hll' scans the rows of the source system
+    :return: dict of constraint name to (number of rows, estimated number of distinct keys, True if the number is
+        exact)
+    """
+    dict_estimate = {}
+    list_scan = list_constraint
+    if prescreen_mode == 'stats':
+        list_scan = []
+        num_rows = get_table_statistics(executor, schema_name, table_name).get('numRows', -1)
+        for constraint in list_constraint:
+            dict_column = {}
+            if num_rows >= 0 and ',' not in constraint.reference_keys:
+                dict_column = get_column_statistics(executor, schema_name, table_name, constraint.reference_keys)
+            if 'distinct_count' in dict_column and 'num_nulls' in dict_column:
+                # a unique key of the whole table is unique for each source system, NULL counts as one key
+                dict_estimate[constraint.constraint_name] = (
+                    num_rows, dict_column['distinct_count'] + min(dict_column['num_nulls'], 1), False)
+            else:
+                list_scan.append(constraint)
+    if list_scan:
+        res_estimate = executor.execute(build_prescreen_query(schema_name, table_name, param_src_sys_cd, list_scan))
+        arr_estimate = res_estimate.strip().split('\n')[-1].split('\t')
+        if len(arr_estimate) == len(list_scan) + 1:
+            for constraint, ndv in zip(list_scan, arr_estimate[1:]):
+                try:
+                    dict_estimate[constraint.constraint_name] = (int(arr_estimate[0]), int(ndv),
+                                                                 executor.exact_distinct)
+                except ValueError:
+                    pass
+    return dict_estimate
+
+
+def prescreen(schema_name, table_name, param_src_sys_cd, list_constraint, executor=None, prescreen_mode='hll',
+              tolerance=0.0):
+    """
+    This function is to find the PK/UK constraints an approximate distinct count shows no duplicate for, the exact
+    check only needs to run for the rest
+    :param schema_name:
+    :param table_name:
+    :param param_src_sys_cd:
+    :param list_constraint: list of Constraint of type 'p' or 'u'
+    :param executor: query executor, a new hive CLI process per query if not given
+    :param prescreen_mode: 'hll' or 'stats', see estimate_distinct_keys()
+    :param tolerance: how far below the row count an approximate estimate may be and still pass, an exact count
+        must reach the row count
+    :return: set of names of the constraints with no issue (approx)
+    """
+    if executor is None:
+        executor = HiveCliExecutor()
+    set_clean = set()
+    dict_estimate = estimate_distinct_keys(executor, schema_name, table_name, param_src_sys_cd, list_constraint,
+                                           prescreen_mode)
+    for constraint in list_constraint:
+        if constraint.constraint_name not in dict_estimate:
+            continue
+        num_rows, num_distinct, exact = dict_estimate[constraint.constraint_name]
+        if exact and num_distinct >= num_rows:
+            set_clean.add(constraint.constraint_name)
+            print('No {0} issue found! {1}.{2} {3}: {4} rows, {5} distinct keys.'.format(
+                CONSTRAINT_TYPE_SHORT_NAME[constraint.constraint_type], schema_name, table_name,
+                constraint.constraint_name, num_rows, num_distinct))
+        elif not exact and num_distinct >= num_rows * (1 - tolerance):
+            set_clean.add(constraint.constraint_name)
+            # the estimate may be HLL_RELATIVE_ERROR above the true distinct count
+            undetectable_rate = max(1 - num_distinct / (num_rows * (1 + HLL_RELATIVE_ERROR)), 0) if num_rows else 0
+            print('No {0} issue found (approx)! {1}.{2} {3}: {4} rows, ~{5} distinct keys, duplicates in up to '
+                  '{6:.2%} of the rows can not be told apart from the estimate error.'.format(
+                      CONSTRAINT_TYPE_SHORT_NAME[constraint.constraint_type], schema_name, table_name,
+                      constraint.constraint_name, num_rows, num_distinct, undetectable_rate))
+    return set_clean
+
+
+def analyze_fused(schema_name, table_name, param_src_sys_cd, list_constraint, executor=None, stopwatch=None,
+                  sample_size=10, list_violation=None, watermark_range=None):
+    """
+    This function is to analyze all PK/UK/NULL constraints of a table by one query, and print a record per constraint
+    the same way as analyze() does
+    :param schema_name:
+    :param table_name:
+    :param param_src_sys_cd:
+    :param list_constraint: list of Constraint of type 'p', 'u' or 'n'
+    :param executor: query executor, a new hive CLI process per query if not given
+    :param stopwatch: Stopwatch to time the stages in
+    :param sample_size: the max number of issue rows shown per constraint
+    :param list_violation: list to append a Violation per issue row to(optional)
+    :param watermark_range: (watermark column, last checked watermark, new watermark) to check only new rows
+    :return: Stopwatch
+    """
+    if executor is None:
+        executor = HiveCliExecutor()
+    if stopwatch is None:
+        stopwatch = Stopwatch()
+
+    with stopwatch.stage('build'):
+        sql_fused = build_fused_query(schema_name, table_name, param_src_sys_cd, list_constraint, sample_size,
+                                      watermark_range)
+    dict_issue = group_issue_rows(stopwatch.time_rows(executor.iter_rows(sql_fused)), list_constraint)
+    with stopwatch.stage('parse'):
+        for constraint in list_constraint:
+            output_record(schema_name, table_name, constraint, sql_fused, dict_issue[constraint.constraint_name],
+                          list_violation, watermark_range is not None)
+    return stopwatch
+
+
+def use_mapjoin(executor, schema_name, reference_table_name, mapjoin_rows):
+    """
+    This function is to decide if a batched FK check broadcasts the reference table
+    :param executor: query executor
+    :param schema_name:
+    :param reference_table_name:
+    :param mapjoin_rows: the max row count statistic of a broadcast table, 0 to never broadcast
+    :return: bool
+    """
+    if mapjoin_rows <= 0:
+        return False
+    num_rows = get_table_statistics(executor, schema_name, reference_table_name).get('numRows')
+    return num_rows is not None and 0 <= num_rows <= mapjoin_rows
+
+
+def get_column_types(executor, schema_name, table_name):
+    """
+    This function is to read the column types of a table
+    :param executor: query executor
+    :param schema_name:
+    :param table_name:
+    :return: dict of upper case column name to lower case type, empty if the backend has no describe
+    """
+    dict_type = {}
+    for line in executor.execute('describe {0}.{1}'.format(schema_name, table_name)).split('\n'):
+        arr_line = [field.strip() for field in line.split('\t')]
+        # the partition columns are listed again after a '# Partition Information' header
+        if len(arr_line) < 2 or arr_line[0] == '' or arr_line[0].startswith('#'):
+            continue
+        dict_type.setdefault(arr_line[0].upper(), arr_line[1].lower())
+    return dict_type
+
+
+def split_fk_batch(executor, schema_name, table_name, list_constraint):
+    """
+    This function is to find the FK constraints a batched query can check. The batch compares the keys cast to
+    strings, which only matches the typed comparison of a single check if both sides have the same type, e.g. a
+    decimal 1.00 is not the string of an int 1.
+    :param executor: query executor
+    :param schema_name:
+    :param table_name:
+    :param list_constraint: list of Constraint of type 'f' with the same reference_table_name
+    :return: (list of Constraint to batch, list of Constraint to check one by one)
+    """
+    dict_source_type = get_column_types(executor, schema_name, table_name)
+    dict_reference_type = get_column_types(executor, schema_name, list_constraint[0].reference_table_name)
+    list_batch = []
+    list_single = []
+    for constraint in list_constraint:
+        list_pair = zip(constraint.reference_keys.split(','), constraint.reference_column_name.split(','))
+        if all(dict_source_type.get(key.strip().upper()) == dict_reference_type.get(column.strip().upper())
+               for key, column in list_pair):
+            list_batch.append(constraint)
+        else:
+            list_single.append(constraint)
+    return list_batch, list_single
+
+
+def analyze_fk_batch(schema_name, table_name, param_src_sys_cd, list_constraint, executor=None, mapjoin_rows=0,
+                     stopwatch=None, sample_size=10, list_violation=None, watermark_range=None):
+    """
+    This function is to analyze all FK constraints of a table pointing at the same reference table by one query, and
+    print a record per constraint the same way as analyze() does. An FK whose key types differ from the reference
+    columns is checked by analyze() instead.
+    :param schema_name:
+    :param table_name:
+    :param param_src_sys_cd:
+    :param list_constraint: list of Constraint of type 'f' with the same reference_table_name
+    :param executor: query executor, a new hive CLI process per query if not given
+    :param mapjoin_rows: broadcast the reference table if its row count statistic is at most this, 0 to disable
+    :param stopwatch: Stopwatch to time the stages in
+    :param sample_size: the max number of issue rows shown per constraint
+    :param list_violation: list to append a Violation per issue row to(optional)
+    :param watermark_range: (watermark column, last checked watermark, new watermark) to check only new rows
+    :return: Stopwatch
+    """
+    if executor is None:
+        executor = HiveCliExecutor()
+    if stopwatch is None:
+        stopwatch = Stopwatch()
+
+    with stopwatch.stage('build'):
+        list_constraint, list_single = split_fk_batch(executor, schema_name, table_name, list_constraint)
+        if list_constraint:
+            mapjoin = use_mapjoin(executor, schema_name, list_constraint[0].reference_table_name, mapjoin_rows)
+            sql_fk = build_fk_batch_query(schema_name, table_name, param_src_sys_cd, list_constraint, mapjoin,
+                                          sample_size, watermark_range)
+    for constraint in list_single:
+        analyze(schema_name, table_name, param_src_sys_cd, constraint.constraint_type, constraint.constraint_name,
+                constraint.reference_table_name, constraint.reference_keys, constraint.reference_column_name,
+                executor, stopwatch, watermark_range, sample_size, list_violation)
+    if not list_constraint:
+        return stopwatch
+    dict_issue = group_issue_rows(stopwatch.time_rows(executor.iter_rows(sql_fk)), list_constraint)
+    with stopwatch.stage('parse'):
+        for constraint in list_constraint:
+            output_record(schema_name, table_name, constraint, sql_fk, dict_issue[constraint.constraint_name],
+                          list_violation, watermark_range is not None)
+    return stopwatch
+
+
+def build_job_queries(executor, job, options, watermark_range=None):
+    """
+    This function is to build the queries a job runs, the same ones run_job() executes in the same order. The FKs of
+    a fk_batch job whose key types differ from the reference columns are checked one by one before the batch.
+    :param executor: query executor, for the metastore lookups deciding how FKs are batched
+    :param job: Job
+    :param options: CheckOptions
+    :param watermark_range: (watermark column, last checked watermark, new watermark) of an incremental job
+    :return: list of queries, empty if the job has nothing to check
+    """
+    if job.mode == 'fused':
+        list_query = [build_fused_query(job.schema_name, job.table_name, job.param_src_sys_cd, job.constraints,
+                                        options.sample_size, watermark_range)]
+    elif job.mode == 'fk_batch':
+        list_batch, list_single = split_fk_batch(executor, job.schema_name, job.table_name, job.constraints)
+        list_query = [build_check_query(job.schema_name, job.table_name, job.param_src_sys_cd, constraint,
+                                        watermark_range, options.sample_size) for constraint in list_single]
+        if list_batch:
+            mapjoin = use_mapjoin(executor, job.schema_name, list_batch[0].reference_table_name, options.mapjoin_rows)
+            list_query.append(build_fk_batch_query(job.schema_name, job.table_name, job.param_src_sys_cd, list_batch,
+                                                   mapjoin, options.sample_size, watermark_range))
+    else:
+        list_query = [build_check_query(job.schema_name, job.table_name, job.param_src_sys_cd, job.constraints[0],
+                                        watermark_range, options.sample_size)]
+    return [query for query in list_query if query is not None]
+
+
+def get_table_size(executor, schema_name, table_name):
+    """
+    This function is to get the bytes stored by a table, from totalSize of the table statistics or the file sizes
+    show table extended reports for tables without statistics, e.g. partitioned tables
+    :param executor: query executor
+    :param schema_name:
+    :param table_name:
+    :return: bytes, None if not known
+    """
+    total_size = get_table_statistics(executor, schema_name, table_name).get('totalSize', -1)
+    if total_size >= 0:
+        return total_size
+    return parse_total_file_size(executor.execute("show table extended in {0} like '{1}'".format(schema_name,
+                                                                                                 table_name)))
+
+
+def parse_total_file_size(res_extended):
+    """ Return totalFileSize of the output of show table extended, None if it is not there """
+    for line in res_extended.split('\n'):
+        if line.startswith('totalFileSize:'):
+            try:
+                return int(line.split(':', 1)[1])
+            except ValueError:
+                pass
+    return None
+
+
+def get_table_sizes(executor, list_table):
+    """
+    This function is to get the bytes stored by many tables the same way as get_table_size(), by one script for the
+    table statistics and one for the tables without, rather than a hive CLI process per table
+    :param executor: query executor
+    :param list_table: list of (schema_name, table_name)
+    :return: dict of (schema_name, table_name) to bytes, None if not known
+    """
+    dict_table_size = {}
+    list_missing = []
+    list_output = executor.execute_each(['show tblproperties {0}.{1}'.format(schema_name, table_name)
+                                         for schema_name, table_name in list_table])
+    for key, res_properties in zip(list_table, list_output):
+        total_size = parse_table_statistics(parse_table_properties(res_properties)).get('totalSize', -1)
+        if total_size >= 0:
+            dict_table_size[key] = total_size
+        else:
+            list_missing.append(key)
+    if list_missing:
+        list_output = executor.execute_each(["show table extended in {0} like '{1}'".format(schema_name, table_name)
+                                             for schema_name, table_name in list_missing])
+        for key, res_extended in zip(list_missing, list_output):
+            dict_table_size[key] = parse_total_file_size(res_extended)
+    return dict_table_size
+
+
+def get_partition_sizes(executor, schema_name, table_name):
+    """
+    This function is to get the bytes stored by every partition of a table, from the partition statistics read by
+    one lookup
+    :param executor: query executor
+    :param schema_name:
+    :param table_name:
+    :return: list of (dict of lower case partition column to value, bytes or None if not known), empty if the table
+        is not partitioned
+    """
+    list_partition = [line.strip() for line in
+                      executor.execute('show partitions {0}.{1}'.format(schema_name, table_name)).split('\n')
+                      if '=' in line]
+    list_spec = [collections.OrderedDict((name.lower(), urllib.parse.unquote(value)) for name, value in
+                                         (item.split('=', 1) for item in partition.split('/')))
+                 for partition in list_partition]
+    list_output = executor.execute_each(['describe formatted {0}.{1} partition({2})'.format(
+        schema_name, table_name, ', '.join("{0}='{1}'".format(name, value) for name, value in dict_spec.items()))
+        for dict_spec in list_spec])
+    list_partition_size = []
+    for dict_spec, res_formatted in zip(list_spec, list_output):
+        partition_size = None
+        for line in res_formatted.split('\n'):
+            arr_line = [field.strip() for field in line.split('\t') if field.strip()]
+            if len(arr_line) == 2 and arr_line[0] == 'totalSize':
+                try:
+                    partition_size = int(arr_line[1])
+                except ValueError:
+                    pass
+        list_partition_size.append((dict_spec, partition_size))
+    return list_partition_size
+
+
+def reads_new_rows_only(job):
+    """ Whether an incremental job scans only the new rows of its table, a PK/UK check reads all rows of new keys """
+    return job.watermark is not None and \
+        not any(constraint.constraint_type in ('p', 'u') for constraint in job.constraints)
+
+
+def estimate_scan_bytes(executor, job, dict_table_size=None, watermark_column=None, dict_partition=None):
+    """
+    This function is to estimate the bytes a job reads, the table checked and the reference table of FK checks.
+    Of a partitioned table only the partitions of the source system are counted, and of an incremental job reading
+    new rows only, the partitions after the watermark if the watermark column is a partition column.
+    :param executor: query executor
+    :param job: Job
+    :param dict_table_size: cache of table sizes shared by the jobs(optional)
+    :param watermark_column: column the incremental mode tracks(optional)
+    :param dict_partition: cache of the partition sizes of get_partition_sizes() shared by the jobs(optional)
+    :return: OrderedDict of schema.table to bytes, None if not known
+    """
+    if dict_table_size is None:
+        dict_table_size = {}
+    if dict_partition is None:
+        dict_partition = {}
+    list_table = [job.table_name]
+    list_table.extend(constraint.reference_table_name for constraint in job.constraints
+                      if constraint.constraint_type == 'f' and constraint.reference_table_name not in list_table)
+    dict_scan_bytes = collections.OrderedDict()
+    for table_name in list_table:
+        key = '{0}.{1}'.format(job.schema_name, table_name).upper()
+        if key not in dict_partition:
+            dict_partition[key] = get_partition_sizes(executor, job.schema_name, table_name)
+        if not dict_partition[key]:
+            if key not in dict_table_size:
+                dict_table_size[key] = get_table_size(executor, job.schema_name, table_name)
+            dict_scan_bytes[key] = dict_table_size[key]
+            continue
+        list_size = []
+        for dict_spec, partition_size in dict_partition[key]:
+            if dict_spec.get('src_sys_cd', job.param_src_sys_cd) != job.param_src_sys_cd:
+                continue
+            value = dict_spec.get((watermark_column or '').lower())
+            # rows of a NULL watermark are in the default partition and are checked by every run
+            if table_name == job.table_name and reads_new_rows_only(job) and value is not None and \
+                    value != '__HIVE_DEFAULT_PARTITION__' and value <= job.watermark:
+                continue
+            list_size.append(partition_size)
+        dict_scan_bytes[key] = None if None in list_size else sum(list_size)
+    return dict_scan_bytes
+
+
+def format_bytes(num_bytes):
+    if num_bytes is None:
+        return 'unknown'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num_bytes < 1024:
+            return '{0:.1f} {1}'.format(num_bytes, unit)
+        num_bytes /= 1024.0
+    return '{0:.1f} TB'.format(num_bytes)
+
+
+def explain_query(executor, query):
+    """
+    This function is to get the plan Hive makes for a query, the set statements before it are kept
+    :param executor: query executor
+    :param query: query of one or more statements, the last one is explained
+    :return: plan as text
+    """
+    list_statement = split_statements(query)
+    list_statement[-1] = 'explain ' + list_statement[-1]
+    return executor.execute(';\n'.join(list_statement))
+
+
+def plan(dict_constraint_definition, param_src_sys_cd, session_pool, options=DEFAULT_CHECK_OPTIONS,
+         table_concurrency=2, dict_table_priority=None, watermark_store=None, explain=False):
+    """
+    This function is to print the jobs a run would execute in the order they would start, with the query, the
+    bytes scanned and optionally the Hive plan, no job runs on the cluster unless explain is set
+    :param dict_constraint_definition: (schema_name, table_name) to constraint definitions of the table
+    :param param_src_sys_cd:
+    :param session_pool: SessionPool, used for metastore lookups and explain
+    :param options: CheckOptions
+    :param table_concurrency:
+    :param dict_table_priority: (schema_name, table_name) to priority, higher goes first
+    :param watermark_store: WatermarkStore of the incremental mode(optional)
+    :param explain: run explain for every query
+    :return: list of (Job, list of queries, estimated bytes scanned)
+    """
+    scheduler = JobScheduler(table_concurrency, dict_table_priority)
+    todo = 0
+    for (schema_name, table_name), list_constraint_definition in dict_constraint_definition.items():
+        dict_watermark = None
+        if watermark_store is not None:
+            dict_watermark = watermark_store.get_table(param_src_sys_cd, schema_name, table_name)
+        todo += add_jobs(schema_name, table_name, param_src_sys_cd, list_constraint_definition, scheduler, options,
+                         dict_watermark)
+    # no job finishes in a plan, so let every table have all its jobs in flight
+    scheduler.table_concurrency = todo
+
+    list_plan = []
+    dict_table_size = {}
+    dict_partition = {}
+    with session_pool.session() as executor:
+        for job_id in range(1, todo + 1):
+            job, scheduled_time = scheduler.get()
+            watermark_range = None
+            if job.watermark is not None:
+                # the upper bound is the max of the watermark column when the job runs
+                watermark_range = (options.watermark_column, job.watermark, '<new watermark>')
+            list_query = build_job_queries(executor, job, options, watermark_range)
+            dict_scan_bytes = estimate_scan_bytes(executor, job, dict_table_size, options.watermark_column,
+                                                  dict_partition)
+            scan_bytes = None
+            if None not in dict_scan_bytes.values():
+                scan_bytes = sum(dict_scan_bytes.values())
+            print("-[  PLAN {0:<4}]---+----------------\n"
+                  "Schema Name     | {1}\n"
+                  "Table Name      | {2}\n"
+                  "Check Type      | {3}\n"
+                  "Constraint Name | {4}\n"
+                  "Scan Bytes      | {5} ({6})\n"
+                  "----------------+----------------".format(
+                      job_id, job.schema_name, job.table_name, get_check_type(job),
+                      ','.join(constraint.constraint_name for constraint in job.constraints),
+                      format_bytes(scan_bytes),
+                      ', '.join('{0} {1}'.format(key, format_bytes(value)) for key, value in dict_scan_bytes.items())))
+            if not list_query:
+                print("Expression returned a reference to target table itself, skipping...")
+            else:
+                for query in list_query:
+                    print('SQL:')
+                    print("\033[31m {0}\n \033[0m".format(query))
+                if options.prescreen is not None and job.watermark is None:
+                    list_candidate = [constraint for constraint in job.constraints
+                                      if constraint.constraint_type in ('p', 'u')]
+                    if list_candidate:
+                        print('Pre-screen SQL:')
+                        print("\033[31m {0}\n \033[0m".format(build_prescreen_query(
+                            job.schema_name, job.table_name, job.param_src_sys_cd, list_candidate)))
+                if explain:
+                    for query in list_query:
+                        print(explain_query(executor, query))
+            list_plan.append((job, list_query, scan_bytes))
+    total_bytes = sum(scan_bytes for job, list_query, scan_bytes in list_plan if scan_bytes is not None)
+    print('{0} jobs would scan {1}{2}.'.format(
+        len(list_plan), format_bytes(total_bytes),
+        ', tables without statistics not counted' if any(scan_bytes is None for job, list_query, scan_bytes
+                                                         in list_plan) else ''))
+    return list_plan
+
+
+def main():
+    try:
+        start_time = datetime.datetime.now()
+        try:
+            args = parse_args()
+        except ArgumentErrorException as e:
+            print('Error: {0} is not a valid table name in search path, please check your input!'.format(e.name))
+        else:
+            # set work directory as home
+            os.chdir(args.work_dir)
+            asset_name = args.asset
+            param_src_sys_cd = args.src_sys_cd
+            if param_src_sys_cd is None:
+                try:
+                    config = configparser.ConfigParser()
+                    config.read(args.env_file)
+                    param_src_sys_cd = config.get(asset_name.upper(), 'Param_SRC_SYS_CD')
+                except configparser.NoSectionError:
+                    # without the source system every check would run for SRC_SYS_CD='None' and find nothing
+                    print('Error: no section: \'{0}\''.format(asset_name.upper()))
+                    sys.exit(1)
+                except configparser.NoOptionError:
+                    print('Error: no option \'Param_SRC_SYS_CD\' in section: \'{0}\''.format(asset_name.upper()))
+                    sys.exit(1)
+
+            executor_config = ExecutorConfig(args.backend, args.hs2_host, args.hs2_port, args.hs2_user, 'default',
+                                             args.local_dir)
+            tracer = Tracer('main', args.trace is not None)
+            session_pool = SessionPool(executor_config, tracer=tracer)
+
+            # need to find the constraint definition from radar.constraint_columns, one query for all tables
+            print('*'*50)
+            print('\033[5m looking up constraint definitions... \033[0m')
+            print('*'*50)
+            cache = None if args.no_cache else ConstraintDefinitionCache(args.cache_file, args.cache_ttl)
+            with tracer.span('lookup', 'main'):
+                dict_constraint_definition = filter_constraint_definition(
+                    lookup_constraint_definition(args.list_table_pattern, session_pool, cache), args.key,
+                    args.reference)
+            if cache is not None:
+                cache.close()
+            with tracer.span('priority', 'main'):
+                dict_table_size = None
+                if args.priority == 'size' or args.concurrency is None:
+                    # one lookup ranks the tables and lets the concurrency controller compare jobs of all tables
+                    with session_pool.session() as executor:
+                        dict_table_size = get_table_sizes(executor, list(dict_constraint_definition))
+                dict_table_priority = get_table_priority(dict_constraint_definition, args.priority, session_pool,
+                                                         dict_table_size)
+            watermark_store = None
+            if args.incremental:
+                watermark_store = WatermarkStore(args.cache_file, None if args.full_every_days is None
+                                                 else args.full_every_days * 86400, args.full)
+            options = CheckOptions(args.fuse, args.batch_fk, args.mapjoin_rows,
+                                   args.watermark_column if args.incremental else None, args.sample_size,
+                                   args.prescreen, args.prescreen_tolerance, args.job_timeout or None, args.retries,
+                                   args.retry_backoff, tracer.enabled)
+            if args.plan:
+                print('*'*50)
+                print('\033[5m planning {0} tables... \033[0m'.format(len(dict_constraint_definition)))
+                print('*'*50)
+                with tracer.span('plan', 'main'):
+                    plan(dict_constraint_definition, param_src_sys_cd, session_pool, options,
+                         args.table_concurrency, dict_table_priority, watermark_store, args.explain)
+                session_pool.close()
+                if watermark_store is not None:
+                    watermark_store.close()
+                if args.trace is not None:
+                    num_events = tracer.write(args.trace)
+                    print('{0} trace events written to {1}'.format(num_events, args.trace))
+                return
+            session_pool.close()
+            # traverse the list
+            print('*'*50)
+            print('\033[5m analyzing {0} tables... \033[0m'.format(len(dict_constraint_definition)))
+            print('*'*50)
+            if args.concurrency is not None:
+                controller = ConcurrencyController(args.concurrency, args.concurrency, args.concurrency)
+            else:
+                probe = None if args.yarn_rm_url is None else YarnQueueProbe(args.yarn_rm_url, args.yarn_queue)
+                controller = ConcurrencyController(args.min_concurrency, args.max_concurrency, probe=probe,
+                                                   dict_table_size=dict_table_size)
+            concurrency = controller.max_concurrency
+            journal = CheckpointJournal(args.cache_file)
+            # a resumed run checks less than it covers, its checkpoints are cleared by what it covers
+            dict_run_constraint_definition = dict_constraint_definition
+            if args.resume:
+                dict_constraint_definition, num_done = journal.skip_done(dict_constraint_definition,
+                                                                         param_src_sys_cd)
+                print('Resuming, {0} constraints checked by the last run are skipped.'.format(num_done))
+            else:
+                journal.clear(dict_run_constraint_definition, param_src_sys_cd)
+            scale_start_time = time.time()
+            with tracer.span('scale', 'main'):
+                summary = scale(dict_constraint_definition, param_src_sys_cd, concurrency, executor_config, options,
+                                args.table_concurrency, dict_table_priority, controller, watermark_store, journal,
+                                False if args.no_progress else None, tracer)
+            if summary.failure == 0 and not summary.cancelled:
+                journal.clear(dict_run_constraint_definition, param_src_sys_cd)
+            else:
+                print('Run again with --resume to check only the constraints left.')
+            journal.close()
+            if watermark_store is not None:
+                watermark_store.close()
+            print('{0} of {1} jobs succeeded, {2} failed{3}.'.format(summary.success, summary.todo, summary.failure,
+                                                                     ', cancelled' if summary.cancelled else ''))
+            if args.results_file is not None:
+                with tracer.span('write_results', 'main'):
+                    num_violations = LocalResultSink(args.results_file).write(summary, param_src_sys_cd)
+                print('{0} issue rows written to {1}'.format(num_violations, args.results_file))
+            if args.save_results:
+                print('*'*50)
+                print('\033[5m Inserting constraint values into Hive ... \033[0m')
+                print('*'*50)
+                session_pool = SessionPool(executor_config, tracer=tracer)
+                with tracer.span('save_results', 'main'):
+                    num_violations = HiveResultSink(session_pool, args.results_table,
+                                                    args.staging_format).write(summary, param_src_sys_cd)
+                session_pool.close()
+                print('{0} issue rows loaded into {1}'.format(num_violations, args.results_table))
+            if args.metrics is not None:
+                write_metrics(args.metrics, summary, controller, time.time() - scale_start_time)
+                print('Metrics written to {0}'.format(args.metrics))
+            if args.trace is not None:
+                num_events = tracer.write(args.trace)
+                print('{0} trace events written to {1}'.format(num_events, args.trace))
+            run_time = (datetime.datetime.now()-start_time).seconds
+            hour = run_time // 3600
+            minute = (run_time - hour * 3600) // 60
+            second = run_time % 60
+            print('{0} hours {1} minutes {2} seconds spent on the constraint checking.'.format(hour, minute, second))
+    except KeyboardInterrupt:
+        print('Error: KeyboardInterrupt, user pressed Ctrl+C!')
 
 if __name__ == '__main__':
     main()
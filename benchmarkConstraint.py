@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+    Benchmark of analyzeConstraint.py on synthetic tables with known constraint violations, run by the local backend
+    e.g. python benchmarkConstraint.py --rows 10000,100000 --label my-change -- --fuse --batch-fk
+"""
+
+import argparse
+import os
+import collections
+import csv
+import datetime
+import json
+import random
+import subprocess
+import sys
+import time
+
+SCHEMA_NAME = 'BENCH'
+DIM_TABLE_NAME = 'DIM'
+# constraints of every fact table, the same format as the lines built from radar.constraint_columns
+FACT_CONSTRAINTS = (('p', 'PK_{0}', None, 'ID', None),
+                    ('u', 'UK_{0}', None, 'CODE', None),
+                    ('n', 'NN_{0}', None, 'NAME', None),
+                    ('f', 'FK_{0}_DIM', DIM_TABLE_NAME, 'DIM_ID', 'ID'))
+
+
+def parse_args():
+    """
+    This function is to parse the benchmark arguments, the arguments after -- are passed to analyzeConstraint.py
+    :return: argparse.Namespace, analyze_args holds the arguments passed on
+    """
+    argv = sys.argv[1:]
+    analyze_args = []
+    if '--' in argv:
+        analyze_args = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', help='comma separated row counts, a fact table is generated for each',
+                        required=False, type=str, default='10000,100000')
+    parser.add_argument('--key-cardinality', help='rows of the dimension table the FK points at', required=False,
+                        type=int, default=1000)
+    parser.add_argument('--duplicate-rate', help='share of fact rows repeating the PK/UK of another row',
+                        required=False, type=float, default=0.01)
+    parser.add_argument('--null-rate', help='share of fact rows with a NULL in the NOT NULL column', required=False,
+                        type=float, default=0.01)
+    parser.add_argument('--orphan-rate', help='share of fact rows whose FK is not in the dimension table',
+                        required=False, type=float, default=0.01)
+    parser.add_argument('--seed', help='random seed, the same seed generates the same data', required=False,
+                        type=int, default=42)
+    parser.add_argument('--src-sys-cd', help='source system code of the generated rows', required=False, type=str,
+                        default='BENCH')
+    parser.add_argument('--data-dir', help='directory the tables are generated in', required=False, type=str,
+                        default='benchmark_data')
+    parser.add_argument('--output', help='JSON lines file every benchmark run is appended to', required=False,
+                        type=str, default='benchmark_results.jsonl')
+    parser.add_argument('--label', help='name of the version benchmarked, the git commit by default',
+                        required=False, type=str, default=None)
+    parser.add_argument('-c', '--concurrency', help='jobs in parallel', required=False, type=int, default=2)
+    args = parser.parse_args(argv)
+    args.list_rows = [int(rows) for rows in args.rows.split(',')]
+    args.analyze_args = analyze_args
+    args.data_dir = os.path.abspath(args.data_dir)
+    args.output = os.path.abspath(args.output)
+    if args.label is None:
+        args.label = get_git_commit()
+    return args
+
+
+def get_git_commit():
+    """
+    This function is to get the commit the benchmark runs on
+    :return: short commit hash, 'unknown' outside of git
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], universal_newlines=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def write_csv(path, list_column, rows):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(list_column)
+        writer.writerows(rows)
+
+
+def generate_dataset(args):
+    """
+    This function is to generate a dimension table, a fact table per row count and their constraint definitions.
+    Violations are planted at the given rates, the counts are returned so the run can be checked against them.
+    :param args: argparse.Namespace of parse_args()
+    :return: dict of fact table name to OrderedDict of constraint name to the number of violating keys planted
+    """
+    rng = random.Random(args.seed)
+    schema_dir = os.path.join(args.data_dir, SCHEMA_NAME)
+    radar_dir = os.path.join(args.data_dir, 'radar')
+    for directory in (schema_dir, radar_dir):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    write_csv(os.path.join(schema_dir, DIM_TABLE_NAME + '.csv'), ['ID', 'SRC_SYS_CD'],
+              ([key, args.src_sys_cd] for key in range(1, args.key_cardinality + 1)))
+    list_definition = [[SCHEMA_NAME, DIM_TABLE_NAME, 'p', 'PK_' + DIM_TABLE_NAME, '', 'ID', '']]
+    dict_expected = collections.OrderedDict()
+    for num_rows in args.list_rows:
+        table_name = 'FACT_{0}'.format(num_rows)
+        set_duplicate = set()
+        num_null = 0
+        set_orphan = set()
+        rows = []
+        for key in range(1, num_rows + 1):
+            row_key = key
+            if key > 1 and rng.random() < args.duplicate_rate:
+                row_key = rng.randint(1, key - 1)
+                set_duplicate.add(row_key)
+            name = 'N{0}'.format(key)
+            if rng.random() < args.null_rate:
+                name = ''
+                num_null += 1
+            dim_id = rng.randint(1, args.key_cardinality)
+            if rng.random() < args.orphan_rate:
+                dim_id = args.key_cardinality + rng.randint(1, args.key_cardinality)
+                set_orphan.add(dim_id)
+            rows.append([row_key, 'C{0}'.format(row_key), name, dim_id, args.src_sys_cd])
+        write_csv(os.path.join(schema_dir, table_name + '.csv'), ['ID', 'CODE', 'NAME', 'DIM_ID', 'SRC_SYS_CD'], rows)
+        for constraint_type, constraint_name, reference_table_name, column_name, reference_column_name \
+                in FACT_CONSTRAINTS:
+            list_definition.append([SCHEMA_NAME, table_name, constraint_type, constraint_name.format(table_name),
+                                    reference_table_name or '', column_name, reference_column_name or ''])
+        dict_expected[table_name] = collections.OrderedDict([
+            ('p', len(set_duplicate)), ('u', len(set_duplicate)), ('n', 1 if num_null else 0),
+            ('f', len(set_orphan))])
+    write_csv(os.path.join(radar_dir, 'constraint_columns.csv'),
+              ['table_schema', 'table_name', 'constraint_type', 'constraint_name', 'reference_table_name',
+               'column_name', 'reference_column_name'], list_definition)
+    return dict_expected
+
+
+def get_scanned_tables(check_type):
+    """ Tables a job of the check type reads, a fused job reads the fact table once """
+    if check_type == 'f':
+        return ('fact', DIM_TABLE_NAME)
+    return ('fact',)
+
+
+def run_table(args, table_name, metrics_file, results_file, log_file):
+    """
+    This function is to run analyzeConstraint.py end to end on one fact table. The sample size is the row count, so
+    every issue row is in the results file.
+    :param args: argparse.Namespace of parse_args()
+    :param table_name: fact table name
+    :param metrics_file: file the run writes its metrics to
+    :param results_file: file the run writes its results to, replaced
+    :param log_file: file the report of the run is written to
+    :return: (wall seconds, metrics as dict)
+    """
+    if os.path.exists(results_file):
+        os.remove(results_file)
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analyzeConstraint.py'),
+               '--backend', 'local', '--local-dir', args.data_dir, '--work-dir', args.data_dir,
+               '--src-sys-cd', args.src_sys_cd, '-s', SCHEMA_NAME, '-t', '{0}.{1}'.format(SCHEMA_NAME, table_name),
+               '-c', str(args.concurrency), '--no-cache', '--cache-file', os.path.join(args.data_dir, 'cache.db'),
+               '--sample-size', table_name.split('_')[-1], '--metrics', metrics_file,
+               '--results-file', results_file] + args.analyze_args
+    start_time = time.time()
+    with open(log_file, 'w') as file:
+        subprocess.check_call(command, stdout=file, stderr=subprocess.STDOUT)
+    wall_seconds = time.time() - start_time
+    with open(metrics_file) as file:
+        return wall_seconds, json.load(file)
+
+
+def count_found_violations(results_file):
+    """
+    This function is to count the violating keys a run found, the same way generate_dataset() counts the planted ones
+    :param results_file: results file of the run
+    :return: OrderedDict of constraint type to the number of distinct violating values
+    """
+    dict_found = collections.OrderedDict((constraint[0], set()) for constraint in FACT_CONSTRAINTS)
+    with open(results_file) as file:
+        for line in file:
+            record = json.loads(line)
+            if record['record'] == 'violation':
+                dict_found.setdefault(record['constraint_type'], set()).add(record['constraint_values'])
+    return collections.OrderedDict((constraint_type, len(set_value))
+                                   for constraint_type, set_value in dict_found.items())
+
+
+def summarize_table(args, table_name, wall_seconds, metrics):
+    """
+    This function is to turn the metrics of a run into throughput per constraint type. The rows and bytes scanned
+    are estimates, the size of the extracts a job of the type reads times the jobs, not what the backend read.
+    :return: OrderedDict of check type to rows/sec, queries, estimated rows and bytes scanned, seconds
+    """
+    dict_table_rows = {'fact': int(table_name.split('_')[-1]), DIM_TABLE_NAME: args.key_cardinality}
+    dict_table_bytes = {
+        'fact': os.path.getsize(os.path.join(args.data_dir, SCHEMA_NAME, table_name + '.csv')),
+        DIM_TABLE_NAME: os.path.getsize(os.path.join(args.data_dir, SCHEMA_NAME, DIM_TABLE_NAME + '.csv'))}
+    dict_summary = collections.OrderedDict()
+    for check_type, latency in metrics['constraint_types'].items():
+        list_table = get_scanned_tables(check_type)
+        estimated_rows_scanned = latency['jobs'] * sum(dict_table_rows[table] for table in list_table)
+        seconds = latency['total']['sum']
+        dict_summary[check_type] = collections.OrderedDict([
+            ('jobs', latency['jobs']),
+            ('failure', latency['failure']),
+            ('queries', latency.get('queries')),
+            ('estimated_rows_scanned', estimated_rows_scanned),
+            ('estimated_bytes_scanned', latency['jobs'] * sum(dict_table_bytes[table] for table in list_table)),
+            ('seconds', seconds),
+            ('execute_seconds', latency['execute']['sum']),
+            ('rows_per_second', round(estimated_rows_scanned / seconds, 1) if seconds > 0 else None)])
+    return collections.OrderedDict([('wall_seconds', round(wall_seconds, 3)),
+                                    ('scale_seconds', metrics['wall_seconds']),
+                                    ('constraint_types', dict_summary)])
+
+
+def find_baseline(output, record):
+    """
+    This function is to find the last saved run of another version on the same data and arguments
+    :return: the saved record, None if there is none
+    """
+    baseline = None
+    if not os.path.exists(output):
+        return baseline
+    with open(output) as file:
+        for line in file:
+            saved = json.loads(line)
+            if saved['dataset'] == record['dataset'] and saved['analyze_args'] == record['analyze_args'] \
+                    and saved['label'] != record['label']:
+                baseline = saved
+    return baseline
+
+
+def print_comparison(record, baseline):
+    # rows/sec is the estimated rows scanned over the job seconds
+    print('{0:<14} {1:<6} {2:>14} {3:>14} {4:>8} {5:>12}'.format('table', 'type', 'est. rows/sec', 'baseline',
+                                                                'change', 'queries'))
+    for table_name, summary in record['tables'].items():
+        for check_type, current in summary['constraint_types'].items():
+            previous = None
+            if baseline is not None:
+                previous = baseline['tables'].get(table_name, {}).get('constraint_types', {}).get(check_type)
+            change = ''
+            if previous is not None and previous['rows_per_second'] and current['rows_per_second']:
+                change = '{0:+.1%}'.format(current['rows_per_second'] / previous['rows_per_second'] - 1)
+            print('{0:<14} {1:<6} {2:>14} {3:>14} {4:>8} {5:>12}'.format(
+                table_name, check_type, current['rows_per_second'],
+                '' if previous is None else previous['rows_per_second'], change, current['queries']))
+
+
+def check_violations(record):
+    """
+    This function is to compare the violations found with the ones planted, a run finding more or less is wrong
+    :param record: benchmark record with expected_violations and the found_violations of every table
+    :return: number of constraint types whose counts differ
+    """
+    num_mismatch = 0
+    print('{0:<14} {1:<6} {2:>10} {3:>10}'.format('table', 'type', 'planted', 'found'))
+    for table_name, dict_expected in record['expected_violations'].items():
+        dict_found = record['tables'][table_name]['found_violations']
+        for constraint_type, expected in dict_expected.items():
+            found = dict_found.get(constraint_type, 0)
+            if found != expected:
+                num_mismatch += 1
+            print('{0:<14} {1:<6} {2:>10} {3:>10}{4}'.format(table_name, constraint_type, expected, found,
+                                                            '' if found == expected else '  MISMATCH'))
+    return num_mismatch
+
+
+def main():
+    args = parse_args()
+    print('Generating {0} rows in {1}...'.format(args.rows, args.data_dir))
+    dict_expected = generate_dataset(args)
+    record = collections.OrderedDict([
+        ('label', args.label),
+        ('start_time', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+        ('python', sys.version.split()[0]),
+        ('analyze_args', args.analyze_args),
+        ('dataset', collections.OrderedDict([('rows', args.list_rows), ('key_cardinality', args.key_cardinality),
+                                             ('duplicate_rate', args.duplicate_rate),
+                                             ('null_rate', args.null_rate), ('orphan_rate', args.orphan_rate),
+                                             ('seed', args.seed)])),
+        ('expected_violations', dict_expected),
+        ('tables', collections.OrderedDict())])
+    for table_name in dict_expected:
+        print('Checking {0}.{1}...'.format(SCHEMA_NAME, table_name))
+        metrics_file = os.path.join(args.data_dir, table_name + '.metrics.json')
+        results_file = os.path.join(args.data_dir, table_name + '.results.jsonl')
+        log_file = os.path.join(args.data_dir, table_name + '.log')
+        wall_seconds, metrics = run_table(args, table_name, metrics_file, results_file, log_file)
+        record['tables'][table_name] = summarize_table(args, table_name, wall_seconds, metrics)
+        record['tables'][table_name]['found_violations'] = count_found_violations(results_file)
+    baseline = find_baseline(args.output, record)
+    with open(args.output, 'a') as file:
+        file.write(json.dumps(record) + '\n')
+    print_comparison(record, baseline)
+    print('Results of {0} appended to {1}{2}.'.format(
+        args.label, args.output, '' if baseline is None else ', compared to {0}'.format(baseline['label'])))
+    num_mismatch = check_violations(record)
+    if num_mismatch:
+        print('{0} constraint types found a different number of violations than planted.'.format(num_mismatch))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
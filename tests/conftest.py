@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analyzeConstraint  # noqa: E402
+
+SRC_SYS_CD = 'X'
+# ID 2 and CODE a are duplicated, NAME is NULL once, D_ID 9 and D_ID2 7 are not in D. The rows of source system Y
+# break every constraint and must never show up.
+TABLE_ROWS = (('ID', 'CODE', 'NAME', 'D_ID', 'D_ID2', 'UPD_TS', 'SRC_SYS_CD'),
+              ('1', 'a', 'n1', '1', '1', '2024-01-01', 'X'),
+              ('2', 'a', 'n2', '9', '2', '2024-01-01', 'X'),
+              ('2', 'b', '', '1', '7', '2024-01-02', 'X'),
+              ('3', 'c', 'n3', '2', '1', '2024-01-03', 'X'),
+              ('3', 'c', '', '8', '8', '2024-01-01', 'Y'))
+REFERENCE_ROWS = (('ID', 'SRC_SYS_CD'),
+                  ('1', 'X'),
+                  ('2', 'X'),
+                  ('9', 'Y'))
+CONSTRAINT_COLUMNS = (('table_schema', 'table_name', 'constraint_type', 'constraint_name', 'reference_table_name',
+                       'column_name', 'reference_column_name'),
+                      ('S', 'T', 'p', 'PK_T', '', 'ID', ''),
+                      ('S', 'T', 'u', 'UK_T', '', 'CODE', ''),
+                      ('S', 'T', 'n', 'NN_T', '', 'NAME', ''),
+                      ('S', 'T', 'f', 'FK_T_D', 'D', 'D_ID', 'ID'),
+                      ('S', 'T', 'f', 'FK_T_D2', 'D', 'D_ID2', 'ID'),
+                      ('S', 'D', 'p', 'PK_D', '', 'ID', ''))
+
+
+PK_T = analyzeConstraint.Constraint('p', 'PK_T', 'NULL', 'ID', 'NULL')
+UK_T = analyzeConstraint.Constraint('u', 'UK_T', 'NULL', 'CODE', 'NULL')
+NN_T = analyzeConstraint.Constraint('n', 'NN_T', 'NULL', 'NAME', 'NULL')
+FK_T_D = analyzeConstraint.Constraint('f', 'FK_T_D', 'D', 'D_ID', 'ID')
+FK_T_D2 = analyzeConstraint.Constraint('f', 'FK_T_D2', 'D', 'D_ID2', 'ID')
+# the issue values of every constraint of T, as Violation.constraint_values
+ISSUES = {'PK_T': {'(2)'}, 'UK_T': {'(a)'}, 'NN_T': {'(NULL)'}, 'FK_T_D': {'(9)'}, 'FK_T_D2': {'(7)'}}
+
+
+def group_violations(list_violation):
+    """ Constraint name to the set of issue values, empty for a clean record """
+    dict_issue = {}
+    for violation in list_violation:
+        set_value = dict_issue.setdefault(violation.constraint_name, set())
+        if violation.constraint_values is not None:
+            set_value.add(violation.constraint_values)
+    return dict_issue
+
+
+def check_single(executor, constraint, watermark_range=None):
+    """ Issue values analyze() finds for one constraint of T, None if it keeps no record """
+    list_violation = []
+    analyzeConstraint.analyze('S', 'T', SRC_SYS_CD, constraint.constraint_type, constraint.constraint_name,
+                              constraint.reference_table_name, constraint.reference_keys,
+                              constraint.reference_column_name, executor, watermark_range=watermark_range,
+                              list_violation=list_violation)
+    return group_violations(list_violation).get(constraint.constraint_name)
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as file:
+        csv.writer(file).writerows(rows)
+
+
+@pytest.fixture(autouse=True)
+def sqlite_only(monkeypatch):
+    """ Make LocalExecutor fall back to sqlite3 even where duckdb is installed """
+    monkeypatch.setitem(sys.modules, 'duckdb', None)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for directory in ('S', 'radar'):
+        os.makedirs(str(tmp_path / directory))
+    write_csv(str(tmp_path / 'S' / 'T.csv'), TABLE_ROWS)
+    write_csv(str(tmp_path / 'S' / 'D.csv'), REFERENCE_ROWS)
+    write_csv(str(tmp_path / 'radar' / 'constraint_columns.csv'), CONSTRAINT_COLUMNS)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def executor_config(data_dir):
+    return analyzeConstraint.ExecutorConfig('local', None, None, None, 'default', data_dir)
+
+
+@pytest.fixture
+def executor(data_dir):
+    executor = analyzeConstraint.LocalExecutor(data_dir)
+    yield executor
+    executor.close()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import collections
+
+import analyzeConstraint
+
+DEFINITIONS = collections.OrderedDict([(('S', 'T'), ['p^PK_T^NULL^ID^NULL', 'n^NN_T^NULL^NAME^NULL']),
+                                       (('S', 'D'), ['p^PK_D^NULL^ID^NULL'])])
+
+
+def make_cache(tmp_path, ttl_seconds=3600):
+    return analyzeConstraint.ConstraintDefinitionCache(str(tmp_path / 'cache.db'), ttl_seconds)
+
+
+def test_cache_keeps_definitions(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get(('S', '*'), 100) is None
+    cache.put(('S', '*'), 100, DEFINITIONS)
+    cache.close()
+    # a new run reads the same file, the order of the tables is kept
+    cache = make_cache(tmp_path)
+    assert cache.get(('s', '*'), 100) == DEFINITIONS
+    assert list(cache.get(('S', '*'), None)) == [('S', 'T'), ('S', 'D')]
+    cache.close()
+
+
+def test_cache_expires(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, ttl_seconds=60)
+    monkeypatch.setattr(analyzeConstraint.time, 'time', lambda: 1000.0)
+    cache.put(('S', 'T'), 100, DEFINITIONS)
+    monkeypatch.setattr(analyzeConstraint.time, 'time', lambda: 1060.0)
+    assert cache.get(('S', 'T'), 100) == DEFINITIONS
+    monkeypatch.setattr(analyzeConstraint.time, 'time', lambda: 1061.0)
+    assert cache.get(('S', 'T'), 100) is None
+    cache.close()
+
+
+def test_cache_invalidated_by_source_change(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(('S', 'T'), 100, DEFINITIONS)
+    assert cache.get(('S', 'T'), 200) is None
+    cache.close()
+
+
+def test_lookup_uses_cache(executor_config, tmp_path, monkeypatch):
+    list_lookup = []
+    build_query = analyzeConstraint.build_constraint_definition_query
+    monkeypatch.setattr(analyzeConstraint, 'build_constraint_definition_query',
+                        lambda list_table_pattern: list_lookup.append(list_table_pattern) or
+                        build_query(list_table_pattern))
+    cache = make_cache(tmp_path)
+    pool = analyzeConstraint.SessionPool(executor_config)
+    dict_constraint_definition = analyzeConstraint.lookup_constraint_definition([('S', '*')], pool, cache)
+    assert analyzeConstraint.lookup_constraint_definition([('S', '*')], pool, cache) == dict_constraint_definition
+    # only the pattern missing in the cache is looked up
+    analyzeConstraint.lookup_constraint_definition([('S', '*'), ('S', 'D')], pool, cache)
+    pool.close()
+    cache.close()
+    assert sorted(dict_constraint_definition) == [('S', 'D'), ('S', 'T')]
+    assert list_lookup == [[('S', '*')], [('S', 'D')]]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import sys
+
+import analyzeConstraint
+from conftest import PK_T, SRC_SYS_CD, UK_T
+
+DICT_T = {('S', 'T'): ['p^PK_T^NULL^ID^NULL', 'u^UK_T^NULL^CODE^NULL']}
+DICT_D = {('S', 'D'): ['p^PK_D^NULL^ID^NULL']}
+
+
+def put_done(journal, param_src_sys_cd, table_name, list_constraint):
+    journal.put(param_src_sys_cd, analyzeConstraint.Job('S', table_name, param_src_sys_cd, 'single', list_constraint,
+                                                        None, None))
+
+
+def test_journal_skips_checked_constraints(tmp_path):
+    journal = analyzeConstraint.CheckpointJournal(str(tmp_path / 'cache.db'))
+    put_done(journal, SRC_SYS_CD, 'T', [PK_T])
+    dict_todo, num_done = journal.skip_done(DICT_T, SRC_SYS_CD)
+    assert (dict(dict_todo), num_done) == ({('S', 'T'): ['u^UK_T^NULL^CODE^NULL']}, 1)
+    # another source system checked nothing yet
+    assert journal.skip_done(DICT_T, 'Y') == (DICT_T, 0)
+    put_done(journal, SRC_SYS_CD, 'T', [UK_T])
+    assert journal.skip_done(DICT_T, SRC_SYS_CD)[0] == {}
+    journal.close()
+
+
+def test_journal_clears_only_the_constraints_of_the_run(tmp_path):
+    journal = analyzeConstraint.CheckpointJournal(str(tmp_path / 'cache.db'))
+    put_done(journal, SRC_SYS_CD, 'T', [PK_T])
+    put_done(journal, SRC_SYS_CD, 'D', [analyzeConstraint.Constraint('p', 'PK_D', 'NULL', 'ID', 'NULL')])
+    put_done(journal, 'Y', 'T', [PK_T])
+    # a run of S.D, e.g. started by cron next to an interrupted run of S.T
+    journal.clear(DICT_D, SRC_SYS_CD)
+    assert journal.skip_done(DICT_D, SRC_SYS_CD)[1] == 0
+    assert journal.skip_done(DICT_T, SRC_SYS_CD)[1] == 1
+    assert journal.skip_done(DICT_T, 'Y')[1] == 1
+    journal.close()
+
+
+def test_job_timeout_is_finite_by_default(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['analyzeConstraint.py', '-s', 'A', '-t', 'S.T', '--src-sys-cd', 'X'])
+    assert analyzeConstraint.parse_args().job_timeout == analyzeConstraint.DEFAULT_JOB_TIMEOUT_SECONDS > 0
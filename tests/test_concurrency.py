@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import analyzeConstraint
+
+GB = 1 << 30
+
+
+def make_result(table_name, execute_seconds, check_type='fused'):
+    return analyzeConstraint.Result(1, 'S', table_name, check_type, 1, 0, execute_seconds / 60.0, 0.0, 0.0,
+                                    execute_seconds, 0.0, None, [], 1, None, None)
+
+
+def run_jobs(controller, list_job):
+    for table_name, execute_seconds in list_job:
+        controller.observe(make_result(table_name, execute_seconds), 10)
+    return controller.current()
+
+
+def test_controller_backs_off_when_jobs_of_all_tables_slow_down():
+    dict_table_size = dict((('S', 'T{0}'.format(i)), 10 * GB) for i in range(20))
+    controller = analyzeConstraint.ConcurrencyController(1, 8, dict_table_size=dict_table_size)
+    # one fused job per table, each slower than the last, up to 20 times the first
+    assert run_jobs(controller, [('T{0}'.format(i), 60 * (1 + i)) for i in range(20)]) == 1
+    assert controller.latency_ratio > controller.SLOW_RATIO
+
+
+def test_controller_compares_tables_by_size():
+    dict_table_size = {('S', 'BIG'): 100 * GB, ('S', 'SMALL'): 0}
+    controller = analyzeConstraint.ConcurrencyController(1, 8, dict_table_size=dict_table_size)
+    # the big table takes 50 times longer for 50 times the bytes (overhead included), it is not contention
+    assert run_jobs(controller, [('SMALL', 20), ('BIG', 20 * 101), ('SMALL', 20), ('BIG', 20 * 101)]) > 3
+    assert controller.latency_ratio < controller.FAST_RATIO
+
+
+def test_controller_holds_without_signal():
+    controller = analyzeConstraint.ConcurrencyController(1, 8)
+    # tables of unknown size with a job each give no latency to compare
+    assert run_jobs(controller, [('T{0}'.format(i), 60 * (1 + i)) for i in range(20)]) == 3
+    assert controller.latency_ratio is None
+
+
+def test_controller_uses_queue_probe():
+    controller = analyzeConstraint.ConcurrencyController(1, 8, probe=lambda: 0.95, probe_interval=0)
+    assert run_jobs(controller, [('T', 60)]) == 2
+    controller = analyzeConstraint.ConcurrencyController(1, 8, probe=lambda: 0.1, probe_interval=0)
+    assert run_jobs(controller, [('T', 60)]) == 4
+
+
+def test_fixed_concurrency():
+    controller = analyzeConstraint.ConcurrencyController(3, 3, 3, probe=lambda: 0.95, probe_interval=0)
+    assert run_jobs(controller, [('T', 60), ('T', 600)]) == 3
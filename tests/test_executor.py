@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+import analyzeConstraint
+
+
+def test_session_pool_reuses_released_session(executor_config):
+    pool = analyzeConstraint.SessionPool(executor_config)
+    executor = pool.acquire()
+    assert isinstance(executor, analyzeConstraint.LocalExecutor)
+    pool.release(executor)
+    assert pool.acquire() is executor
+    pool.release(executor)
+    pool.close()
+    assert pool.created == 0
+
+
+def test_session_pool_replaces_broken_session(executor_config):
+    pool = analyzeConstraint.SessionPool(executor_config)
+    with pytest.raises(RuntimeError):
+        with pool.session() as executor:
+            raise RuntimeError('query failed')
+    assert pool.created == 0
+    assert pool.idle == []
+    with pool.session() as new_executor:
+        assert new_executor is not executor
+        assert new_executor.execute('select 1') == '1\n'
+    pool.close()
+
+
+def test_session_pool_waits_for_a_free_session(executor_config):
+    pool = analyzeConstraint.SessionPool(executor_config, size=1)
+    executor = pool.acquire()
+    list_acquired = []
+    thread = threading.Thread(target=lambda: list_acquired.append(pool.acquire()))
+    thread.start()
+    thread.join(0.2)
+    assert list_acquired == []
+    pool.release(executor)
+    thread.join(5)
+    assert list_acquired == [executor]
+    pool.release(executor)
+    pool.close()
+
+
+def test_split_statements_keeps_quoted_semicolons():
+    assert analyzeConstraint.split_statements("set a=1;\nselect ';' from t where c=\"x;y\"; ;") == \
+        ['set a=1', "select ';' from t where c=\"x;y\""]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import analyzeConstraint
+from conftest import FK_T_D, FK_T_D2, ISSUES, SRC_SYS_CD, group_violations
+
+
+class DescribeExecutor(object):
+    """ Column types of S.T and S.D, D_ID is a decimal pointing at an int """
+
+    def execute(self, query):
+        if query == 'describe S.T':
+            return 'id\tint\t\nd_id\tdecimal(10,2)\t\nd_id2\tint\t\n\n# Partition Information\nsrc_sys_cd\tstring\t\n'
+        return 'id\tint\t\nsrc_sys_cd\tstring\t\n'
+
+
+def test_fk_batch_check(executor):
+    list_violation = []
+    analyzeConstraint.analyze_fk_batch('S', 'T', SRC_SYS_CD, [FK_T_D, FK_T_D2], executor,
+                                       list_violation=list_violation)
+    assert group_violations(list_violation) == dict((name, ISSUES[name]) for name in ('FK_T_D', 'FK_T_D2'))
+    # a describe of each table and the batch query
+    assert executor.num_queries == 3
+
+
+def test_fk_batch_query_turns_on_mapjoin_hint():
+    query = analyzeConstraint.build_fk_batch_query('S', 'T', SRC_SYS_CD, [FK_T_D, FK_T_D2], mapjoin=True)
+    list_statement = analyzeConstraint.split_statements(query)
+    assert list_statement[0] == 'set hive.ignore.mapjoin.hint=false'
+    assert '/*+ MAPJOIN(R) */' in list_statement[1]
+    query = analyzeConstraint.build_fk_batch_query('S', 'T', SRC_SYS_CD, [FK_T_D, FK_T_D2])
+    assert len(analyzeConstraint.split_statements(query)) == 1
+
+
+def test_fk_batch_checks_mistyped_keys_alone():
+    assert analyzeConstraint.split_fk_batch(DescribeExecutor(), 'S', 'T', [FK_T_D, FK_T_D2]) == \
+        ([FK_T_D2], [FK_T_D])
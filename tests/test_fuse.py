@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+import analyzeConstraint
+from conftest import ISSUES, NN_T, PK_T, SRC_SYS_CD, UK_T, group_violations
+
+
+def test_fused_check(executor):
+    list_violation = []
+    analyzeConstraint.analyze_fused('S', 'T', SRC_SYS_CD, [PK_T, UK_T, NN_T], executor,
+                                    list_violation=list_violation)
+    assert group_violations(list_violation) == dict((name, ISSUES[name]) for name in ('PK_T', 'UK_T', 'NN_T'))
+    assert executor.num_queries == 1
+
+
+def test_fused_query_sets_cte_materialization():
+    query = analyzeConstraint.build_fused_query('S', 'T', SRC_SYS_CD, [PK_T, NN_T])
+    assert analyzeConstraint.split_statements(query)[0] == 'set hive.optimize.cte.materialize.threshold=1'
+
+
+def test_fused_jobs(executor):
+    scheduler = analyzeConstraint.JobScheduler(10)
+    list_definition = ['p^PK_T^NULL^ID^NULL', 'n^NN_T^NULL^NAME^NULL', 'f^FK_T_D^D^D_ID^ID']
+    options = analyzeConstraint.DEFAULT_CHECK_OPTIONS._replace(fuse=True)
+    assert analyzeConstraint.add_jobs('S', 'T', SRC_SYS_CD, list_definition, scheduler, options) == 2
+    job, _ = scheduler.get()
+    assert job.mode == 'fused'
+    assert [constraint.constraint_name for constraint in job.constraints] == ['PK_T', 'NN_T']
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+import pytest
+
+import analyzeConstraint
+from conftest import FK_T_D, FK_T_D2, ISSUES, NN_T, PK_T, SRC_SYS_CD, UK_T, check_single, group_violations
+
+# the rows loaded after 2024-01-01 up to 2024-01-03
+WATERMARK_RANGE = ('UPD_TS', '2024-01-01', '2024-01-03')
+# a new row duplicates the old ID 2, the duplicated CODE and D_ID 9 are in old rows only. A constraint with no new
+# issue has no record, the old issues are still there.
+NEW_ISSUES = {'PK_T': {'(2)'}, 'NN_T': {'(NULL)'}, 'FK_T_D2': {'(7)'}}
+
+
+@pytest.mark.parametrize('constraint', [PK_T, UK_T, NN_T, FK_T_D, FK_T_D2])
+def test_single_check_incremental(executor, constraint):
+    assert check_single(executor, constraint, WATERMARK_RANGE) == NEW_ISSUES.get(constraint.constraint_name)
+
+
+def test_fused_check_incremental(executor, capsys):
+    list_violation = []
+    analyzeConstraint.analyze_fused('S', 'T', SRC_SYS_CD, [PK_T, UK_T, NN_T], executor,
+                                    list_violation=list_violation, watermark_range=WATERMARK_RANGE)
+    assert group_violations(list_violation) == {'PK_T': {'(2)'}, 'NN_T': {'(NULL)'}}
+    assert 'No new UK issue found!' in capsys.readouterr().out
+
+
+def test_fk_batch_check_incremental(executor):
+    list_violation = []
+    analyzeConstraint.analyze_fk_batch('S', 'T', SRC_SYS_CD, [FK_T_D, FK_T_D2], executor,
+                                       list_violation=list_violation, watermark_range=WATERMARK_RANGE)
+    assert group_violations(list_violation) == {'FK_T_D2': {'(7)'}}
+
+
+def test_watermark_range_keeps_null_watermarks():
+    predicate = analyzeConstraint.build_range_predicate(WATERMARK_RANGE)
+    assert predicate == "( UPD_TS > '2024-01-01' and UPD_TS <= '2024-01-03' or UPD_TS is null )"
+
+
+def test_scheduler_holds_jobs_until_watermark_is_read():
+    scheduler = analyzeConstraint.JobScheduler(2)
+    scheduler.put(analyzeConstraint.Job('S', 'T', SRC_SYS_CD, 'watermark', [], '2024-01-01', None))
+    scheduler.hold('S', 'T')
+    scheduler.put(analyzeConstraint.Job('S', 'T', SRC_SYS_CD, 'single', [PK_T], '2024-01-01', None))
+    assert scheduler.pending() == 2
+    job, _ = scheduler.get()
+    assert job.mode == 'watermark'
+    assert scheduler.get() == (None, None)
+    scheduler.task_done(job)
+    scheduler.release('S', 'T', lambda held: held._replace(new_watermark='2024-01-03'))
+    job, _ = scheduler.get()
+    assert (job.mode, job.new_watermark) == ('single', '2024-01-03')
+
+
+def test_watermark_store_keeps_source_systems_apart(tmp_path):
+    store = analyzeConstraint.WatermarkStore(str(tmp_path / 'cache.db'))
+    store.put('X', 'S', 'T', 'UK_T', '2024-01-05', True)
+    assert store.get_table('X', 's', 't') == {'UK_T': '2024-01-05'}
+    assert store.get_table('Y', 'S', 'T') == {}
+    store.put('Y', 'S', 'T', 'UK_T', '2024-01-01', True)
+    assert store.get_table('X', 'S', 'T') == {'UK_T': '2024-01-05'}
+    store.close()
+
+
+def test_watermark_store_full_check(tmp_path):
+    store = analyzeConstraint.WatermarkStore(str(tmp_path / 'cache.db'), full_every_seconds=3600)
+    store.put('X', 'S', 'T', 'UK_T', '2024-01-05', True)
+    store.connection.execute('update watermark set full_check_time = full_check_time - 7200')
+    # an incremental check keeps the time of the last full check
+    store.put('X', 'S', 'T', 'UK_T', '2024-01-06', False)
+    assert store.get_table('X', 'S', 'T') == {}
+    store.close()
+    store = analyzeConstraint.WatermarkStore(str(tmp_path / 'cache.db'), force_full=True)
+    assert store.get_table('X', 'S', 'T') == {}
+    store.close()
+
+
+def test_watermark_store_drops_watermarks_without_source_system(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    connection = sqlite3.connect(path)
+    connection.execute('create table watermark (table_schema text, table_name text, constraint_name text, '
+                       'watermark text, full_check_time real, primary key (table_schema, table_name, '
+                       'constraint_name))')
+    connection.execute("insert into watermark values ('S', 'T', 'UK_T', '2024-01-05', 0)")
+    connection.commit()
+    connection.close()
+    store = analyzeConstraint.WatermarkStore(path)
+    assert store.get_table('X', 'S', 'T') == {}
+    store.close()
+
+
+def test_scale_incremental_per_source_system(executor_config, tmp_path):
+    pool = analyzeConstraint.SessionPool(executor_config)
+    dict_constraint_definition = analyzeConstraint.lookup_constraint_definition([('S', 'T')], pool)
+    pool.close()
+    options = analyzeConstraint.DEFAULT_CHECK_OPTIONS._replace(watermark_column='UPD_TS')
+    store = analyzeConstraint.WatermarkStore(str(tmp_path / 'cache.db'))
+
+    def run(param_src_sys_cd):
+        summary = analyzeConstraint.scale(dict_constraint_definition, param_src_sys_cd, 2, executor_config, options,
+                                          watermark_store=store, progress=False)
+        assert summary.failure == 0
+        return group_violations([violation for result in summary.results for violation in result.violations])
+
+    assert run('X') == ISSUES
+    assert set(store.get_table('X', 'S', 'T').values()) == {'2024-01-03'}
+    # the watermark of X does not hide the older rows of Y
+    assert run('Y') == {'PK_T': set(), 'UK_T': set(), 'NN_T': {'(NULL)'}, 'FK_T_D': {'(8)'}, 'FK_T_D2': {'(8)'}}
+    # nothing new for X
+    assert run('X') == {}
+    store.close()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+import analyzeConstraint
+from conftest import FK_T_D, FK_T_D2, ISSUES, NN_T, PK_T, SRC_SYS_CD, UK_T, check_single
+
+
+def test_translate_statement_skips_set():
+    assert analyzeConstraint.translate_statement('set hive.ignore.mapjoin.hint=false', 'sqlite') is None
+
+
+def test_translate_statement_sqlite():
+    statement = analyzeConstraint.translate_statement(
+        "select nvl(cast(a as string),'NULL') from s.t where a <=> b", 'sqlite')
+    assert statement == "select coalesce(cast(a as text),'NULL') from s.t where a  is  b"
+
+
+def test_translate_statement_rewrites_stack_and_semi_join():
+    statement = analyzeConstraint.translate_statement(
+        "select * from ( select stack(2, 'A', a, 'B', b) as (n, v) from s.t where x=1 )K", 'sqlite')
+    assert 'stack(' not in statement
+    assert statement.count('union all') == 1
+    statement = analyzeConstraint.translate_statement(
+        "select o.a from s.t o left semi join ( select a from s.t )n on ( o.a <=> n.a ) where o.x=1", 'sqlite')
+    assert 'semi join' not in statement
+    assert 'exists' in statement
+
+
+def test_local_executor_reads_constraint_definitions(executor_config):
+    pool = analyzeConstraint.SessionPool(executor_config)
+    dict_constraint_definition = analyzeConstraint.lookup_constraint_definition([('S', '*')], pool)
+    pool.close()
+    assert sorted(dict_constraint_definition.keys()) == [('S', 'D'), ('S', 'T')]
+    assert len(dict_constraint_definition[('S', 'T')]) == 5
+
+
+@pytest.mark.parametrize('constraint', [PK_T, UK_T, NN_T, FK_T_D, FK_T_D2])
+def test_single_check(executor, constraint):
+    assert check_single(executor, constraint) == ISSUES[constraint.constraint_name]
+
+
+def test_single_check_skips_self_reference():
+    constraint = analyzeConstraint.Constraint('f', 'FK_T_T', 'T', 'ID', 'ID')
+    assert analyzeConstraint.build_check_query('S', 'T', SRC_SYS_CD, constraint) is None
+
+
+def test_main_stops_without_source_system(data_dir, monkeypatch, capsys):
+    env_file = os.path.join(data_dir, 'env.ini')
+    with open(env_file, 'w') as file:
+        file.write('[OTHER]\nParam_SRC_SYS_CD=X\n')
+    monkeypatch.chdir(data_dir)
+    monkeypatch.setattr(sys, 'argv', ['analyzeConstraint.py', '--backend', 'local', '--local-dir', data_dir,
+                                      '--work-dir', data_dir, '-s', 'MISSING', '-t', 'S.T', '--env-file', env_file,
+                                      '--no-cache', '--no-progress'])
+    with pytest.raises(SystemExit) as exc_info:
+        analyzeConstraint.main()
+    assert exc_info.value.code == 1
+    output = capsys.readouterr().out
+    assert "Error: no section: 'MISSING'" in output
+    assert 'jobs succeeded' not in output
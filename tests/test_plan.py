@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+
+import analyzeConstraint
+from conftest import FK_T_D, FK_T_D2, NN_T, PK_T, SRC_SYS_CD
+
+# T is partitioned by SRC_SYS_CD and UPD_TS, D by SRC_SYS_CD, the partitions of Y must never be counted
+PARTITIONS = {'S.T': {'src_sys_cd=X/upd_ts=2024-01-01': 100, 'src_sys_cd=X/upd_ts=2024-01-02': 20,
+                      'src_sys_cd=X/upd_ts=__HIVE_DEFAULT_PARTITION__': 3, 'src_sys_cd=Y/upd_ts=2024-01-02': 1000},
+              'S.D': {'src_sys_cd=X': 7, 'src_sys_cd=Y': 5000}}
+
+
+class MetastoreExecutor(object):
+    """ Metastore of S.T and S.D, D_ID is a decimal pointing at an int """
+
+    def __init__(self):
+        self.list_query = []
+
+    @contextlib.contextmanager
+    def session(self):
+        yield self
+
+    def execute(self, query):
+        self.list_query.append(query)
+        if query == 'describe S.T':
+            return 'id\tint\t\nd_id\tdecimal(10,2)\t\nd_id2\tint\t\n'
+        if query == 'describe S.D':
+            return 'id\tint\t\n'
+        if query.startswith('show partitions '):
+            return '\n'.join(PARTITIONS[query.split()[-1]])
+        if query.startswith('describe formatted '):
+            table = query.split()[2]
+            spec = query.split('partition(')[1].rstrip(')').replace("'", '').replace(', ', '/')
+            return 'Partition Parameters:\t\t\n\ttotalSize           \t{0}\n'.format(PARTITIONS[table][spec])
+        return ''
+
+    def execute_each(self, list_statement):
+        return analyzeConstraint.execute_each(self, list_statement)
+
+
+def make_job(mode, constraints, watermark=None):
+    return analyzeConstraint.Job('S', 'T', SRC_SYS_CD, mode, constraints, watermark, None)
+
+
+def test_plan_prints_fk_batch_as_run(capsys):
+    options = analyzeConstraint.DEFAULT_CHECK_OPTIONS._replace(batch_fk=True)
+    dict_constraint_definition = {('S', 'T'): ['f^FK_T_D^D^D_ID^ID', 'f^FK_T_D2^D^D_ID2^ID']}
+    list_plan = analyzeConstraint.plan(dict_constraint_definition, SRC_SYS_CD, MetastoreExecutor(), options)
+    assert len(list_plan) == 1
+    job, list_query, scan_bytes = list_plan[0]
+    assert job.mode == 'fk_batch'
+    # the decimal FK is checked on its own first, the batch holds only the other one
+    assert list_query == [analyzeConstraint.build_check_query('S', 'T', SRC_SYS_CD, FK_T_D, None, 10),
+                          analyzeConstraint.build_fk_batch_query('S', 'T', SRC_SYS_CD, [FK_T_D2], False, 10)]
+    assert capsys.readouterr().out.count('SQL:') == 2
+    assert scan_bytes == 100 + 20 + 3 + 7
+
+
+def test_estimate_counts_source_system_partitions():
+    dict_scan_bytes = analyzeConstraint.estimate_scan_bytes(MetastoreExecutor(), make_job('single', [PK_T]))
+    assert dict_scan_bytes == {'S.T': 123}
+
+
+def test_estimate_incremental_counts_new_partitions():
+    executor = MetastoreExecutor()
+    job = make_job('fused', [NN_T, FK_T_D], '2024-01-01')
+    assert analyzeConstraint.estimate_scan_bytes(executor, job, watermark_column='UPD_TS') == \
+        {'S.T': 20 + 3, 'S.D': 7}
+    # a PK check reads every row of the new keys
+    job = make_job('fused', [PK_T, NN_T], '2024-01-01')
+    assert analyzeConstraint.estimate_scan_bytes(executor, job, watermark_column='UPD_TS') == {'S.T': 123}
+    # the watermark column is not a partition column
+    job = make_job('single', [NN_T], '2024-01-01')
+    assert analyzeConstraint.estimate_scan_bytes(executor, job, watermark_column='LOAD_TS') == {'S.T': 123}
+
+
+def test_estimate_reads_partitions_once():
+    executor = MetastoreExecutor()
+    dict_table_size = {}
+    dict_partition = {}
+    for constraint in (PK_T, NN_T):
+        analyzeConstraint.estimate_scan_bytes(executor, make_job('single', [constraint]), dict_table_size, None,
+                                              dict_partition)
+    assert sum(query.startswith('show partitions ') for query in executor.list_query) == 1
+
+
+def test_estimate_unpartitioned_table_size(executor):
+    dict_scan_bytes = analyzeConstraint.estimate_scan_bytes(executor, make_job('single', [PK_T]))
+    assert list(dict_scan_bytes) == ['S.T']
+    assert dict_scan_bytes['S.T'] > 0
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+import analyzeConstraint
+from conftest import PK_T, SRC_SYS_CD
+
+UK_T_ID_CODE = analyzeConstraint.Constraint('u', 'UK_T_ID_CODE', 'NULL', 'ID,CODE', 'NULL')
+
+
+def test_prescreen_query_scans_once():
+    query = analyzeConstraint.build_prescreen_query('S', 'T', SRC_SYS_CD, [PK_T, UK_T_ID_CODE])
+    assert query.count(' from S.T ') == 1
+    assert query.count('compute_stats(') == 2
+
+
+def test_prescreen_passes_unique_keys_only(executor):
+    # sqlite counts distinct keys exactly, one duplicate is enough to fail, whatever the tolerance
+    assert analyzeConstraint.prescreen('S', 'T', SRC_SYS_CD, [PK_T, UK_T_ID_CODE], executor, 'hll', 0.5) == \
+        {'UK_T_ID_CODE'}
+
+
+def test_prescreen_tolerates_approximate_estimates(executor):
+    executor.exact_distinct = False
+    # 4 rows and 3 distinct IDs pass with 25% tolerance only
+    assert analyzeConstraint.prescreen('S', 'T', SRC_SYS_CD, [PK_T], executor, 'hll', 0.25) == {'PK_T'}
+    assert analyzeConstraint.prescreen('S', 'T', SRC_SYS_CD, [PK_T], executor, 'hll', 0.2) == set()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import json
+
+import analyzeConstraint
+from conftest import PK_T, SRC_SYS_CD, UK_T
+
+
+def make_summary(list_violation, success=1):
+    result = analyzeConstraint.Result(1, 'S', 'T', 'fused', success, 1 - success, 0.1, 0.0, 0.0, 0.1, 0.0, None,
+                                      list_violation, 1, None, None)
+    return analyzeConstraint.Summary(1, success, 1 - success, 0.1, False, [result])
+
+
+def make_violations():
+    return [analyzeConstraint.Violation('S', 'T', 'ID', 'PK_T', 'p', 'NULL', '(2)', '2024-01-03 00:00:00'),
+            analyzeConstraint.get_clean_record('S', 'T', UK_T)]
+
+
+class RecordingPool(object):
+    """ Session pool whose executor keeps the queries and the staging file they load """
+
+    def __init__(self):
+        self.list_query = []
+        self.list_staging = []
+
+    @contextlib.contextmanager
+    def session(self):
+        yield self
+
+    def execute(self, query):
+        self.list_query.append(query)
+        path = query.split("load data local inpath '")[1].split("'")[0]
+        with open(path) as file:
+            self.list_staging.append(file.read())
+        return ''
+
+
+def test_clean_record():
+    violation = analyzeConstraint.get_clean_record('S', 'T', PK_T)
+    assert (violation.constraint_name, violation.constraint_values) == ('PK_T', None)
+    assert analyzeConstraint.count_issue_rows(make_violations()) == 1
+
+
+def test_local_result_sink_appends_violations_and_clean_checks(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    sink = analyzeConstraint.LocalResultSink(path)
+    assert sink.write(make_summary(make_violations()), SRC_SYS_CD) == 1
+    assert sink.write(make_summary(make_violations()), SRC_SYS_CD) == 1
+    with open(path) as file:
+        list_record = [json.loads(line) for line in file]
+    assert [(record['record'], record.get('constraint_name')) for record in list_record] == \
+        [('result', None), ('violation', 'PK_T'), ('clean', 'UK_T')] * 2
+    assert list_record[1]['src_sys_cd'] == SRC_SYS_CD
+    assert list_record[1]['constraint_values'] == '(2)'
+
+
+def test_hive_result_sink_appends_in_one_load(tmp_path, monkeypatch):
+    monkeypatch.chdir(str(tmp_path))
+    pool = RecordingPool()
+    assert analyzeConstraint.HiveResultSink(pool).write(make_summary(make_violations()), SRC_SYS_CD) == 1
+    assert len(pool.list_query) == 1
+    assert 'insert into table radar.constraints partition(src_sys_cd,table_name)' in pool.list_query[0]
+    assert 'insert overwrite' not in pool.list_query[0]
+    list_line = pool.list_staging[0].splitlines()
+    assert list_line[0].split('\t') == ['S', 'T', 'ID', 'PK_T', 'p', 'NULL', '(2)', '2024-01-03 00:00:00', 'X', 'T']
+    # the clean check loads as a NULL constraint_values
+    assert list_line[1].split('\t')[6] == '\\N'
+    # the staging file is removed
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_hive_result_sink_skips_failed_jobs(tmp_path, monkeypatch):
+    monkeypatch.chdir(str(tmp_path))
+    pool = RecordingPool()
+    assert analyzeConstraint.HiveResultSink(pool).write(make_summary(make_violations(), success=0), SRC_SYS_CD) == 0
+    assert pool.list_query == []
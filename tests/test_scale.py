@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import analyzeConstraint
+from conftest import ISSUES, SRC_SYS_CD, group_violations
+
+
+@pytest.mark.parametrize('fuse, batch_fk', [(False, False), (True, True)])
+def test_scale_end_to_end(executor_config, fuse, batch_fk):
+    pool = analyzeConstraint.SessionPool(executor_config)
+    dict_constraint_definition = analyzeConstraint.lookup_constraint_definition([('S', 'T')], pool)
+    pool.close()
+    assert list(dict_constraint_definition.keys()) == [('S', 'T')]
+    options = analyzeConstraint.DEFAULT_CHECK_OPTIONS._replace(fuse=fuse, batch_fk=batch_fk)
+    summary = analyzeConstraint.scale(dict_constraint_definition, SRC_SYS_CD, 2, executor_config, options,
+                                      progress=False)
+    assert summary.failure == 0
+    assert summary.success == summary.todo == (2 if fuse else 5)
+    assert not summary.cancelled
+    assert len(summary.results) == summary.todo
+    list_violation = [violation for result in summary.results for violation in result.violations]
+    assert group_violations(list_violation) == ISSUES
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import analyzeConstraint
+from conftest import SRC_SYS_CD
+
+
+def make_job(table_name, constraint_name):
+    constraint = analyzeConstraint.Constraint('p', constraint_name, 'NULL', 'ID', 'NULL')
+    return analyzeConstraint.Job('S', table_name, SRC_SYS_CD, 'single', [constraint], None, None)
+
+
+def test_scheduler_runs_largest_table_first():
+    scheduler = analyzeConstraint.JobScheduler(2, {('S', 'BIG'): 100, ('S', 'SMALL'): 1})
+    scheduler.put(make_job('SMALL', 'PK_SMALL'))
+    scheduler.put(make_job('BIG', 'PK_BIG'))
+    assert scheduler.get()[0].table_name == 'BIG'
+    assert scheduler.get()[0].table_name == 'SMALL'
+    assert scheduler.get() == (None, None)
+
+
+def test_scheduler_caps_jobs_per_table():
+    scheduler = analyzeConstraint.JobScheduler(1, {('S', 'BIG'): 100})
+    for i in range(2):
+        scheduler.put(make_job('BIG', 'PK_BIG{0}'.format(i)))
+    scheduler.put(make_job('SMALL', 'PK_SMALL'))
+    first, _ = scheduler.get()
+    assert first.constraints[0].constraint_name == 'PK_BIG0'
+    # the second job of BIG waits for the first, SMALL goes ahead of it
+    assert scheduler.get()[0].table_name == 'SMALL'
+    assert scheduler.get() == (None, None)
+    assert scheduler.pending() == 1
+    scheduler.task_done(first)
+    assert scheduler.get()[0].constraints[0].constraint_name == 'PK_BIG1'
+    assert scheduler.pending() == 0
+
+
+FAKE_HIVE = r'''#!{python}
+import re
+import sys
+
+with open({log!r}, 'a') as log:
+    log.write('hive\n')
+script = open(sys.argv[sys.argv.index('-f') + 1]).read()
+for statement in script.split(';'):
+    statement = statement.strip()
+    match = re.match(r"select '(.*)'$", statement)
+    if match:
+        print(match.group(1))
+    elif statement == 'show tblproperties S.BIG':
+        print('numRows\t10\ntotalSize\t1000')
+    elif statement == 'show tblproperties S.PART':
+        print('numRows\t-1\ntotalSize\t-1')
+    elif statement == "show table extended in S like 'PART'":
+        print('tableName:PART\ntotalFileSize:500')
+    elif statement.startswith('show'):
+        sys.stderr.write('FAILED: SemanticException Table not found\n')
+'''
+
+
+def test_table_sizes_are_read_by_one_hive_process_per_lookup(tmp_path, monkeypatch):
+    log = str(tmp_path / 'hive.log')
+    hive = tmp_path / 'hive'
+    hive.write_text(FAKE_HIVE.format(python=sys.executable, log=log))
+    hive.chmod(0o755)
+    monkeypatch.setenv('PATH', '{0}{1}{2}'.format(tmp_path, os.pathsep, os.environ['PATH']))
+    monkeypatch.chdir(str(tmp_path))
+    list_table = [('S', 'BIG'), ('S', 'MISSING'), ('S', 'PART')]
+    dict_table_size = analyzeConstraint.get_table_sizes(analyzeConstraint.HiveCliExecutor(), list_table)
+    assert dict_table_size == {('S', 'BIG'): 1000, ('S', 'MISSING'): None, ('S', 'PART'): 500}
+    # one script for the statistics, one for the tables without
+    with open(log) as file:
+        assert file.read().count('hive') == 2
+
+
+def test_priority_is_size_by_default(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['analyzeConstraint.py', '-s', 'A', '-t', 'S.T', '--src-sys-cd', 'X'])
+    assert analyzeConstraint.parse_args().priority == 'size'
+
+
+def test_priority_by_size(executor_config):
+    pool = analyzeConstraint.SessionPool(executor_config)
+    dict_table_priority = analyzeConstraint.get_table_priority({('S', 'T'): [], ('S', 'D'): []}, 'size', pool)
+    pool.close()
+    assert dict_table_priority[('S', 'T')] > dict_table_priority[('S', 'D')] > 0
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import analyzeConstraint
+from conftest import SRC_SYS_CD
+
+
+def test_tracer_records_spans_with_context():
+    tracer = analyzeConstraint.Tracer('main')
+    tracer.context = {'table': 'S.T'}
+    with tracer.span('job', 'job', mode='single') as args:
+        args['rows'] = 3
+    metadata, span = tracer.events
+    assert (metadata['ph'], metadata['args']) == ('M', {'name': 'main'})
+    assert (span['name'], span['ph']) == ('job', 'X')
+    assert span['dur'] >= 0
+    assert span['args'] == {'table': 'S.T', 'mode': 'single', 'rows': 3}
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = analyzeConstraint.Tracer('main', enabled=False)
+    with tracer.span('job', 'job'):
+        pass
+    assert tracer.drain() == []
+
+
+def test_tracer_drain_and_write(tmp_path):
+    tracer = analyzeConstraint.Tracer()
+    tracer.add('query', 'query', 1.0, 1.5)
+    events = tracer.drain()
+    assert [event['dur'] for event in events] == [500000]
+    assert tracer.events == []
+    # the events a worker sends back are written by the tracer of the main process
+    tracer.events.extend(events)
+    path = str(tmp_path / 'trace.json')
+    assert tracer.write(path) == 1
+    with open(path) as file:
+        assert json.load(file) == {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def test_traced_executor(executor):
+    tracer = analyzeConstraint.Tracer()
+    traced = analyzeConstraint.TracedExecutor(executor, tracer)
+    query = "select ID from S.T where SRC_SYS_CD = '{0}'".format(SRC_SYS_CD)
+    assert traced.execute(query) == executor.execute(query)
+    assert len(list(traced.iter_rows(query))) == 4
+    # other attributes are the ones of the executor wrapped
+    assert traced.execute_each == executor.execute_each
+    list_args = [event['args'] for event in tracer.events]
+    assert [args['rows'] for args in list_args] == [4, 4]
+    assert {args['sql_hash'] for args in list_args} == {analyzeConstraint.get_sql_hash(query)}
+
+
+def test_scale_sends_back_trace(executor_config):
+    dict_constraint_definition = {('S', 'T'): ['p^PK_T^NULL^ID^NULL', 'n^NN_T^NULL^NAME^NULL']}
+    options = analyzeConstraint.DEFAULT_CHECK_OPTIONS._replace(trace=True)
+    tracer = analyzeConstraint.Tracer('main')
+    summary = analyzeConstraint.scale(dict_constraint_definition, SRC_SYS_CD, 2, executor_config, options,
+                                      progress=False, tracer=tracer)
+    assert summary.success == 2
+    list_query = [event for event in tracer.events if event.get('cat') == 'query']
+    assert len(list_query) >= 2
+    # every query span says which job it belongs to
+    assert {event['args']['table'] for event in list_query} == {'S.T'}
+    assert {event['args']['constraints'] for event in list_query} == {'PK_T', 'NN_T'}